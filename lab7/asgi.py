@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+The live score stream (/matches/live/, Server-Sent Events) needs an ASGI server,
+e.g. ``uvicorn lab7.asgi:application --workers 4``. With several workers set
+LIVE_BROKER = 'sports.live.FileBroker' so that score updates reach every process.
 """
 
 import os
@@ -41,20 +41,28 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым: в замер попадает все, включая кэш страниц
+    'sports.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    # Выбор базы для чтения (реплика или основная); раньше кэша страниц, чтобы POST закреплял основную базу
+    'sports.routers.ReplicaRoutingMiddleware',
+    'sports.page_cache.AnonymousPageCacheMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Последним: профилирует саму вьюху (при PROFILING_ENABLED = False исключается из цепочки)
+    'sports.profiling.SamplingProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'lab7.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени рендера (для метрик и Server-Timing)
+        'BACKEND': 'sports.metrics.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates']
         ,
         'APP_DIRS': True,
@@ -81,6 +89,79 @@ DATABASES = {
     }
 }
 
+# Режим SQLite для продакшена (SQLITE_PRODUCTION=1 в окружении):
+# WAL - читатели не ждут писателя; прагмы выполняются при каждом открытии соединения;
+# BEGIN IMMEDIATE - писатель берет блокировку в начале транзакции, а не посреди нее
+# (иначе SQLite не может подождать и сразу отвечает "database is locked");
+# соединение живет между запросами CONN_MAX_AGE секунд.
+# journal_mode=WAL сохраняется в самом файле базы, поэтому по умолчанию режим выключен.
+SQLITE_PRODUCTION = os.environ.get('SQLITE_PRODUCTION') == '1'
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',       # в WAL безопасно: при сбое питания теряется только последняя транзакция
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,      # отрицательное значение - в КиБ, т.е. 64 МиБ
+    'busy_timeout': 5000,          # мс ожидания чужой блокировки
+    'temp_store': 'MEMORY',
+}
+SQLITE_CONN_MAX_AGE = 600
+
+if SQLITE_PRODUCTION:
+    DATABASES['default'].update({
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            'transaction_mode': 'IMMEDIATE',
+        },
+        'CONN_MAX_AGE': SQLITE_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+    })
+
+# Реплика для чтения: копия файла основной базы, обновляется командой sync_replica
+# (в проде - по крону). Пока READ_REPLICAS пуст, все идет в основную базу; включается READ_REPLICAS=1.
+# В тестах реплика - зеркало тестовой основной базы (MIRROR), отдельной базы не создается.
+# CONN_MAX_AGE = 0: sync_replica подменяет файл, постоянное соединение читало бы старую копию
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'db.replica.sqlite3',
+    'CONN_MAX_AGE': 0,
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_ROUTERS = ['sports.routers.ReplicaRouter']
+READ_REPLICAS = ['replica'] if os.environ.get('READ_REPLICAS') == '1' else []
+# Страницы, которые читают с реплики (GET, без свежей записи от этого браузера)
+REPLICA_URL_NAMES = ['home', 'article_list', 'article_search', 'article_detail', 'tournament_list',
+                     'tournament_standings', 'tournament_leaders', 'sport_leaders', 'stats']
+# Как часто cron запускает manage.py sync_replica, секунд. Реплика отстает на столько (плюс время копирования),
+# поэтому после записи браузер читает из основной базы два таких периода (read-your-writes)
+REPLICA_SYNC_INTERVAL = 60
+REPLICA_PIN_SECONDS = 2 * REPLICA_SYNC_INTERVAL
+
+# Повтор записи при "database is locked" (sports.db.retry_on_lock)
+DB_LOCK_RETRIES = 3
+DB_LOCK_RETRY_DELAY = 0.05
+
+
+# Cache
+# Файловый кэш общий для всех процессов, поэтому инвалидация из одного воркера
+# видна остальным (в LocMemCache у каждого процесса своя копия)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+    }
+}
+
+# Тесты работают с LocMemCache, а не с этим каталогом (см. lab7/test_runner.py)
+TEST_RUNNER = 'lab7.test_runner.TestRunner'
+
+# Время жизни кэшированных фрагментов; инвалидация - через смену версии ключа
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Кэш целых страниц для анонимов (sports.page_cache)
+PAGE_CACHE_TIMEOUT = 60 * 10
+PAGE_CACHE_URL_NAMES = ['home', 'article_list', 'article_detail', 'tournament_list']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -131,4 +212,71 @@ MEDIA_ROOT = BASE_DIR / 'media'
 MEDIA_URL = '/media/'
 
 LOGIN_REDIRECT_URL = 'home'
-LOGOUT_REDIRECT_URL = 'home'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = 'home'
+
+# Трансляция счета (sports.live): LocalBroker - один процесс,
+# FileBroker - несколько воркеров на одной машине (общий файл событий)
+LIVE_BROKER = 'sports.live.LocalBroker'
+LIVE_EVENTS_FILE = BASE_DIR / 'live_events.jsonl'
+LIVE_KEEPALIVE_SECONDS = 15
+
+# Главная страница: матчи на ближайшие N дней, порциями по HOME_MATCHES_PER_PAGE
+HOME_MATCH_WINDOW_DAYS = 7
+HOME_MATCHES_PER_PAGE = 20
+
+# Метрики (sports.metrics): общий для всех процессов файл и период сброса в него
+METRICS_STORE = BASE_DIR / 'metrics.sqlite3'
+METRICS_FLUSH_INTERVAL = 5
+# /metrics без входа - только с заголовком Authorization: Bearer <METRICS_TOKEN> (bearer_token в
+# scrape_config Prometheus). По адресу не пускаем: за локальным прокси все запросы приходят с 127.0.0.1
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Выборочное профилирование (sports.profiling). Доли запросов по имени URL, '*' - остальные.
+# Запрос с заголовком X-Profile: <PROFILING_TOKEN> профилируется всегда.
+PROFILING_ENABLED = False
+PROFILING_SAMPLE_RATES = {'*': 0.0, 'home': 0.01, 'article_detail': 0.01}
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN', '')
+PROFILING_DIR = BASE_DIR / 'profiles'
+PROFILING_KEEP = 200
+
+# Выгрузки из админки (sports.exports): матчи читаются пачками по EXPORT_CHUNK_SIZE,
+# отчет до EXPORT_SPOOL_MAX_SIZE байт держится в памяти, дальше - во временном файле.
+# Выборки больше EXPORT_BACKGROUND_THRESHOLD матчей строятся в фоне в EXPORT_DIR
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_SPOOL_MAX_SIZE = 5 * 1024 * 1024
+EXPORT_BACKGROUND_THRESHOLD = 5000
+EXPORT_DIR = BASE_DIR / 'exports'
+
+# Фоновые задачи (sports.jobs, воркеры - manage.py run_workers)
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 30     # секунд перед первым повтором, дальше вдвое больше
+JOB_TIMEOUT = 60 * 60    # задача без пульса (job_progress) дольше часа считается брошенной (воркер умер)
+JOB_POLL_INTERVAL = 1    # пауза между проверками пустой очереди
+JOB_REQUEUE_INTERVAL = 60  # как часто воркеры ищут брошенные задачи
+
+# Списки админки на больших таблицах (sports.pagination.CappedCountPaginator):
+# COUNT(*) считает не больше стольких строк, дальше - оценка
+ADMIN_COUNT_CAP = 10000
+
+# Похожие новости (sports.related): вес общей связи, период полураспада свежести,
+# сколько соседей хранить на статью и сколько показывать
+RELATED_NEWS_WEIGHTS = {'match': 4, 'related_athletes': 3, 'related_teams': 2, 'tags': 1}
+RELATED_NEWS_HALF_LIFE_DAYS = 30
+RELATED_NEWS_KEEP = 20
+# Связи, которые есть у большего числа статей, в похожих новостях не учитываются
+RELATED_NEWS_MAX_SHARED = 500
+RELATED_NEWS_COUNT = 5
+
+# Журнал медленных запросов (sports.slow_queries): порог в мс, None - выключен
+SLOW_QUERY_MS = 100
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'sports.slow_queries': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
\ No newline at end of file
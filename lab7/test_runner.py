@@ -0,0 +1,28 @@
+import os
+import shutil
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+'''
+Тесты не должны трогать рабочие файлы проекта: вместо файлового кэша BASE_DIR/cache
+(его же читает запущенный сервер) - LocMemCache в памяти процесса тестов,
+вместо общего файла метрик metrics.sqlite3 - файл во временном каталоге.
+'''
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.temp_dir = tempfile.mkdtemp(prefix='lab7-tests-')
+        self.isolated_settings = override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'}},
+            METRICS_STORE=os.path.join(self.temp_dir, 'metrics.sqlite3'),
+        )
+        self.isolated_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.isolated_settings.disable()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
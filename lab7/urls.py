@@ -24,10 +24,20 @@ from django.contrib.auth import views as auth_views
 from sports import views
 urlpatterns = [
     path('', views.home, name='home'),
+    # Раньше admin/, иначе адрес перехватит админка
+    path('admin/profiles/', views.profile_list, name='profile_list'),
+    path('admin/profiles/<str:name>', views.profile_file, name='profile_file'),
+    path('admin/exports/<str:name>', views.export_file, name='export_file'),
     path('admin/', admin.site.urls),
     path('news/', views.article_list, name='article_list'),
     path('tournaments/', views.tournament_list, name='tournament_list'),
+    path('tournaments/<slug:slug>/standings/', views.tournament_standings, name='tournament_standings'),
+    path('tournaments/<slug:slug>/leaders/', views.tournament_leaders, name='tournament_leaders'),
+    path('sports/<slug:slug>/leaders/', views.sport_leaders, name='sport_leaders'),
     path('stats/', views.stats_view, name='stats'),
+    path('matches/live/', views.live_scores, name='live_scores'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('export/<slug:dataset>.<slug:fmt>', views.export_data, name='export_data'),
     path('news/<int:pk>/edit/', views.article_update, name='article_update'),
     path('news/<int:pk>/delete/', views.article_delete, name='article_delete'),
     path('register/', views.register, name='register'),
@@ -36,6 +46,7 @@ urlpatterns = [
     path('login/', auth_views.LoginView.as_view(template_name='registration/login.html'), name='login'),
     path('logout/', views.logout_user, name='logout'),
     path('news/create/', views.article_create, name='article_create'),
+    path('news/search/', views.article_search, name='article_search'),
     path('news/<slug:slug>/', views.article_detail, name='article_detail'),
 ]
 
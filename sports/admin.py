@@ -1,15 +1,16 @@
 # admin login: egbru
 # admin password: labspass
 
-import io
-
 from django.contrib import admin
 from django.http import FileResponse
-from reportlab.lib.pagesizes import A4
-# генерация pdf отчетов
-from reportlab.pdfgen import canvas
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
 
+# генерация pdf отчетов
+from . import exports, renditions
 from .models import *
+from .pagination import CappedCountPaginator
 
 # inline для админки
 class MatchParticipationInline(admin.TabularInline):
@@ -20,62 +21,116 @@ class MatchParticipationInline(admin.TabularInline):
 
 # Register your models here.
 
-def export_match_pdf(modeladmin, request, queryset):
-    response = io.BytesIO()
+# Для таблиц на миллионы строк: связанные объекты - в том же запросе (list_select_related),
+# без второго COUNT(*) по всей таблице (show_full_result_count) и с ограниченным COUNT(*)
+# для пагинатора; поиск по началу строки ('^') по индексам с COLLATE NOCASE (см. models.py)
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = CappedCountPaginator
+    show_full_result_count = False
+
 
-    p = canvas.Canvas(response, pagesize=A4)
+class ThumbnailMixin:
+    # Маленькая копия картинки (sports.renditions) вместо оригинала в несколько мегабайт
+    @admin.display(description="Image")
+    def thumbnail(self, obj):
+        return renditions.picture(obj, 'thumb', sizes='40px', style='width: 40px; height: 40px; object-fit: cover;')
 
-    y = 800
-    p.drawString(100, y, "Match Report")
-    y -= 40
 
-    for match in queryset:
-        text = f"{match.date_time.strftime('%Y-%m-%d')}: {match.home_team} vs {match.away_team} ({match.score_home}:{match.score_away})"
-        p.drawString(50, y, text)
-        y -= 20
+class TournamentListFilter(admin.RelatedFieldListFilter):
+    # Tournament.__str__ берет название вида спорта - без select_related это запрос на каждый турнир
+    def field_choices(self, field, request, model_admin):
+        tournaments = Tournament.objects.select_related('sport').order_by('sport__name', 'name')
+        return [(tournament.pk, str(tournament)) for tournament in tournaments]
 
-        if y < 50:  # Если страница кончилась
-            p.showPage()
-            y = 800
 
-    p.showPage()
-    p.save()
-    response.seek(0)
-    return FileResponse(response, as_attachment=True, filename="report.pdf")
+def export_match_pdf(modeladmin, request, queryset):
+    # Большие выборки строим в фоне, админу - ссылка на будущий файл
+    if exports.is_large(queryset):
+        name = exports.schedule_match_report(queryset)
+        url = reverse('export_file', args=[name])
+        modeladmin.message_user(request, format_html(
+            'Отчет большой и строится в фоне. Скачать, когда будет готов: <a href="{}">{}</a>', url, name))
+        return None
+    # Матчи читаются пачками, отчет копится во временном файле и отдается потоком
+    return FileResponse(exports.spooled_match_report(queryset), as_attachment=True, filename="report.pdf")
 
 
 export_match_pdf.short_description = "Download pdf report"
 
+
+def export_action(fmt, columns, filename):
+    # Выгрузка выбранных строк потоком (sports.exports), без загрузки их в память
+    def action(modeladmin, request, queryset):
+        return exports.streaming_export(queryset, columns, fmt, filename)
+
+    action.__name__ = f'export_{filename}_{fmt}'
+    action.short_description = f"Download {fmt.upper()}"
+    return action
+
 @admin.register(Match)
-class MatchAdmin(admin.ModelAdmin):
+class MatchAdmin(LargeTableAdmin):
     list_display = ('home_team', 'away_team', 'score_home', 'score_away', 'status')
-    list_filter = ('status', 'tournament')
+    list_select_related = ('home_team', 'away_team')
+    list_filter = ('status', ('tournament', TournamentListFilter))
     # Чтобы не грузить список всех команд мира в список:
     raw_id_fields = ('home_team', 'away_team', 'tournament')
     inlines = [MatchParticipationInline]
-    actions = [export_match_pdf]
+    actions = [export_match_pdf, export_action('csv', exports.MATCH_COLUMNS, 'matches'),
+               export_action('ndjson', exports.MATCH_COLUMNS, 'matches')]
+
+@admin.register(MatchParticipation)
+class MatchParticipationAdmin(LargeTableAdmin):
+    list_display = ('match', 'athlete', 'goals_scored', 'minutes_played', 'yellow_card')
+    list_filter = ('yellow_card',)
+    # __str__ матча берет имена команд - подтягиваем их тем же запросом
+    list_select_related = ('match__home_team', 'match__away_team', 'athlete')
+    search_fields = ('^athlete__last_name',)
+    raw_id_fields = ('match', 'athlete')
+    actions = [export_action('csv', exports.PARTICIPATION_COLUMNS, 'participations'),
+               export_action('ndjson', exports.PARTICIPATION_COLUMNS, 'participations')]
 
 @admin.register(Team)
-class TeamAdmin(admin.ModelAdmin):
-    list_display = ('name', 'sport', 'city')
+class TeamAdmin(ThumbnailMixin, admin.ModelAdmin):
+    list_display = ('thumbnail', 'name', 'sport', 'city')
+    list_display_links = ('name',)
     search_fields = ('name',)
 
 @admin.register(Athlete)
-class AthleteAdmin(admin.ModelAdmin):
-    list_display = ('last_name', 'first_name', 'current_team')
-    search_fields = ('last_name', 'first_name')
+class AthleteAdmin(ThumbnailMixin, LargeTableAdmin):
+    list_display = ('thumbnail', 'last_name', 'first_name', 'current_team')
+    list_display_links = ('last_name',)
+    list_select_related = ('current_team',)
+    search_fields = ('^last_name', '^first_name')
     # У игрока есть связь с командой. Команд много, поэтому используем raw_id_fields
     raw_id_fields = ('current_team',)
 
 @admin.register(Article)
-class ArticleAdmin(admin.ModelAdmin):
-    list_display = ('title', 'created_at', 'is_published')
-    search_fields = ('title',)
+class ArticleAdmin(ThumbnailMixin, LargeTableAdmin):
+    list_display = ('thumbnail', 'title', 'created_at', 'is_published')
+    list_display_links = ('title',)
+    search_fields = ('^title',)
 
     # У статьи связи ManyToMany с командами и игроками.
     # В таком случае при большом количестве игроков будет очень большой удар по производительности.
     raw_id_fields = ('match', 'related_teams', 'related_athletes', 'author')
 
-admin.site.register(Tournament)
+@admin.register(Tournament)
+class TournamentAdmin(admin.ModelAdmin):
+    list_select_related = ('sport',)
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('task', 'status', 'progress', 'message', 'attempts', 'created_at', 'finished_at', 'worker')
+    list_filter = ('status', 'task')
+    # task и kwargs только на чтение: задача - вызов функции, а в kwargs выгрузок лежит SQL условия
+    readonly_fields = ('task', 'kwargs', 'started_at', 'finished_at', 'worker', 'error')
+    actions = ['retry']
+
+    @admin.action(description="Retry selected jobs")
+    def retry(self, request, queryset):
+        # Новый круг попыток для упавших задач
+        updated = queryset.filter(status='failed').update(status='queued', attempts=0, run_after=timezone.now())
+        self.message_user(request, f'Возвращено в очередь: {updated}')
+
 admin.site.register(Sport)
 admin.site.register(Tag)
\ No newline at end of file
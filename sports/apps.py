@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class SportsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sports'
+
+    def ready(self):
+        # Подключаем обработчики сигналов (инкрементальные агрегаты)
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+
+        from . import signals, slow_queries
+
+        post_migrate.connect(signals.restore_search_triggers, sender=self)
+        # Журнал медленных запросов - обертка на каждое новое соединение
+        connection_created.connect(slow_queries.install)
@@ -0,0 +1,90 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+
+from . import metrics, routers
+from .models import Match
+
+'''
+Версионированные ключи кэша.
+У каждого пространства имен (например, "latest_news") есть номер версии, который входит в ключ
+каждого фрагмента. Инвалидация - это смена версии: старые фрагменты больше никто не читает,
+а кэш сам вытеснит их по таймауту. Перебирать и удалять ключи не нужно.
+'''
+
+FRAGMENT_TIMEOUT = getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 60 * 60 * 24)
+
+# Пространства имен фрагментов
+LATEST_NEWS = 'latest_news'
+ACTIVE_TOURNAMENTS = 'active_tournaments'
+
+# Счетчик голов хозяев по всем матчам (для главной страницы)
+TOTAL_HOME_GOALS_KEY = 'sports:counter:total_home_goals'
+# incr в общем кэше не атомарен между процессами, поэтому раз в час счетчик
+# пересчитывается агрегатом - возможное расхождение не копится
+COUNTER_TIMEOUT = 60 * 60
+
+
+def _version_key(namespace):
+    return f'sports:version:{namespace}'
+
+
+def get_version(namespace):
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        # Версия - время в наносекундах: если ключ версии вытеснят, новая не совпадет со старыми
+        cache.add(_version_key(namespace), time.time_ns(), None)
+        version = cache.get(_version_key(namespace))
+    return version
+
+
+def bump_version(*namespaces):
+    # Меняем версию только после коммита, иначе между сменой версии и коммитом
+    # другой запрос успеет положить в кэш старые данные под новой версией
+    def bump():
+        cache.set_many({_version_key(namespace): time.time_ns() for namespace in namespaces}, None)
+
+    transaction.on_commit(bump)
+
+
+def versioned_key(namespace, *parts):
+    return ':'.join(['sports', namespace, str(get_version(namespace)), *map(str, parts)])
+
+
+def get_or_render(namespace, parts, render):
+    """Возвращает фрагмент из кэша или вызывает render() и кладет результат в кэш."""
+    key = versioned_key(namespace, *parts)
+    html = cache.get(key)
+    metrics.record_cache('fragment', html is not None)
+    if html is None:
+        # Под новой версией не должен оказаться рендер с отстающей реплики
+        with routers.primary_reads():
+            html = render()
+        cache.set(key, html, FRAGMENT_TIMEOUT)
+    return html
+
+
+def get_total_home_goals():
+    total = cache.get(TOTAL_HOME_GOALS_KEY)
+    if total is None:
+        with routers.primary_reads():
+            total = Match.objects.aggregate(total=Sum('score_home'))['total'] or 0
+        cache.add(TOTAL_HOME_GOALS_KEY, total, COUNTER_TIMEOUT)
+    return total
+
+
+def add_total_home_goals(delta):
+    if not delta:
+        return
+
+    def incr():
+        try:
+            cache.incr(TOTAL_HOME_GOALS_KEY, delta)
+        except ValueError:
+            # Счетчика в кэше нет - его посчитает следующий get_total_home_goals()
+            pass
+
+    transaction.on_commit(incr)
@@ -0,0 +1,56 @@
+import functools
+import logging
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+
+'''
+Повтор записи при блокировке SQLite.
+В WAL-режиме читатели не ждут писателя, но писатель в базе всегда один. Если busy_timeout
+истек, а блокировку держит другой процесс, SQLite отвечает "database is locked" - тогда
+вся транзакция повторяется с нарастающей паузой (DB_LOCK_RETRIES попыток).
+Повторять можно только транзакцию целиком, поэтому каждая попытка - свой atomic().
+'''
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def is_lock_error(exc):
+    message = str(exc).lower()
+    return isinstance(exc, OperationalError) and ('database is locked' in message or 'database is busy' in message)
+
+
+def run_with_retry(func, *args, using=None, **kwargs):
+    """Выполняет func в транзакции, повторяя ее при блокировке базы."""
+    # Внутри чужой транзакции повтор ничего не даст - откатится только наша часть
+    if transaction.get_connection(using).in_atomic_block:
+        return func(*args, **kwargs)
+
+    attempts = getattr(settings, 'DB_LOCK_RETRIES', 3)
+    delay = getattr(settings, 'DB_LOCK_RETRY_DELAY', 0.05)
+    for attempt in range(1, attempts + 1):
+        try:
+            with transaction.atomic(using=using):
+                return func(*args, **kwargs)
+        except OperationalError as exc:
+            if not is_lock_error(exc) or attempt == attempts:
+                raise
+            logger.warning('База занята, попытка %d из %d: %s', attempt, attempts, exc)
+            time.sleep(delay * 2 ** (attempt - 1))
+
+
+def retry_on_lock(view):
+    """
+    Декоратор для вьюх, которые пишут в базу. GET-запросы идут как есть,
+    остальные - в транзакции с повтором при блокировке.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method in SAFE_METHODS or connection.vendor != 'sqlite':
+            return view(request, *args, **kwargs)
+        return run_with_retry(view, request, *args, **kwargs)
+
+    return wrapper
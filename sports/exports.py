@@ -0,0 +1,314 @@
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.http import StreamingHttpResponse
+from reportlab.lib.pagesizes import A4
+
+from .jobs import enqueue, job_progress, on_failure
+from .models import Match
+
+'''
+Выгрузки из админки.
+PDF-отчет по матчам строится потоково: матчи читаются пачками по EXPORT_CHUNK_SIZE вместе
+с командами (select_related, один запрос на пачку), а каждая страница пишется в файл сразу
+после заполнения (PdfPageWriter). Canvas из reportlab так не умеет - он держит в памяти все
+страницы до save(). Файл - SpooledTemporaryFile: пока отчет меньше EXPORT_SPOOL_MAX_SIZE,
+он в памяти, дальше - во временном файле на диске.
+Выборки больше EXPORT_BACKGROUND_THRESHOLD матчей строятся фоновой задачей (sports.jobs)
+в файл EXPORT_DIR, а админ получает ссылку, по которой отчет можно скачать, когда он готов.
+Пока отчет строится, рядом лежит name.part, если задача провалилась - name.failed с ошибкой.
+
+CSV/NDJSON-выгрузки матчей и статистики игроков идут через StreamingHttpResponse: строки
+читаются values_list().iterator() пачками по EXPORT_CHUNK_SIZE (имена турниров, команд и игроков -
+JOIN в том же запросе), и каждая пачка сразу уходит клиенту. Память не зависит от размера выборки.
+'''
+
+# Имя готового отчета: время-случайный_хвост.pdf
+FILE_RE = re.compile(r'^match-report-\d+-[0-9a-f]{12}\.pdf$')
+PENDING_SUFFIX = '.part'
+FAILED_SUFFIX = '.failed'
+MATCH_REPORT_FIELDS = ('date_time', 'score_home', 'score_away', 'home_team__name', 'away_team__name')
+
+
+def chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+def exports_dir():
+    return str(getattr(settings, 'EXPORT_DIR', settings.BASE_DIR / 'exports'))
+
+
+def match_report_rows(queryset):
+    """Матчи для отчета: только нужные поля, команды в том же запросе, чтение пачками."""
+    queryset = queryset.select_related('home_team', 'away_team').only(*MATCH_REPORT_FIELDS)
+    return queryset.order_by('date_time', 'pk').iterator(chunk_size=chunk_size())
+
+
+def match_report_rows_keyset(job, queryset):
+    """
+    То же для фоновой задачи: пачки по ключу (date_time, pk) после последней строки предыдущей пачки -
+    без OFFSET и без списка всех id в памяти. Каждая пачка - один запрос и отметка прогресса.
+    """
+    total = queryset.count()
+    queryset = queryset.select_related('home_team', 'away_team').only(*MATCH_REPORT_FIELDS).order_by('date_time', 'pk')
+    done, last = 0, None
+    while True:
+        chunk = queryset
+        if last is not None:
+            chunk = chunk.filter(Q(date_time__gt=last.date_time) | Q(date_time=last.date_time, pk__gt=last.pk))
+        chunk = list(chunk[:chunk_size()])
+        if not chunk:
+            break
+        yield from chunk
+        done, last = done + len(chunk), chunk[-1]
+        job_progress(job, done, total, f'Матчей: {done} из {total}')
+
+
+def saved_filter(queryset):
+    """
+    Выборку целиком в JSON задачи не сохранить, а список id огромной выборки - тем более.
+    Сохраняем условие: SQL подзапроса id с параметрами (значения уже приведены к виду для БД).
+    """
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    return [sql, [param if isinstance(param, (str, int, float, bool, type(None))) else str(param) for param in params]]
+
+
+def restore_filter(where):
+    sql, params = where
+    return Match.objects.filter(pk__in=RawSQL(sql, params))
+
+
+class PdfPageWriter:
+    """
+    Минимальный PDF из строк текста (Helvetica 12), страница уходит в файл на show_page().
+    В памяти остаются только смещения объектов для таблицы xref - по паре чисел на страницу.
+    Объекты 1-3 (каталог, дерево страниц, шрифт) пишутся в конце, когда известны все страницы.
+    """
+
+    CATALOG, PAGES, FONT = 1, 2, 3
+
+    def __init__(self, fileobj, pagesize=A4):
+        self.fileobj = fileobj
+        self.pagesize = pagesize
+        self.position = 0
+        self.offsets = {}
+        self.pages = []
+        self.lines = []
+        self.next_number = self.FONT + 1
+        self.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def write(self, data):
+        self.fileobj.write(data)
+        self.position += len(data)
+
+    def add_object(self, body, number=None):
+        if number is None:
+            number, self.next_number = self.next_number, self.next_number + 1
+        self.offsets[number] = self.position
+        self.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+        return number
+
+    def draw_string(self, x, y, text):
+        # Стандартный шрифт знает только WinAnsi (как и у reportlab, кириллицы в нем нет)
+        data = text.encode('cp1252', 'replace').replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+        self.lines.append(b'BT /F1 12 Tf %d %d Td (%s) Tj ET' % (x, y, data))
+
+    def show_page(self):
+        stream = zlib.compress(b'\n'.join(self.lines))
+        contents = self.add_object(b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(stream), stream))
+        width, height = self.pagesize
+        self.pages.append(self.add_object(
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] /Resources << /Font << /F1 %d 0 R >> >> '
+            b'/Contents %d 0 R >>' % (self.PAGES, width, height, self.FONT, contents)
+        ))
+        self.lines = []
+
+    def save(self):
+        if self.lines or not self.pages:
+            self.show_page()
+        self.add_object(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>', self.FONT)
+        kids = b' '.join(b'%d 0 R' % number for number in self.pages)
+        self.add_object(b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self.pages)), self.PAGES)
+        self.add_object(b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGES, self.CATALOG)
+
+        xref = self.position
+        size = max(self.offsets) + 1
+        self.write(b'xref\n0 %d\n0000000000 65535 f \n' % size)
+        for number in range(1, size):
+            self.write(b'%010d 00000 n \n' % self.offsets[number])
+        self.write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (size, self.CATALOG, xref))
+
+
+def write_match_report(matches, fileobj):
+    p = PdfPageWriter(fileobj, pagesize=A4)
+
+    y = 800
+    p.draw_string(100, y, "Match Report")
+    y -= 40
+
+    for match in matches:
+        text = f"{match.date_time.strftime('%Y-%m-%d')}: {match.home_team.name} vs {match.away_team.name} ({match.score_home}:{match.score_away})"
+        p.draw_string(50, y, text)
+        y -= 20
+
+        if y < 50:  # Если страница кончилась
+            p.show_page()
+            y = 800
+
+    p.save()
+
+
+def spooled_match_report(queryset):
+    report = tempfile.SpooledTemporaryFile(max_size=getattr(settings, 'EXPORT_SPOOL_MAX_SIZE', 5 * 1024 * 1024))
+    write_match_report(match_report_rows(queryset), report)
+    report.seek(0)
+    return report
+
+
+def is_large(queryset):
+    return queryset.count() > getattr(settings, 'EXPORT_BACKGROUND_THRESHOLD', 5000)
+
+
+def report_name():
+    return f'match-report-{time.time_ns()}-{uuid.uuid4().hex[:12]}.pdf'
+
+
+def match_report_failed(job, error, name, where):
+    # Отчета уже не будет (упала последняя попытка или воркер умер) - ссылка должна показать
+    # ошибку, а не вечное "готовится"
+    path = os.path.join(exports_dir(), name)
+    with open(path + FAILED_SUFFIX, 'w', encoding='utf-8') as f:
+        f.write(error)
+    if os.path.exists(path + PENDING_SUFFIX):
+        os.remove(path + PENDING_SUFFIX)
+
+
+@on_failure(match_report_failed)
+def build_match_report(job, name, where):
+    """Фоновая задача: отчет в EXPORT_DIR/name. Пока он строится, рядом лежит name.part."""
+    path = os.path.join(exports_dir(), name)
+    pending = path + PENDING_SUFFIX
+    with open(pending, 'wb') as f:
+        write_match_report(match_report_rows_keyset(job, restore_filter(where)), f)
+    os.replace(pending, path)
+
+
+def schedule_match_report(queryset):
+    """Ставит отчет в очередь задач (после коммита) и возвращает имя будущего файла."""
+    name = report_name()
+    where = saved_filter(queryset)
+
+    def start():
+        # Отметка "готовится" - вместе с задачей и только после коммита: при откате
+        # не останется вечной "готовящейся" ссылки
+        os.makedirs(exports_dir(), exist_ok=True)
+        open(os.path.join(exports_dir(), name + PENDING_SUFFIX), 'wb').close()
+        enqueue('sports.exports.build_match_report', name=name, where=where)
+
+    transaction.on_commit(start)
+    return name
+
+
+def export_status(name):
+    """
+    ('ready', путь к отчету), ('pending', None), ('failed', путь к файлу с ошибкой)
+    или (None, None), если такого отчета нет.
+    """
+    if not FILE_RE.match(name):
+        return None, None
+    path = os.path.join(exports_dir(), name)
+    if os.path.exists(path):
+        return 'ready', path
+    if os.path.exists(path + PENDING_SUFFIX):
+        return 'pending', None
+    if os.path.exists(path + FAILED_SUFFIX):
+        return 'failed', path + FAILED_SUFFIX
+    return None, None
+
+
+# Колонки выгрузок: (заголовок, поле для values_list)
+MATCH_COLUMNS = (
+    ('id', 'id'),
+    ('date_time', 'date_time'),
+    ('sport', 'tournament__sport__name'),
+    ('tournament', 'tournament__name'),
+    ('home_team', 'home_team__name'),
+    ('away_team', 'away_team__name'),
+    ('score_home', 'score_home'),
+    ('score_away', 'score_away'),
+    ('status', 'status'),
+)
+
+PARTICIPATION_COLUMNS = (
+    ('match_id', 'match_id'),
+    ('date_time', 'match__date_time'),
+    ('tournament', 'match__tournament__name'),
+    ('home_team', 'match__home_team__name'),
+    ('away_team', 'match__away_team__name'),
+    ('athlete_id', 'athlete_id'),
+    ('first_name', 'athlete__first_name'),
+    ('last_name', 'athlete__last_name'),
+    ('team', 'athlete__current_team__name'),
+    ('goals_scored', 'goals_scored'),
+    ('minutes_played', 'minutes_played'),
+    ('yellow_card', 'yellow_card'),
+)
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def csv_chunks(headers, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    for batch in batched(rows):
+        # Заголовок уходит вместе с первой пачкой (или один, если строк нет)
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(headers, rows):
+    for batch in batched(rows):
+        yield ''.join(json.dumps(dict(zip(headers, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+                      for row in batch)
+
+
+def batched(rows):
+    # Отдаем клиенту по пачке строк за раз, а не по строке: меньше мелких записей в сокет
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= chunk_size():
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def streaming_export(queryset, columns, fmt, filename):
+    """Потоковая выгрузка queryset в CSV или NDJSON."""
+    headers = [header for header, _ in columns]
+    rows = queryset.order_by('pk').values_list(*[field for _, field in columns]).iterator(chunk_size=chunk_size())
+    chunks = csv_chunks(headers, rows) if fmt == 'csv' else ndjson_chunks(headers, rows)
+    response = StreamingHttpResponse((chunk.encode() for chunk in chunks), content_type=CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
@@ -0,0 +1,127 @@
+import re
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+'''
+Счетчики SQL для замеров: сколько запросов, сколько времени в БД и сколько строк
+реально вычитано из курсоров. Работает через connection.execute_wrapper, поэтому
+не требует DEBUG=True и не копит тексты запросов, как CaptureQueriesContext.
+'''
+
+
+class QueryStats:
+    """
+    Контекстный менеджер:
+
+        with QueryStats() as stats:
+            client.get('/')
+        stats.queries, stats.rows, stats.seconds
+    """
+
+    def __init__(self, using=None):
+        self.aliases = [using] if using else list(connections)
+        self.queries = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in self.aliases:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.queries += 1
+            self._count_rows(context['cursor'])
+
+    def _count_rows(self, cursor):
+        # fetch* у CursorWrapper проксируются в курсор БД через __getattr__ - перекрываем их
+        # атрибутами экземпляра. Курсор может выполнить несколько запросов, оборачиваем один раз.
+        if getattr(cursor, '_sports_counted', False):
+            return
+        cursor._sports_counted = True
+        raw = cursor.cursor
+
+        def fetchone():
+            row = raw.fetchone()
+            if row is not None:
+                self.rows += 1
+            return row
+
+        def fetchmany(size=raw.arraysize):
+            rows = raw.fetchmany(size)
+            self.rows += len(rows)
+            return rows
+
+        def fetchall():
+            rows = raw.fetchall()
+            self.rows += len(rows)
+            return rows
+
+        cursor.fetchone, cursor.fetchmany, cursor.fetchall = fetchone, fetchmany, fetchall
+
+
+SCAN_RE = re.compile(r'\bSCAN (\w+)')
+# Django дает повторно присоединенным таблицам псевдонимы: INNER JOIN "sports_team" T4
+ALIAS_RE = re.compile(r'"(\w+)" (?:AS )?"?(T\d+)\b')
+
+
+def scanned_rows(sql, using='default'):
+    """
+    Оценка числа просмотренных строк по EXPLAIN QUERY PLAN: каждая полная проходка
+    по таблице (SCAN, в том числе по покрывающему индексу) стоит столько строк, сколько
+    в таблице есть. Поиск по индексу (SEARCH) считается бесплатным - его цена не растет
+    вместе с таблицей.
+    """
+    connection = connections[using]
+    total = 0
+    with connection.cursor() as cursor:
+        for table in scanned_tables(sql, using):
+            cursor.execute(f'SELECT COUNT(*) FROM "{table}"')
+            total += cursor.fetchone()[0]
+    return total
+
+
+def query_plan(sql, using='default'):
+    # Строки EXPLAIN QUERY PLAN; для не-SELECT плана нет
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return []
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def scanned_tables(sql, using='default', plan=None):
+    """Таблицы, которые план проходит целиком (псевдонимы T<n> раскрываются в имена таблиц)."""
+    tables = set(connections[using].introspection.table_names())
+    aliases = {alias: table for table, alias in ALIAS_RE.findall(sql)}
+    plan = query_plan(sql, using) if plan is None else plan
+    # Проход внешней таблицы в нужном порядке (по индексу или по rowid для ORDER BY id) с LIMIT
+    # останавливается через LIMIT строк - это не полный скан
+    ordered_walk = ' LIMIT ' in sql and not any('FOR ORDER BY' in line for line in plan)
+    scanned = []
+    for position, line in enumerate(plan):
+        match = SCAN_RE.search(line)
+        table = match and aliases.get(match.group(1), match.group(1))
+        if table in tables and not (ordered_walk and (' USING INDEX ' in line or
+                                                      (position == 0 and rowid_walk(sql, match.group(1))))):
+            scanned.append(table)
+    return scanned
+
+
+def rowid_walk(sql, table):
+    # Внешний цикл по rowid в порядке ORDER BY id без WHERE: LIMIT строк и стоп.
+    # С WHERE тот же план может пройти всю таблицу, если подходящих строк мало
+    order_by_pk = re.search(rf'ORDER BY "{table}"\."id" (?:ASC|DESC)(?: LIMIT| OFFSET|$)', sql)
+    return bool(order_by_pk) and ' WHERE ' not in sql
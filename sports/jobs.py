@@ -0,0 +1,169 @@
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .db import run_with_retry
+from .models import Job
+
+'''
+Фоновые задачи без внешнего брокера.
+Очередь - таблица Job. enqueue() добавляет задачу после коммита текущей транзакции
+(transaction.on_commit): воркер не возьмет задачу раньше, чем появятся данные, ради которых
+она поставлена, а при откате задача не ставится вовсе.
+Воркеры (manage.py run_workers) забирают задачи условным UPDATE ... WHERE status='queued' -
+две копии одну задачу не возьмут даже без SELECT FOR UPDATE, которого в SQLite нет.
+Упавшая задача повторяется с нарастающей паузой до max_attempts раз. Задача, от которой
+JOB_TIMEOUT секунд не было вестей (started_at обновляет и job_progress - это пульс), считается
+брошенной умершим воркером: работающие воркеры раз в JOB_REQUEUE_INTERVAL возвращают такие в очередь.
+
+Задача - обычная функция task(job, **kwargs); прогресс - job_progress(job, done, total).
+Если задаче нужно прибраться после окончательного провала (последняя попытка упала или
+брошена умершим воркером), она объявляет обработчик декоратором @on_failure(hook).
+'''
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(task, *, delay=None, max_attempts=None, **kwargs):
+    """Ставит задачу в очередь после коммита. task - путь к функции, kwargs - JSON-аргументы."""
+    def create():
+        Job.objects.create(
+            task=task,
+            kwargs=kwargs,
+            run_after=timezone.now() + (delay or timedelta()),
+            max_attempts=max_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', 3),
+        )
+
+    transaction.on_commit(create)
+
+
+def on_failure(hook):
+    """Декоратор задачи: hook(job, error, **kwargs) вызывается, когда задача провалилась окончательно."""
+    def decorate(task):
+        task.on_failure = hook
+        return task
+    return decorate
+
+
+def failed(job, error):
+    # Ошибка обработчика не должна ронять воркер: задача уже помечена failed
+    try:
+        hook = getattr(import_string(job.task), 'on_failure', None)
+        if hook is not None:
+            hook(job, error, **job.kwargs)
+    except Exception:
+        logger.exception('Обработчик провала задачи %s упал', job)
+
+
+def job_progress(job, done, total, message=''):
+    percent = min(100, done * 100 // total) if total else 100
+    # started_at - еще и пульс: долгая, но живая задача не считается брошенной (requeue_stale)
+    now = timezone.now()
+    Job.objects.filter(pk=job.pk).update(progress=percent, message=message[:200], started_at=now)
+    job.progress, job.message, job.started_at = percent, message, now
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}'
+
+
+def claim(worker):
+    """Следующая задача из очереди или None."""
+    while True:
+        now = timezone.now()
+        candidate = (
+            Job.objects.filter(status='queued', run_after__lte=now)
+            .order_by('run_after', 'pk').values_list('pk', flat=True).first()
+        )
+        if candidate is None:
+            return None
+        # Чтение - вне транзакции, захват - один UPDATE. Если читать и писать в одной транзакции,
+        # два воркера одновременно получают "database is locked" без ожидания (SQLite не может
+        # повысить блокировку читателя, пока пишет другой)
+        taken = run_with_retry(lambda: Job.objects.filter(pk=candidate, status='queued').update(
+            status='running', worker=worker, started_at=now, attempts=F('attempts') + 1,
+        ))
+        if taken:
+            return Job.objects.get(pk=candidate)
+        # 0 - задачу только что забрал другой воркер, берем следующую
+
+
+def run(job):
+    """Выполняет задачу и записывает результат: done, повтор позже или failed."""
+    try:
+        import_string(job.task)(job, **job.kwargs)
+    except Exception as exc:
+        error = traceback.format_exc()
+        if job.is_last_attempt:
+            logger.error('Задача %s провалилась после %d попыток\n%s', job, job.attempts, error)
+            finish(job, status='failed', error=error)
+            failed(job, f'{type(exc).__name__}: {exc}')
+        else:
+            # Пауза 2, 4, 8... * JOB_RETRY_DELAY секунд
+            delay = getattr(settings, 'JOB_RETRY_DELAY', 30) * 2 ** (job.attempts - 1)
+            logger.warning('Задача %s упала (попытка %d), повтор через %d с', job, job.attempts, delay)
+            finish(job, status='queued', error=error, run_after=timezone.now() + timedelta(seconds=delay),
+                   finished_at=None)
+        return False
+    finish(job, status='done', progress=100, error='')
+    return True
+
+
+def finish(job, **fields):
+    fields.setdefault('finished_at', timezone.now())
+    run_with_retry(lambda: Job.objects.filter(pk=job.pk).update(**fields))
+    for name, value in fields.items():
+        setattr(job, name, value)
+
+
+def requeue_stale():
+    """Возвращает в очередь задачи воркеров, которые умерли, не закончив работу (нет пульса JOB_TIMEOUT секунд)."""
+    deadline = timezone.now() - timedelta(seconds=getattr(settings, 'JOB_TIMEOUT', 3600))
+    stale = Job.objects.filter(status='running', started_at__lt=deadline)
+    requeued = run_with_retry(lambda: stale.filter(attempts__lt=F('max_attempts')).update(status='queued'))
+    error = 'Воркер не закончил задачу за JOB_TIMEOUT'
+    for job in list(stale):
+        # Условный UPDATE: если воркеров несколько, обработчик провала вызовет только один
+        marked = run_with_retry(lambda: Job.objects.filter(pk=job.pk, status='running').update(
+            status='failed', error=error, finished_at=timezone.now()))
+        if marked:
+            logger.error('Задача %s брошена воркером после %d попыток', job, job.attempts)
+            failed(job, error)
+    return requeued
+
+
+def work(stop=None, burst=False, poll_interval=None):
+    """
+    Цикл воркера: берет задачи, пока не выставлен stop. burst - выйти, когда очередь опустела.
+    Возвращает число выполненных задач.
+    """
+    stop = stop or threading.Event()
+    poll_interval = getattr(settings, 'JOB_POLL_INTERVAL', 1) if poll_interval is None else poll_interval
+    requeue_interval = getattr(settings, 'JOB_REQUEUE_INTERVAL', 60)
+    worker = worker_name()
+    done = 0
+    checked = None
+    while not stop.is_set():
+        # Задачи умерших воркеров ждут не до перезапуска пула, а не дольше JOB_TIMEOUT + интервал
+        if checked is None or time.monotonic() - checked >= requeue_interval:
+            requeue_stale()
+            checked = time.monotonic()
+        job = claim(worker)
+        if job is None:
+            if burst:
+                break
+            stop.wait(poll_interval)
+            continue
+        run(job)
+        done += 1
+    return done
@@ -0,0 +1,135 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import AthleteStats, Match, MatchParticipation, Tournament
+
+# Рейтинги: параметр ?by= -> поле AthleteStats
+LEADERBOARDS = {
+    'goals': 'goals',
+    'minutes': 'minutes',
+    'cards': 'yellow_cards',
+}
+
+COUNTER_FIELDS = ('matches', 'goals', 'minutes', 'yellow_cards')
+
+
+def participation_values(participation):
+    return {name: getattr(participation, name) for name in MatchParticipation.tracked_fields}
+
+
+def _deltas(values):
+    return {
+        'matches': 1,
+        'goals': values['goals_scored'],
+        'minutes': values['minutes_played'],
+        'yellow_cards': int(bool(values['yellow_card'])),
+    }
+
+
+def contribution(values, tournament_id, sport_id):
+    """
+    Вклад одной строки MatchParticipation: {(athlete_id, sport_id, tournament_id): приращения}.
+    Каждая строка попадает и в рейтинг турнира, и в общий рейтинг вида спорта (tournament_id=None).
+    """
+    if not values:
+        return {}
+    deltas = _deltas(values)
+    athlete_id = values['athlete_id']
+    return {
+        (athlete_id, sport_id, tournament_id): deltas,
+        (athlete_id, sport_id, None): deltas,
+    }
+
+
+def _match_tournaments(*match_ids):
+    return {
+        match_id: (tournament_id, sport_id)
+        for match_id, tournament_id, sport_id in Match.objects.filter(pk__in=match_ids).values_list(
+            'pk', 'tournament_id', 'tournament__sport_id'
+        )
+    }
+
+
+def apply_contribution(contrib, sign):
+    for (athlete_id, sport_id, tournament_id), deltas in contrib.items():
+        updates = {name: F(name) + sign * value for name, value in deltas.items() if value}
+        lookup = {'athlete_id': athlete_id, 'sport_id': sport_id, 'tournament_id': tournament_id}
+        if sign > 0:
+            AthleteStats.objects.get_or_create(**lookup)
+        AthleteStats.objects.filter(**lookup).update(**updates)
+
+
+def update_for_participation(old_values, new_values):
+    if old_values == new_values:
+        return
+    match_ids = {values['match_id'] for values in (old_values, new_values) if values}
+    # Матч может быть уже удален (каскадное удаление турнира) - тогда вычитать нечего
+    tournaments = _match_tournaments(*match_ids)
+
+    def contrib(values):
+        if not values or values['match_id'] not in tournaments:
+            return {}
+        return contribution(values, *tournaments[values['match_id']])
+
+    with transaction.atomic():
+        apply_contribution(contrib(old_values), -1)
+        apply_contribution(contrib(new_values), 1)
+
+
+def move_match(match_id, old_tournament_id, new_tournament_id):
+    # Матч перенесли в другой турнир - переносим вклад всех его участников
+    if old_tournament_id == new_tournament_id:
+        return
+    rows = list(MatchParticipation.objects.filter(match_id=match_id).values(*MatchParticipation.tracked_fields))
+    if not rows:
+        return
+    sports = dict(Tournament.objects.filter(pk__in=[old_tournament_id, new_tournament_id]).values_list('pk', 'sport_id'))
+    with transaction.atomic():
+        for values in rows:
+            if old_tournament_id in sports:
+                apply_contribution(contribution(values, old_tournament_id, sports[old_tournament_id]), -1)
+            apply_contribution(contribution(values, new_tournament_id, sports[new_tournament_id]), 1)
+
+
+def top(queryset, by, limit=20):
+    field = LEADERBOARDS[by]
+    return queryset.filter(**{f'{field}__gt': 0}).select_related('athlete', 'athlete__current_team').order_by(
+        f'-{field}', 'athlete_id'
+    )[:limit]
+
+
+def tournament_leaders(tournament, by='goals', limit=20):
+    return top(AthleteStats.objects.filter(tournament=tournament), by, limit)
+
+
+def sport_leaders(sport, by='goals', limit=20):
+    return top(AthleteStats.objects.filter(sport=sport, tournament__isnull=True), by, limit)
+
+
+def rebuild_leaderboards():
+    """Пересчитывает AthleteStats с нуля. Возвращает количество записанных строк."""
+    totals = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+    rows = (
+        MatchParticipation.objects.order_by()
+        .values_list(*MatchParticipation.tracked_fields, 'match__tournament_id', 'match__tournament__sport_id')
+        .iterator(chunk_size=5000)
+    )
+    width = len(MatchParticipation.tracked_fields)
+    for row in rows:
+        values = dict(zip(MatchParticipation.tracked_fields, row[:width]))
+        for key, deltas in contribution(values, row[width], row[width + 1]).items():
+            for name, value in deltas.items():
+                totals[key][name] += value
+
+    with transaction.atomic():
+        AthleteStats.objects.all().delete()
+        AthleteStats.objects.bulk_create(
+            [
+                AthleteStats(athlete_id=athlete_id, sport_id=sport_id, tournament_id=tournament_id, **counters)
+                for (athlete_id, sport_id, tournament_id), counters in totals.items()
+            ],
+            batch_size=1000,
+        )
+    return len(totals)
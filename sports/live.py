@@ -0,0 +1,149 @@
+import asyncio
+import json
+import os
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import Match
+
+'''
+Трансляция счета live-матчей (Server-Sent Events).
+Сохранение Match публикует событие в брокер, брокер раздает его всем подключенным клиентам
+своего процесса. Сколько бы ни было клиентов, к БД они не обращаются (кроме начального снимка).
+
+LocalBroker работает в пределах одного процесса. Для нескольких воркеров есть FileBroker:
+события дописываются в общий файл, и в каждом процессе один фоновый таск читает его хвост.
+'''
+
+KEEPALIVE_SECONDS = getattr(settings, 'LIVE_KEEPALIVE_SECONDS', 15)
+# Сколько событий может ждать медленный клиент, прежде чем старые начнут отбрасываться
+QUEUE_SIZE = 100
+
+
+class LocalBroker:
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        # Вызывается из корутины: очередь привязана к текущему event loop
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers = {(loop, q) for loop, q in self._subscribers if q is not queue}
+
+    def publish(self, event):
+        self.fan_out(event)
+
+    def fan_out(self, event):
+        # publish() зовется из синхронного кода (сигналы), очереди живут в event loop
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_put_latest, queue, event)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+
+class FileBroker(LocalBroker):
+    """
+    Замена внешнего брокера для нескольких воркеров на одной машине.
+    Публикация - дописать строку JSON в LIVE_EVENTS_FILE; чтение - один таск на процесс.
+    """
+
+    def __init__(self, path=None, poll_interval=None):
+        super().__init__()
+        self.path = str(path or getattr(settings, 'LIVE_EVENTS_FILE', settings.BASE_DIR / 'live_events.jsonl'))
+        self.poll_interval = poll_interval or getattr(settings, 'LIVE_POLL_INTERVAL', 0.5)
+        self.max_size = getattr(settings, 'LIVE_EVENTS_MAX_BYTES', 1024 * 1024)
+        self._tailers = {}
+
+    def publish(self, event):
+        line = json.dumps(event, ensure_ascii=False) + '\n'
+        if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_size:
+            # Читатели заметят, что файл стал короче их позиции, и начнут с начала
+            open(self.path, 'w').close()
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+    def subscribe(self):
+        queue = super().subscribe()
+        loop = asyncio.get_running_loop()
+        tailer = self._tailers.get(loop)
+        if tailer is None or tailer.done():
+            self._tailers[loop] = loop.create_task(self._tail())
+        return queue
+
+    async def _tail(self):
+        position = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        while self.subscriber_count:
+            await asyncio.sleep(self.poll_interval)
+            if not os.path.exists(self.path):
+                continue
+            if os.path.getsize(self.path) < position:
+                position = 0
+            with open(self.path, 'rb') as f:
+                f.seek(position)
+                chunk = f.read()
+            # Неполную последнюю строку дочитаем в следующий раз
+            end = chunk.rfind(b'\n') + 1
+            position += end
+            for line in chunk[:end].decode('utf-8').splitlines():
+                if line:
+                    self.fan_out(json.loads(line))
+
+
+def _put_latest(queue, event):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'LIVE_BROKER', 'sports.live.LocalBroker'))()
+        return _broker
+
+
+def match_event(match):
+    return {
+        'id': match.pk,
+        'status': match.status,
+        'status_display': match.get_status_display(),
+        'score_home': match.score_home,
+        'score_away': match.score_away,
+        'home_team': match.home_team.name,
+        'away_team': match.away_team.name,
+    }
+
+
+def publish_match(match):
+    # После коммита: клиенты не должны увидеть счет, который потом откатится
+    event = match_event(match)
+    transaction.on_commit(lambda: get_broker().publish(event))
+
+
+def live_match_events():
+    # Начальный снимок для только что подключившегося клиента
+    matches = Match.objects.filter(status='live').select_related('home_team', 'away_team')
+    return [match_event(match) for match in matches]
+
+
+def format_sse(event, name='score'):
+    return f'event: {name}\nid: {event["id"]}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n'
@@ -0,0 +1,185 @@
+import json
+import math
+import os
+import platform
+import statistics
+import tempfile
+import time
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from sports import metrics
+from sports.instrumentation import QueryStats
+from sports.management.commands.fill_db import DataGenerator, counts_for_scale
+from sports.models import Article
+
+'''
+Замер страниц на тестовой базе.
+Для каждого масштаба данных база очищается и заполняется генератором fill_db с фиксированным
+зерном, после чего каждая страница запрашивается через тестовый клиент --repeat раз.
+Рабочая db.sqlite3 и файловый кэш не трогаются: создается отдельная тестовая БД,
+а кэш на время замера подменяется на locmem. Метрики замера пишутся во временный файл
+(не в METRICS_STORE, который отдает /metrics), журнал медленных запросов и профайлер выключены.
+'''
+
+# Публичные страницы запрашиваются анонимом, админка - суперпользователем
+PUBLIC_VIEWS = ('home', 'article_list', 'article_detail', 'tournament_list', 'stats')
+ADMIN_MODELS = ('match', 'athlete', 'article', 'team', 'tournament')
+
+BENCH_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench'}}
+
+
+def percentile(values, percent):
+    # Ближайший ранг: на маленьких выборках не выдумывает значений, которых не было
+    ordered = sorted(values)
+    index = math.ceil(percent / 100 * len(ordered)) - 1
+    return ordered[max(0, min(len(ordered) - 1, index))]
+
+
+def compare(results, baseline, threshold):
+    """
+    Возвращает список регрессий относительно baseline.
+    Время и строки сравниваются с допуском threshold, число запросов - строго.
+    """
+    regressions = []
+    for scale, views in results['scales'].items():
+        for name, current in views.items():
+            previous = baseline.get('scales', {}).get(scale, {}).get(name)
+            if previous is None:
+                continue
+            for metric in ('p95_ms', 'rows'):
+                limit = previous[metric] * (1 + threshold)
+                if current[metric] > limit and current[metric] - previous[metric] > 1:
+                    regressions.append(f'scale {scale}, {name}: {metric} {previous[metric]} -> {current[metric]}')
+            if current['queries'] > previous['queries']:
+                regressions.append(
+                    f"scale {scale}, {name}: queries {previous['queries']} -> {current['queries']}"
+                )
+    return regressions
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время, число запросов и вычитанные строки для основных страниц'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', type=int, nargs='+', default=[1, 10], help='Масштабы данных (как fill_db --scale)')
+        parser.add_argument('--repeat', type=int, default=20, help='Запросов на страницу')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='Не чистить кэш перед каждым запросом (замер установившегося режима)')
+        parser.add_argument('--output', help='Куда записать результаты (JSON)')
+        parser.add_argument('--baseline', help='JSON предыдущего прогона для сравнения')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Допустимый рост p95 и строк относительно baseline (0.25 = 25%%)')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть положительным')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        results = {
+            'meta': {
+                'seed': options['seed'],
+                'repeat': options['repeat'],
+                'warm_cache': options['warm_cache'],
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'scales': {},
+        }
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with tempfile.TemporaryDirectory(prefix='lab7-bench-') as scratch, override_settings(
+                    CACHES=BENCH_CACHES, DEBUG=False, SLOW_QUERY_MS=None, PROFILING_ENABLED=False,
+                    METRICS_STORE=os.path.join(scratch, 'metrics.sqlite3')):
+                for scale in options['scales']:
+                    results['scales'][str(scale)] = self.bench_scale(scale, options)
+                # Несброшенные приращения замера не должны уйти в рабочее хранилище
+                metrics.reset()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(results, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+            self.stdout.write(f"Результаты записаны в {options['output']}")
+
+        if baseline is not None:
+            regressions = compare(results, baseline, options['threshold'])
+            if regressions:
+                raise CommandError('Регрессии:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('Регрессий относительно baseline нет'))
+
+    def bench_scale(self, scale, options):
+        call_command('flush', interactive=False, verbosity=0)
+        cache.clear()
+        self.stdout.write(f"Масштаб {scale}: заполнение...")
+        summary = DataGenerator(seed=options['seed']).generate(counts_for_scale(scale))
+        self.stdout.write(f"  {summary}")
+
+        anonymous = Client()
+        admin = Client()
+        admin.force_login(User.objects.filter(is_superuser=True).first())
+
+        views = {name: (anonymous, self.url_for(name)) for name in PUBLIC_VIEWS}
+        for model in ADMIN_MODELS:
+            views[f'admin:{model}'] = (admin, reverse(f'admin:sports_{model}_changelist'))
+
+        measured = {}
+        self.stdout.write(f"  {'страница':<20}{'p50':>9}{'p95':>9}{'p99':>9}{'запросы':>9}{'строки':>9}")
+        for name, (client, url) in views.items():
+            measured[name] = result = self.bench_view(client, url, options)
+            self.stdout.write(
+                f"  {name:<20}{result['p50_ms']:>9}{result['p95_ms']:>9}{result['p99_ms']:>9}"
+                f"{result['queries']:>9}{result['rows']:>9}"
+            )
+        return measured
+
+    def url_for(self, name):
+        if name == 'article_detail':
+            article = Article.published.order_by('-created_at').first()
+            return reverse(name, args=[article.slug])
+        return reverse(name)
+
+    def bench_view(self, client, url, options):
+        # Прогрев: первый запрос грузит шаблоны и модули, в замер не идет
+        client.get(url)
+        timings, queries, rows = [], [], []
+        for _ in range(options['repeat']):
+            if not options['warm_cache']:
+                cache.clear()
+            with QueryStats() as stats:
+                started = time.perf_counter()
+                response = client.get(url)
+                elapsed = time.perf_counter() - started
+            if response.status_code != 200:
+                raise CommandError(f'{url}: код ответа {response.status_code}')
+            timings.append(elapsed * 1000)
+            queries.append(stats.queries)
+            rows.append(stats.rows)
+
+        return {
+            'url': url,
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+            'mean_ms': round(statistics.fmean(timings), 2),
+            # Запросы и строки от прогона к прогону не меняются, берем максимум на случай кэша
+            'queries': max(queries),
+            'rows': max(rows),
+        }
@@ -0,0 +1,31 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from sports import jobs
+from sports.renditions import IMAGE_FIELDS
+
+
+class Command(BaseCommand):
+    help = 'Ставит в очередь сборку уменьшенных копий для картинок, у которых их еще нет (или они устарели)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Пересобрать копии всех картинок')
+
+    def handle(self, *args, **options):
+        total = 0
+        for model, (field_name, _) in IMAGE_FIELDS.items():
+            Model = apps.get_model(model)
+            rows = (
+                Model._base_manager.exclude(**{f'{field_name}__isnull': True}).exclude(**{field_name: ''})
+                .values_list('pk', field_name, 'renditions').iterator()
+            )
+            queued = 0
+            for pk, image, renditions in rows:
+                # Копии уже собраны для этой картинки
+                if not options['force'] and (renditions or {}).get('source') == image:
+                    continue
+                jobs.enqueue('sports.renditions.build_renditions', model=model, pk=pk)
+                queued += 1
+            self.stdout.write(f'{Model._meta.verbose_name_plural}: {queued}')
+            total += queued
+        self.stdout.write(self.style.SUCCESS(f'Задач поставлено: {total}. Выполнит их manage.py run_workers'))
@@ -0,0 +1,133 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from sports import metrics
+from sports.instrumentation import query_plan, scanned_tables
+from sports.models import Article, Sport, Tournament
+from sports.slow_queries import normalize
+
+'''
+Советник по индексам.
+Открывает страницы сайта (вьюхи sports/views.py вместе с виджетами sports_tags.py) и списки
+админки на текущей базе, собирает все выполненные запросы и прогоняет каждый через
+EXPLAIN QUERY PLAN. В отчет попадают полные проходки по таблицам (SCAN) и сортировки
+во временном B-дереве (USE TEMP B-TREE) - кандидаты на индекс.
+Все происходит в транзакции, которая откатывается: сессии и служебный пользователь не сохраняются.
+Метрики этих запросов пишутся во временный файл, журнал медленных запросов и профайлер выключены.
+'''
+
+PUBLIC_VIEWS = ('home', 'article_list', 'article_detail', 'tournament_list', 'tournament_standings',
+                'tournament_leaders', 'sport_leaders', 'stats')
+
+ADVISOR_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'explain'}}
+
+
+def public_urls():
+    article = Article.published.order_by('-created_at').first()
+    tournament = Tournament.objects.order_by('-is_active', 'pk').first()
+    sport = Sport.objects.order_by('pk').first()
+    args = {
+        'article_detail': article and [article.slug],
+        'tournament_standings': tournament and [tournament.slug],
+        'tournament_leaders': tournament and [tournament.slug],
+        'sport_leaders': sport and [sport.slug],
+    }
+    urls = {}
+    for name in PUBLIC_VIEWS:
+        if name in args and args[name] is None:
+            continue  # нет данных для страницы
+        urls[name] = reverse(name, args=args.get(name) or [])
+    return urls
+
+
+def admin_urls():
+    return {
+        f'admin:{model._meta.model_name}': reverse(f'admin:sports_{model._meta.model_name}_changelist')
+        for model in admin.site._registry if model._meta.app_label == 'sports'
+    }
+
+
+def problems(sql, plan):
+    """Полные проходки и временные сортировки из плана запроса."""
+    found = [f'SCAN {table}' for table in scanned_tables(sql, plan=plan)]
+    found += [line for line in plan if line.startswith('USE TEMP B-TREE')]
+    return found
+
+
+class Command(BaseCommand):
+    help = 'Показывает запросы страниц и админки, которые проходят таблицы целиком или сортируют без индекса'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-scan-rows', type=int, default=None,
+                            help='Ошибка, если какой-то запрос проходит целиком таблицу больше N строк (для CI)')
+
+    def handle(self, *args, **options):
+        # Тестовый клиент ходит на хост testserver
+        hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        with tempfile.TemporaryDirectory(prefix='lab7-explain-') as scratch, override_settings(
+                CACHES=ADVISOR_CACHES, PAGE_CACHE_URL_NAMES=[], ALLOWED_HOSTS=hosts, SLOW_QUERY_MS=None,
+                PROFILING_ENABLED=False, METRICS_STORE=os.path.join(scratch, 'metrics.sqlite3')):
+            with transaction.atomic():
+                shapes = self.collect()
+                report = self.explain(shapes)
+                transaction.set_rollback(True)
+            metrics.reset()
+
+        worst = 0
+        for item in report:
+            worst = max(worst, item['rows'])
+            self.stdout.write(self.style.WARNING(f"{', '.join(item['problems'])}  (строк: {item['rows']})"))
+            self.stdout.write(f"  страницы: {', '.join(sorted(item['pages']))}")
+            self.stdout.write(f"  {item['sql'][:300]}")
+            for line in item['plan']:
+                self.stdout.write(f"    | {line}")
+        self.stdout.write(f"Запросов с проблемами: {len(report)}")
+
+        limit = options['max_scan_rows']
+        if limit is not None and worst > limit:
+            raise CommandError(f'Полная проходка по {worst} строкам (допустимо {limit})')
+
+    def collect(self):
+        """Открывает страницы и возвращает {форма запроса: (sql, страницы)}."""
+        shapes = {}
+        anonymous = Client()
+        staff = Client()
+        staff.force_login(User.objects.create_superuser('explain-queries', 'explain@example.com', None))
+
+        pages = [(anonymous, name, url) for name, url in public_urls().items()]
+        pages += [(staff, name, url) for name, url in admin_urls().items()]
+        for client, name, url in pages:
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                client.get(url)
+            for query in queries.captured_queries:
+                sql = query['sql']
+                _, seen_on = shapes.setdefault(normalize(sql), (sql, set()))
+                seen_on.add(name)
+        return shapes
+
+    def explain(self, shapes):
+        report = []
+        with connection.cursor() as cursor:
+            for sql, pages in shapes.values():
+                plan = query_plan(sql)
+                found = problems(sql, plan)
+                if not found:
+                    continue
+                rows = 0
+                for table in scanned_tables(sql, plan=plan):
+                    cursor.execute(f'SELECT COUNT(*) FROM "{table}"')
+                    rows += cursor.fetchone()[0]
+                report.append({'sql': sql, 'pages': pages, 'plan': plan, 'problems': found, 'rows': rows})
+        # Самые дорогие проходки сверху
+        return sorted(report, key=lambda item: item['rows'], reverse=True)
@@ -1,176 +1,332 @@
 import random
-from django.core.management.base import BaseCommand
+import time
+from datetime import date, datetime, timedelta
+
 from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max, Q
 from django.utils import timezone
 from faker import Faker
+
+from sports import cache, page_cache
+from sports.leaderboards import rebuild_leaderboards
+from sports.related import rebuild_related
 from sports.models import Sport, Tournament, Team, Athlete, Match, MatchParticipation, Article, Tag
+from sports.standings import rebuild_standings
 
+# Базовые объемы (scale=1) - как в первой версии команды
+BASE_COUNTS = {
+    'tournaments_per_sport': 3,
+    'teams_per_sport': 10,
+    'athletes_per_team': 15,
+    'matches': 30,
+    'players_per_side': 3,
+    'tags': 10,
+    'articles': 20,
+}
 
-class Command(BaseCommand):
-    help = 'Заполняет базу данных тестовыми данными'
+# Какие объемы растут вместе со --scale (состав команды и матча от масштаба не зависят)
+SCALED = ('tournaments_per_sport', 'teams_per_sport', 'matches', 'tags', 'articles')
 
-    def handle(self, *args, **kwargs):
-        # Инициализируем Faker с русской локалью
-        fake = Faker(['ru_RU'])
+SPORTS = [
+    ('Футбол', 'soccer'),
+    ('Хоккей', 'hockey'),
+    ('Баскетбол', 'basketball'),
+    ('Теннис', 'tennis'),
+]
 
-        self.stdout.write("Начинаем заполнение БД...")
 
-        # 1. Создаем Суперюзера (если нет) и Авторов
+def counts_for_scale(scale=1, **overrides):
+    counts = {name: value * scale if name in SCALED else value for name, value in BASE_COUNTS.items()}
+    counts.update({name: value for name, value in overrides.items() if value is not None})
+    return counts
+
+
+def rendered(articles):
+    # bulk_create не вызывает save(), excerpt и content_html считаем сами
+    for article in articles:
+        article.render_content()
+        yield article
+
+
+class DataGenerator:
+    """
+    Генератор тестовых данных: пачки bulk_create внутри транзакций.
+    Используется командами fill_db и bench.
+    bulk_create не вызывает save() и сигналы, поэтому в конце агрегаты пересчитываются целиком.
+    Все даты отсчитываются от полуночи reference_date (по умолчанию - сегодня): одно зерно
+    и одна опорная дата дают одинаковые данные.
+    """
+
+    def __init__(self, seed=None, batch_size=5000, stdout=None, reference_date=None):
+        self.rng = random.Random(seed)
+        self.fake = Faker(['ru_RU'])
+        if seed is not None:
+            self.fake.seed_instance(seed)
+        self.batch_size = batch_size
+        self.stdout = stdout
+        self.reference_date = reference_date or timezone.localdate()
+        self.now = timezone.make_aware(datetime.combine(self.reference_date, datetime.min.time()))
+
+    # служебное
+
+    def log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def report(self, label, done, total, started):
+        elapsed = time.monotonic() - started
+        rate = done / elapsed if elapsed else 0
+        self.log(f"  {label}: {done}/{total} ({rate:,.0f} в секунду)")
+
+    def next_number(self, model):
+        # Номера для уникальных слагов продолжают уже существующие строки (повторный запуск)
+        return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+    def bulk(self, label, model, rows, total):
+        """Создает объекты из итератора rows пачками по batch_size, каждая пачка - в своей транзакции."""
+        started = time.monotonic()
+        created, batch = [], []
+        done = 0
+        for obj in rows:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                created.extend(self._flush(model, batch))
+                done += len(batch)
+                batch = []
+                self.report(label, done, total, started)
+        if batch:
+            created.extend(self._flush(model, batch))
+            done += len(batch)
+        self.report(label, done, total, started)
+        return created
+
+    def _flush(self, model, batch):
+        with transaction.atomic():
+            return model.objects.bulk_create(batch, batch_size=self.batch_size)
+
+    # сущности
+
+    def users(self):
         if not User.objects.filter(username='admin').exists():
             User.objects.create_superuser('admin', 'admin@example.com', 'admin')
 
         users = []
         for _ in range(5):
-            username = fake.user_name()
+            username = self.fake.user_name()
             if not User.objects.filter(username=username).exists():
                 users.append(User.objects.create_user(username, 'test@test.com', 'password'))
-
         # Если юзеры уже были, берем их
-        if not users:
-            users = list(User.objects.all())
-
-        # 2. Виды спорта (фиксированный список)
-        sports_data = [
-            ('Футбол', 'soccer'),
-            ('Хоккей', 'hockey'),
-            ('Баскетбол', 'basketball'),
-            ('Теннис', 'tennis'),
-        ]
-
-        sports_objs = []
-        for name, slug in sports_data:
-            # get_or_create предотвращает дубликаты при повторном запуске
-            obj, created = Sport.objects.get_or_create(name=name, defaults={'slug': slug})
-            sports_objs.append(obj)
-
-        self.stdout.write(f"Создано видов спорта: {len(sports_objs)}")
-
-        # 3. Турниры (по 2-3 на каждый вид спорта)
-        tournaments = []
-        for sport in sports_objs:
-            for _ in range(3):
-                t_name = f"Чемпионат {fake.city()} по {sport.name}у"
-                t, _ = Tournament.objects.get_or_create(
-                    name=t_name,
-                    sport=sport,
-                    defaults={
-                        'slug': fake.slug() + str(random.randint(1, 9999)),
-                        'is_active': random.choice([True, False])
-                    }
-                )
-                tournaments.append(t)
-
-        self.stdout.write(f"Создано турниров: {len(tournaments)}")
-
-        # 4. Команды (по 10 на каждый вид спорта)
-        teams = []
-        for sport in sports_objs:
-            for _ in range(10):
-                team = Team.objects.create(
-                    name=f"ФК {fake.city()}" if sport.name == 'Футбол' else f"Клуб {fake.word().capitalize()}",
-                    short_name=fake.word()[:5].upper(),
-                    sport=sport,
-                    city=fake.city(),
-                    slug=fake.unique.slug()
-                )
-                teams.append(team)
-
-        self.stdout.write(f"Создано команд: {len(teams)}")
-
-        # 5. Игроки (Спортсмены) - по 15 на команду
-        athletes = []
-        for team in teams:
-            for _ in range(15):
-                athlete = Athlete.objects.create(
-                    first_name=fake.first_name_male(),
-                    last_name=fake.last_name_male(),
-                    current_team=team,
-                    sport=team.sport,
-                    birth_date=fake.date_of_birth(minimum_age=18, maximum_age=40),
-                    position=fake.job()  # Или random.choice(['Нападающий', 'Вратарь'])
-                )
-                athletes.append(athlete)
-
-        self.stdout.write(f"Создано спортсменов: {len(athletes)}")
-
-        # 6. Матчи (Генерируем 30 матчей)
-        matches = []
-        for _ in range(30):
-            # Выбираем случайный турнир
-            tournament = random.choice(tournaments)
-            # Берем команды только этого вида спорта
-            possible_teams = list(Team.objects.filter(sport=tournament.sport))
-
-            if len(possible_teams) < 2:
-                continue
-
-            home, away = random.sample(possible_teams, 2)
-
-            match = Match.objects.create(
-                tournament=tournament,
-                home_team=home,
-                away_team=away,
-                date_time=fake.date_time_between(start_date='-1y', end_date='+1y',
-                                                 tzinfo=timezone.get_current_timezone()),
-                status=random.choice(['scheduled', 'live', 'finished']),
-                score_home=random.randint(0, 5),
-                score_away=random.randint(0, 5)
+        return users or list(User.objects.all())
+
+    def sports(self):
+        # Повторный запуск не создает дубликатов: вид спорта ищем и по имени, и по слагу
+        sports = []
+        for name, slug in SPORTS:
+            sport = Sport.objects.filter(Q(name=name) | Q(slug=slug)).first()
+            sports.append(sport or Sport.objects.create(name=name, slug=slug))
+        return sports
+
+    def tournaments(self, sports, per_sport):
+        number = self.next_number(Tournament)
+        rows = (
+            Tournament(
+                name=f"Чемпионат {self.fake.city()} по {sport.name}у",
+                sport=sport,
+                slug=f"tournament-{number + i * len(sports) + j}",
+                is_active=self.rng.choice([True, False]),
+            )
+            for i in range(per_sport) for j, sport in enumerate(sports)
+        )
+        return self.bulk('Турниры', Tournament, rows, per_sport * len(sports))
+
+    def teams(self, sports, per_sport):
+        number = self.next_number(Team)
+        rows = (
+            Team(
+                name=f"ФК {self.fake.city()}" if sport.slug == 'soccer' else f"Клуб {self.fake.word().capitalize()}",
+                short_name=self.fake.word()[:5].upper(),
+                sport=sport,
+                city=self.fake.city(),
+                slug=f"team-{number + i * len(sports) + j}",
+            )
+            for i in range(per_sport) for j, sport in enumerate(sports)
+        )
+        return self.bulk('Команды', Team, rows, per_sport * len(sports))
+
+    def athletes(self, teams, per_team):
+        rows = (
+            Athlete(
+                first_name=self.fake.first_name_male(),
+                last_name=self.fake.last_name_male(),
+                current_team=team,
+                sport_id=team.sport_id,
+                # date_of_birth у Faker считает от сегодняшнего дня - берем от опорной даты
+                birth_date=(self.now - timedelta(days=self.rng.randint(18 * 365, 40 * 365))).date(),
+                position=self.fake.job(),
             )
-            matches.append(match)
-
-        self.stdout.write(f"Создано матчей: {len(matches)}")
-
-        # 7. Статистика (MatchParticipation - through table)
-        # Для каждого матча добавим несколько игроков со статистикой
-        for match in matches:
-            # Игроки домашней команды
-            home_players = list(match.home_team.players.all())  # related_name='players' из модели
-            # Игроки гостей
-            away_players = list(match.away_team.players.all())
-
-            # Берем по 3 случайных игрока из каждой команды
-            participants = []
-            if home_players:
-                participants.extend(random.sample(home_players, min(len(home_players), 3)))
-            if away_players:
-                participants.extend(random.sample(away_players, min(len(away_players), 3)))
-
-            for p in participants:
-                MatchParticipation.objects.create(
-                    match=match,
-                    athlete=p,
-                    goals_scored=random.choice([0, 0, 0, 1, 2]),  # Чаще 0 голов
-                    minutes_played=random.randint(10, 90),
-                    yellow_card=random.choice([True, False, False, False])
-                )
-
-        self.stdout.write("Статистика игроков сгенерирована")
-
-        # 8. Теги
-        tags = []
-        for _ in range(10):
-            tag_name = fake.word()
-            tag, _ = Tag.objects.get_or_create(name=tag_name, slug=tag_name)
-            tags.append(tag)
-
-        # 9. Новости (Статьи)
-        for _ in range(20):
-            title = fake.sentence(nb_words=6)
-            # Создаем статью
-            article = Article.objects.create(
-                title=title,
-                # Слаг генерируется сам в save(), его не пишем
-                content=fake.text(max_nb_chars=2000),
-                author=random.choice(users),
+            for team in teams for _ in range(per_team)
+        )
+        return self.bulk('Спортсмены', Athlete, rows, per_team * len(teams))
+
+    def matches(self, tournaments, teams, athletes, total, players_per_side):
+        """
+        Матчи и статистика игроков. Матчи создаются пачками, и для каждой пачки сразу
+        создаются строки MatchParticipation - все матчи в памяти не держим.
+        """
+        # Команды и составы собираем один раз, а не запросом на каждый матч
+        teams_by_sport = {}
+        for team in teams:
+            teams_by_sport.setdefault(team.sport_id, []).append(team)
+        players_by_team = {}
+        for athlete in athletes:
+            players_by_team.setdefault(athlete.current_team_id, []).append(athlete.pk)
+        tournaments = [t for t in tournaments if len(teams_by_sport.get(t.sport_id, [])) >= 2]
+        if not tournaments:
+            return 0, 0
+
+        started = time.monotonic()
+        done = participations = 0
+        while done < total:
+            size = min(self.batch_size, total - done)
+            batch = [self._match(tournaments, teams_by_sport) for _ in range(size)]
+            with transaction.atomic():
+                batch = Match.objects.bulk_create(batch, batch_size=self.batch_size)
+                rows = [
+                    self._participation(match, athlete_id)
+                    for match in batch
+                    for team_id in (match.home_team_id, match.away_team_id)
+                    for athlete_id in self._sample(players_by_team.get(team_id, []), players_per_side)
+                ]
+                MatchParticipation.objects.bulk_create(rows, batch_size=self.batch_size)
+            done += size
+            participations += len(rows)
+            self.report('Матчи', done, total, started)
+        return done, participations
+
+    def _sample(self, population, k):
+        return self.rng.sample(population, min(len(population), k))
+
+    def _match(self, tournaments, teams_by_sport):
+        tournament = self.rng.choice(tournaments)
+        home, away = self.rng.sample(teams_by_sport[tournament.sport_id], 2)
+        return Match(
+            tournament=tournament,
+            home_team_id=home.pk,
+            away_team_id=away.pk,
+            date_time=self.now + timedelta(seconds=self.rng.randint(-365 * 86400, 365 * 86400)),
+            status=self.rng.choice(['scheduled', 'live', 'finished']),
+            score_home=self.rng.randint(0, 5),
+            score_away=self.rng.randint(0, 5),
+        )
+
+    def _participation(self, match, athlete_id):
+        return MatchParticipation(
+            match_id=match.pk,
+            athlete_id=athlete_id,
+            goals_scored=self.rng.choice([0, 0, 0, 1, 2]),  # Чаще 0 голов
+            minutes_played=self.rng.randint(10, 90),
+            yellow_card=self.rng.choice([True, False, False, False]),
+        )
+
+    def tags(self, total):
+        number = self.next_number(Tag)
+        rows = (Tag(name=self.fake.word(), slug=f"tag-{number + i}") for i in range(total))
+        return self.bulk('Теги', Tag, rows, total)
+
+    def articles(self, users, tags, teams, total):
+        number = self.next_number(Article)
+        rows = (
+            Article(
+                title=self.fake.sentence(nb_words=6),
+                # save() не вызывается, поэтому слаг задаем сами
+                slug=f"article-{number + i}",
+                content=self.fake.text(max_nb_chars=2000),
+                author=self.rng.choice(users),
+                created_at=self.now - timedelta(seconds=self.rng.randint(0, 365 * 86400)),
                 is_published=True,
-                # match=random.choice(matches) # Можно привязать к случайному матчу
             )
+            for i in range(total)
+        )
+        articles = self.bulk('Статьи', Article, rendered(rows), total)
+
+        # M2M связи - тоже пачками, напрямую в промежуточные таблицы
+        article_tags = (
+            Article.tags.through(article_id=article.pk, tag_id=tag.pk)
+            for article in articles for tag in self._sample(tags, self.rng.randint(1, 3))
+        )
+        self.bulk('Теги статей', Article.tags.through, article_tags, total * 2)
+        article_teams = (
+            Article.related_teams.through(article_id=article.pk, team_id=team.pk)
+            for article in articles for team in self._sample(teams, self.rng.randint(0, 2))
+        )
+        self.bulk('Команды статей', Article.related_teams.through, article_teams, total)
+        return articles
 
-            # Добавляем M2M связи
-            article.tags.set(random.sample(tags, random.randint(1, 3)))
+    def generate(self, counts):
+        started = time.monotonic()
+        users = self.users()
+        sports = self.sports()
+        self.log(f"Видов спорта: {len(sports)}")
+
+        tournaments = self.tournaments(sports, counts['tournaments_per_sport'])
+        teams = self.teams(sports, counts['teams_per_sport'])
+        athletes = self.athletes(teams, counts['athletes_per_team'])
+        matches, participations = self.matches(
+            tournaments, teams, athletes, counts['matches'], counts['players_per_side']
+        )
+        tags = self.tags(counts['tags'])
+        articles = self.articles(users, tags, teams, counts['articles'])
+
+        # bulk_create обходит сигналы: пересчитываем агрегаты и сбрасываем кэши
+        self.log("Пересчет турнирных таблиц и рейтингов...")
+        rebuild_standings()
+        rebuild_leaderboards()
+        rebuild_related()
+        cache.bump_version(cache.LATEST_NEWS, cache.ACTIVE_TOURNAMENTS)
+        page_cache.purge(page_cache.ARTICLES, page_cache.MATCHES, page_cache.TOURNAMENTS)
+
+        return {
+            'tournaments': len(tournaments),
+            'teams': len(teams),
+            'athletes': len(athletes),
+            'matches': matches,
+            'participations': participations,
+            'tags': len(tags),
+            'articles': len(articles),
+            'seconds': round(time.monotonic() - started, 2),
+        }
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу данных тестовыми данными'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1,
+                            help='Множитель объемов (турниры, команды, матчи, теги, статьи)')
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Зерно генератора: одинаковое зерно - одинаковые данные')
+        parser.add_argument('--reference-date', type=date.fromisoformat, default=None,
+                            help='Опорная дата YYYY-MM-DD, от которой считаются даты матчей, статей и рождения '
+                                 '(по умолчанию - сегодня)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Размер пачки bulk_create')
+        for name in BASE_COUNTS:
+            parser.add_argument(f"--{name.replace('_', '-')}", type=int, dest=name, default=None,
+                                help=f'Явное количество ({name}), перекрывает --scale')
+
+    def handle(self, *args, **options):
+        if options['scale'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--scale и --batch-size должны быть положительными')
+
+        counts = counts_for_scale(options['scale'], **{name: options[name] for name in BASE_COUNTS})
+        self.stdout.write("Начинаем заполнение БД...")
+        self.stdout.write(', '.join(f"{name}={value}" for name, value in counts.items()))
 
-            # Привязываем случайные команды
-            random_teams = random.sample(teams, random.randint(0, 2))
-            article.related_teams.set(random_teams)
+        generator = DataGenerator(seed=options['seed'], batch_size=options['batch_size'], stdout=self.stdout,
+                                  reference_date=options['reference_date'])
+        self.stdout.write(f"Опорная дата: {generator.reference_date.isoformat()}")
+        summary = generator.generate(counts)
 
-        self.stdout.write(self.style.SUCCESS('УСПЕШНО: База данных заполнена!'))
\ No newline at end of file
+        self.stdout.write(', '.join(f"{name}: {value}" for name, value in summary.items()))
+        self.stdout.write(self.style.SUCCESS('УСПЕШНО: База данных заполнена!'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from sports.leaderboards import rebuild_leaderboards
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинги игроков (AthleteStats) по всей статистике матчей'
+
+    def handle(self, *args, **options):
+        rows = rebuild_leaderboards()
+        self.stdout.write(self.style.SUCCESS(f'Рейтинги игроков пересчитаны, строк: {rows}'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from sports.related import rebuild_related
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает списки похожих новостей (RelatedArticle) для всех статей'
+
+    def handle(self, *args, **options):
+        rows = rebuild_related()
+        self.stdout.write(self.style.SUCCESS(f'Похожие новости пересчитаны, строк: {rows}'))
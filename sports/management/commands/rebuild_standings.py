@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from sports.models import Tournament
+from sports.standings import rebuild_standings
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает турнирные таблицы с нуля (после массовой загрузки данных)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*', help='Слаги турниров (по умолчанию - все турниры)')
+
+    def handle(self, *args, **options):
+        tournaments = None
+        if options['slugs']:
+            tournaments = list(Tournament.objects.filter(slug__in=options['slugs']))
+            if len(tournaments) != len(set(options['slugs'])):
+                raise CommandError('Некоторые турниры не найдены')
+
+        rows = rebuild_standings(tournaments)
+        self.stdout.write(self.style.SUCCESS(f'Турнирные таблицы пересчитаны, строк: {rows}'))
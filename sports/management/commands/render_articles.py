@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from sports.models import Article
+
+
+class Command(BaseCommand):
+    help = 'Заполняет excerpt и content_html статей (после миграции или массовой загрузки)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Пересчитать все статьи, а не только те, где поля еще пустые')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        articles = Article.objects.only('pk', 'content')
+        if not options['all']:
+            articles = articles.filter(content_html='').exclude(content='')
+
+        # Пачками по pk, а не iterator(): SQLite не любит запись в таблицу, пока по ней открыт курсор.
+        # bulk_update без save(): сигналы и updated_at не трогаем - страницы выглядят так же, как раньше
+        total = last_pk = 0
+        while True:
+            batch = list(articles.filter(pk__gt=last_pk).order_by('pk')[:options['batch_size']])
+            if not batch:
+                break
+            for article in batch:
+                article.render_content()
+            total += Article.objects.bulk_update(batch, ['excerpt', 'content_html'])
+            last_pk = batch[-1].pk
+        self.stdout.write(self.style.SUCCESS(f'Статей обработано: {total}'))
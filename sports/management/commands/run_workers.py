@@ -0,0 +1,85 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+from sports import jobs
+
+
+def run_threads(threads, burst, poll_interval, stop=None):
+    """Пул потоков одного процесса; каждый поток - отдельный воркер со своим соединением."""
+    stop = stop or threading.Event()
+    done = []
+
+    def worker():
+        try:
+            done.append(jobs.work(stop, burst=burst, poll_interval=poll_interval))
+        finally:
+            connection.close()
+
+    pool = [threading.Thread(target=worker, name=f'worker-{number}') for number in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return sum(done)
+
+
+def run_process(threads, burst, poll_interval):
+    # Дочерний процесс: по SIGTERM/SIGINT доделываем текущие задачи и выходим
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: stop.set())
+    run_threads(threads, burst, poll_interval, stop)
+
+
+class Command(BaseCommand):
+    help = 'Запускает воркеры фоновых задач (очередь sports.Job)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Сколько процессов (для задач, грузящих CPU)')
+        parser.add_argument('--threads', type=int, default=2, help='Сколько потоков в каждом процессе (для задач с I/O)')
+        parser.add_argument('--burst', action='store_true', help='Выйти, когда очередь опустеет (cron, CI)')
+        parser.add_argument('--poll-interval', type=float, default=None,
+                            help='Пауза между проверками пустой очереди, секунд (по умолчанию JOB_POLL_INTERVAL)')
+
+    def handle(self, *args, **options):
+        requeued = jobs.requeue_stale()
+        if requeued:
+            self.stdout.write(f'Возвращено в очередь зависших задач: {requeued}')
+
+        threads, burst, poll_interval = options['threads'], options['burst'], options['poll_interval']
+        self.stdout.write(f"Воркеры: {options['processes']} x {threads}")
+        if options['processes'] == 1:
+            stop = threading.Event()
+            previous = {signum: signal.signal(signum, lambda *args: stop.set())
+                        for signum in (signal.SIGTERM, signal.SIGINT)}
+            try:
+                done = run_threads(threads, burst, poll_interval, stop)
+            finally:
+                for signum, handler in previous.items():
+                    signal.signal(signum, handler)
+            self.stdout.write(self.style.SUCCESS(f'Выполнено задач: {done}'))
+            return
+
+        # Соединения родителя не должны достаться дочерним процессам
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=run_process, args=(threads, burst, poll_interval))
+            for _ in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+
+        def shutdown(*args):
+            # SIGTERM дочерним: каждый доделает текущие задачи и выйдет
+            for process in processes:
+                process.terminate()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+        for process in processes:
+            process.join()
+        self.stdout.write(self.style.SUCCESS('Воркеры остановлены'))
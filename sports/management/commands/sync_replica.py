@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from sports.routers import copy_database
+
+
+class Command(BaseCommand):
+    help = 'Обновляет реплики для чтения копией основной SQLite-базы (sqlite backup API)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*',
+                            help='Какие реплики обновить (по умолчанию все sqlite-базы, кроме default)')
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('sync_replica копирует только SQLite; для других СУБД нужна их репликация')
+
+        aliases = options['aliases'] or [
+            alias for alias, config in settings.DATABASES.items()
+            if alias != 'default' and config['ENGINE'] == primary['ENGINE']
+        ]
+        for alias in aliases:
+            if alias not in settings.DATABASES or alias == 'default':
+                raise CommandError(f'Неизвестная реплика: {alias}')
+            started = time.perf_counter()
+            copy_database(str(primary['NAME']), str(settings.DATABASES[alias]['NAME']))
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(f'Реплика {alias} обновлена за {elapsed:.2f} с'))
@@ -0,0 +1,271 @@
+import contextvars
+import hmac
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates, Template
+from django.urls import Resolver404, resolve
+
+from .instrumentation import QueryStats
+
+'''
+Метрики в формате Prometheus (text exposition) на /metrics.
+Каждый процесс копит приращения в памяти и раз в METRICS_FLUSH_INTERVAL секунд сбрасывает
+их в общий файл SQLite (UPSERT value = value + приращение). /metrics читает этот файл,
+поэтому при нескольких воркерах видно сумму по всем процессам, а не только по тому,
+кому достался запрос.
+Все метрики размечены именем URL (home, article_list, article_detail...).
+'''
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Имя -> (тип, описание). Для гистограмм в хранилище лежат ряды _bucket/_sum/_count
+METRICS = {
+    'sports_http_requests_total': ('counter', 'Запросы по имени URL и коду ответа'),
+    'sports_http_request_duration_seconds': ('histogram', 'Время обработки запроса'),
+    'sports_http_response_size_bytes': ('histogram', 'Размер ответа (без потоковых)'),
+    'sports_db_queries_total': ('counter', 'SQL-запросы'),
+    'sports_db_query_seconds_total': ('counter', 'Время в SQL-запросах'),
+    'sports_template_seconds_total': ('counter', 'Время рендера шаблонов (включая ленивые запросы)'),
+    'sports_cache_requests_total': ('counter', 'Обращения к кэшу страниц и фрагментов'),
+}
+
+_pending = {}
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+_local = threading.local()
+
+# Замер текущего запроса: время в шаблонах и обращения к кэшу
+_current = contextvars.ContextVar('sports_request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.template_seconds = 0.0
+        self.template_depth = 0
+        self.cache = []
+
+
+# хранилище
+
+def _store_path():
+    return str(getattr(settings, 'METRICS_STORE', settings.BASE_DIR / 'metrics.sqlite3'))
+
+
+def _store():
+    path = _store_path()
+    connection = getattr(_local, 'connections', {}).get(path)
+    if connection is None:
+        connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS metrics ('
+            'name TEXT NOT NULL, labels TEXT NOT NULL, value REAL NOT NULL, PRIMARY KEY (name, labels))'
+        )
+        _local.__dict__.setdefault('connections', {})[path] = connection
+    return connection
+
+
+def _labels_key(labels):
+    return json.dumps(sorted(labels.items()), ensure_ascii=False)
+
+
+def inc(name, labels, value=1):
+    key = (name, _labels_key(labels))
+    with _pending_lock:
+        _pending[key] = _pending.get(key, 0) + value
+
+
+def observe(name, labels, value, buckets):
+    for bound in buckets:
+        if value <= bound:
+            inc(f'{name}_bucket', {**labels, 'le': str(bound)})
+    inc(f'{name}_bucket', {**labels, 'le': '+Inf'})
+    inc(f'{name}_sum', labels, value)
+    inc(f'{name}_count', labels)
+
+
+def flush():
+    global _last_flush
+    with _pending_lock:
+        rows = [(name, labels, value) for (name, labels), value in _pending.items()]
+        _pending.clear()
+        _last_flush = time.monotonic()
+    if not rows:
+        return
+    try:
+        connection = _store()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.executemany(
+                'INSERT INTO metrics (name, labels, value) VALUES (?, ?, ?) '
+                'ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value',
+                rows,
+            )
+    except sqlite3.Error:
+        # Хранилище занято или недоступно - приращения не теряем, сбросим в следующий раз
+        with _pending_lock:
+            for name, labels, value in rows:
+                _pending[(name, labels)] = _pending.get((name, labels), 0) + value
+
+
+def maybe_flush():
+    if time.monotonic() - _last_flush >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 5):
+        flush()
+
+
+def reset():
+    # Для тестов: очистить и буфер процесса, и общее хранилище
+    with _pending_lock:
+        _pending.clear()
+    if os.path.exists(_store_path()):
+        _store().execute('DELETE FROM metrics')
+
+
+# сбор
+
+def record_cache(kind, hit):
+    """Вызывается кэшем фрагментов; попадания кэша страниц middleware берет из request."""
+    state = _current.get()
+    if state is not None:
+        state.cache.append((kind, 'hit' if hit else 'miss'))
+
+
+def url_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return 'unmatched'
+    return match.view_name or 'unnamed'
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        state = _current.get()
+        if state is None:
+            return super().render(context, request)
+        # Вложенный render_to_string (виджеты) уже учтен во внешнем шаблоне
+        state.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            state.template_depth -= 1
+            if not state.template_depth:
+                state.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Обычный бэкенд DjangoTemplates, который замеряет время рендера для метрик."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+class MetricsMiddleware:
+    """
+    Считает время, SQL, размер ответа и попадания в кэш для каждого запроса
+    и добавляет заголовок Server-Timing (db, tpl, total). Ставится первым в MIDDLEWARE,
+    чтобы в замер попадал и кэш страниц.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RequestMetrics()
+        token = _current.set(state)
+        started = time.perf_counter()
+        try:
+            with QueryStats() as db:
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - started
+
+        name = url_name(request)
+        labels = {'view': name}
+        inc('sports_http_requests_total', {**labels, 'status': str(response.status_code)})
+        observe('sports_http_request_duration_seconds', labels, total, LATENCY_BUCKETS)
+        if not response.streaming:
+            observe('sports_http_response_size_bytes', labels, len(response.content), SIZE_BUCKETS)
+        inc('sports_db_queries_total', labels, db.queries)
+        inc('sports_db_query_seconds_total', labels, db.seconds)
+        inc('sports_template_seconds_total', labels, state.template_seconds)
+        page_status = getattr(request, 'page_cache_status', None)
+        if page_status:
+            state.cache.append(('page', page_status))
+        for kind, result in state.cache:
+            inc('sports_cache_requests_total', {**labels, 'cache': kind, 'result': result})
+        maybe_flush()
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={db.seconds * 1000:.1f};desc="{db.queries} queries"',
+            f'tpl;dur={state.template_seconds * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+        return response
+
+
+# вывод
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + pairs + '}'
+
+
+def _base_name(name):
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+            return name[:-len(suffix)]
+    return name
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def _sample_order(sample):
+    # Корзины гистограммы - по возрастанию границы, +Inf последней
+    name, labels, value = sample
+    le = dict(labels).get('le')
+    return name, [pair for pair in labels if pair[0] != 'le'], float(le) if le else 0
+
+
+def has_token(request):
+    """Запрос сервера Prometheus: Authorization: Bearer <METRICS_TOKEN>."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode())
+
+
+def exposition():
+    flush()
+    rows = _store().execute('SELECT name, labels, value FROM metrics').fetchall()
+    series = {}
+    for name, labels, value in rows:
+        series.setdefault(_base_name(name), []).append((name, json.loads(labels), value))
+
+    lines = []
+    for base, samples in sorted(series.items()):
+        kind, description = METRICS.get(base, ('untyped', ''))
+        lines.append(f'# HELP {base} {description}')
+        lines.append(f'# TYPE {base} {kind}')
+        for name, labels, value in sorted(samples, key=_sample_order):
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:23
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='article',
+            options={'ordering': ['-created_at']},
+        ),
+        migrations.AlterField(
+            model_name='article',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Article creation time'),
+        ),
+        migrations.AlterField(
+            model_name='article',
+            name='slug',
+            field=models.SlugField(blank=True, help_text='URL', unique=True),
+        ),
+        migrations.AlterField(
+            model_name='match',
+            name='status',
+            field=models.CharField(choices=[('scheduled', 'Запланирован'), ('live', 'Идет'), ('finished', 'Завершился'), ('canceled', 'Отменен')], default='scheduled', max_length=200, verbose_name='Status'),
+        ),
+        migrations.CreateModel(
+            name='MatchParticipation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('goals_scored', models.PositiveIntegerField(default=0, verbose_name='Goals')),
+                ('minutes_played', models.PositiveIntegerField(default=90, verbose_name='Minutes played')),
+                ('yellow_card', models.BooleanField(default=False, verbose_name='Yellow card?')),
+                ('athlete', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sports.athlete')),
+                ('match', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sports.match')),
+            ],
+            options={
+                'verbose_name': 'Player statistics',
+            },
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='players',
+            field=models.ManyToManyField(blank=True, related_name='matches_played', through='sports.MatchParticipation', to='sports.athlete'),
+        ),
+        migrations.CreateModel(
+            name='TournamentStanding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('played', models.PositiveIntegerField(default=0, verbose_name='Played')),
+                ('won', models.PositiveIntegerField(default=0, verbose_name='Won')),
+                ('drawn', models.PositiveIntegerField(default=0, verbose_name='Drawn')),
+                ('lost', models.PositiveIntegerField(default=0, verbose_name='Lost')),
+                ('goals_for', models.PositiveIntegerField(default=0, verbose_name='Goals for')),
+                ('goals_against', models.PositiveIntegerField(default=0, verbose_name='Goals against')),
+                ('points', models.PositiveIntegerField(default=0, verbose_name='Points')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='standings', to='sports.team')),
+                ('tournament', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='standings', to='sports.tournament')),
+            ],
+            options={
+                'verbose_name': 'Standing',
+                'indexes': [models.Index(fields=['tournament', '-points'], name='standing_tournament_points')],
+                'constraints': [models.UniqueConstraint(fields=('tournament', 'team'), name='unique_tournament_team_standing')],
+            },
+        ),
+    ]
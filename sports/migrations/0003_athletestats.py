@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sports', '0002_matchparticipation_tournamentstanding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AthleteStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('matches', models.PositiveIntegerField(default=0, verbose_name='Matches')),
+                ('goals', models.PositiveIntegerField(default=0, verbose_name='Goals')),
+                ('minutes', models.PositiveIntegerField(default=0, verbose_name='Minutes played')),
+                ('yellow_cards', models.PositiveIntegerField(default=0, verbose_name='Yellow cards')),
+                ('athlete', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='sports.athlete')),
+                ('sport', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='athlete_stats', to='sports.sport')),
+                ('tournament', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='athlete_stats', to='sports.tournament')),
+            ],
+            options={
+                'verbose_name': 'Athlete statistics',
+                'verbose_name_plural': 'Athlete statistics',
+                'indexes': [models.Index(fields=['tournament', '-goals'], name='stats_tournament_goals'), models.Index(fields=['tournament', '-minutes'], name='stats_tournament_minutes'), models.Index(fields=['tournament', '-yellow_cards'], name='stats_tournament_cards'), models.Index(condition=models.Q(('tournament__isnull', True)), fields=['sport', '-goals'], name='stats_sport_goals'), models.Index(condition=models.Q(('tournament__isnull', True)), fields=['sport', '-minutes'], name='stats_sport_minutes'), models.Index(condition=models.Q(('tournament__isnull', True)), fields=['sport', '-yellow_cards'], name='stats_sport_cards')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('tournament__isnull', False)), fields=('athlete', 'tournament'), name='unique_athlete_tournament_stats'), models.UniqueConstraint(condition=models.Q(('tournament__isnull', True)), fields=('athlete', 'sport'), name='unique_athlete_sport_stats')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from sports.search import install_fts, uninstall_fts
+
+
+def create_index(apps, schema_editor):
+    # Заполняем индекс уже существующими статьями
+    install_fts(schema_editor.connection, rebuild=True)
+
+
+def drop_index(apps, schema_editor):
+    uninstall_fts(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sports', '0003_athletestats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
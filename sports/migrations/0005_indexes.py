@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:40
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_participations(apps, schema_editor):
+    # Перед уникальным ограничением оставляем по одной строке (самой ранней) на пару матч-игрок.
+    # После миграции рейтинги стоит пересчитать: manage.py rebuild_leaderboards
+    MatchParticipation = apps.get_model('sports', 'MatchParticipation')
+    keep = (
+        MatchParticipation.objects.values('match', 'athlete')
+        .annotate(keep_id=Min('id'))
+        .values('keep_id')
+    )
+    duplicates = MatchParticipation.objects.exclude(id__in=keep)
+    duplicates.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sports', '0004_article_fts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-created_at', '-id'], name='article_published_created'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['date_time'], name='match_date_time'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['status', 'date_time'], name='match_status_date_time'),
+        ),
+        migrations.AddIndex(
+            model_name='tournament',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['name'], name='tournament_active_name'),
+        ),
+        migrations.RunPython(remove_duplicate_participations, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='matchparticipation',
+            constraint=models.UniqueConstraint(fields=('match', 'athlete'), name='unique_match_athlete'),
+        ),
+    ]
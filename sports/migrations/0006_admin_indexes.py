@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:55
+
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sports', '0005_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['-created_at', '-id'], name='article_created'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(django.db.models.functions.comparison.Collate('title', 'NOCASE'), name='article_title_nocase'),
+        ),
+        migrations.AddIndex(
+            model_name='athlete',
+            index=models.Index(django.db.models.functions.comparison.Collate('last_name', 'NOCASE'), name='athlete_last_name_nocase'),
+        ),
+        migrations.AddIndex(
+            model_name='athlete',
+            index=models.Index(django.db.models.functions.comparison.Collate('first_name', 'NOCASE'), name='athlete_first_name_nocase'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sports', '0007_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Image renditions'),
+        ),
+        migrations.AddField(
+            model_name='athlete',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Image renditions'),
+        ),
+        migrations.AddField(
+            model_name='sport',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Image renditions'),
+        ),
+        migrations.AddField(
+            model_name='team',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Image renditions'),
+        ),
+    ]
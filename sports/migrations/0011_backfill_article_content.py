@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:20
+
+from django.db import migrations
+from django.utils.html import linebreaks
+from django.utils.text import Truncator
+
+
+def render_existing_articles(apps, schema_editor):
+    # Старые статьи после 0009 остались с пустыми excerpt/content_html - рендерим так же,
+    # как Article.render_content(). Идем пачками по pk, чтобы не держать весь текст в памяти
+    Article = apps.get_model('sports', 'Article')
+    last = 0
+    while True:
+        batch = list(
+            Article.objects.filter(pk__gt=last, content_html='')
+            .exclude(content='')
+            .only('pk', 'content')
+            .order_by('pk')[:500]
+        )
+        if not batch:
+            break
+        for article in batch:
+            article.excerpt = Truncator(article.content).words(30, truncate=' …')
+            article.content_html = linebreaks(article.content, autoescape=True)
+        Article.objects.bulk_update(batch, ['excerpt', 'content_html'])
+        last = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sports', '0010_related_article'),
+    ]
+
+    operations = [
+        migrations.RunPython(render_existing_articles, migrations.RunPython.noop),
+    ]
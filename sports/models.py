@@ -1,6 +1,7 @@
 import uuid
 
 from django.db import models
+from django.db.models.functions import Collate
 from django.utils import timezone
 from django.urls import reverse
 
@@ -15,15 +16,54 @@ from django.urls import reverse
 '''
 
 from django.contrib.auth.models import User
-from django.utils.text import slugify
+from django.utils.html import linebreaks
+from django.utils.text import Truncator, slugify
+
+
+class TrackedFieldsMixin:
+    # Запоминает значения полей из tracked_fields в момент загрузки из БД,
+    # чтобы обработчики сигналов могли посчитать разницу без лишнего запроса
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_tracked_fields()
+        return instance
+
+    def remember_tracked_fields(self):
+        # Отложенные (defer) поля в __dict__ отсутствуют - их не запоминаем
+        self._loaded_values = {
+            name: self.__dict__[name] for name in self.tracked_fields if name in self.__dict__
+        }
+
+    @property
+    def loaded_values(self):
+        # Пустой словарь для объектов, которые еще не сохранялись в БД
+        return getattr(self, '_loaded_values', {})
+
+    def save(self, *args, **kwargs):
+        missing = set(self.tracked_fields) - set(self.loaded_values)
+        if missing and not self._state.adding and self.pk is not None:
+            # Объект загружен через only()/defer() - дочитываем исходные значения
+            row = type(self)._base_manager.filter(pk=self.pk).values(*missing).first() or {}
+            self._loaded_values = {**self.loaded_values, **row}
+        super().save(*args, **kwargs)
+        # post_save уже отработал со старыми значениями, обновляем снимок
+        self.remember_tracked_fields()
 
 
 #справочники
 
-class Sport(models.Model):
+class Sport(TrackedFieldsMixin, models.Model):
     name = models.CharField("Sport name", max_length=200)
     slug = models.SlugField(unique=True, help_text="URL")
     icon = models.ImageField("Icon", upload_to="sports/icons", blank=True, null=True)
+    # Уменьшенные копии картинки: {'thumb': {'webp': путь, 'jpeg': путь, 'width': .., 'height': ..}}
+    # Заполняет фоновая задача (см. renditions.py), по ней же видно, что картинку надо пересобрать
+    renditions = models.JSONField("Image renditions", default=dict, blank=True, editable=False)
+
+    tracked_fields = ('icon',)
     #Фотографии и логотипы могут быть пустыми ввиду их отсутствия у редактора.
     #Лучше иметь статью или сводку без изображений, чем вообще ничего
 
@@ -31,7 +71,7 @@ class Sport(models.Model):
         return self.name
 
 
-class Tournament(models.Model):
+class Tournament(TrackedFieldsMixin, models.Model):
     name = models.CharField("Tournament name", max_length=200)
     sport = models.ForeignKey(Sport, on_delete=models.CASCADE, related_name="tournaments")
     slug = models.SlugField(unique=True)
@@ -39,13 +79,22 @@ class Tournament(models.Model):
     #description can be empty
     description = models.TextField("Description", blank=True)
 
+    # Поля, которые показывает виджет активных турниров
+    tracked_fields = ('is_active', 'name', 'sport_id')
+
+    class Meta:
+        indexes = [
+            # Виджет активных турниров: is_active=True ORDER BY name (частичный - см. Article)
+            models.Index(fields=['name'], condition=models.Q(is_active=True), name='tournament_active_name'),
+        ]
+
     def __str__(self):
         return f"{self.name} - {self.sport.name}"
 
 
 #участники
 
-class Team(models.Model):
+class Team(TrackedFieldsMixin, models.Model):
     name = models.CharField("Team name", max_length=200)
     short_name = models.CharField("Team short name", max_length=200, blank=True)
     sport = models.ForeignKey(Sport, on_delete=models.CASCADE, related_name="teams")
@@ -54,11 +103,16 @@ class Team(models.Model):
 
     slug = models.SlugField(unique=True, help_text="URL")
 
+    # Уменьшенные копии логотипа (см. Sport.renditions)
+    renditions = models.JSONField("Image renditions", default=dict, blank=True, editable=False)
+
+    tracked_fields = ('logo',)
+
     def __str__(self):
         return self.name
 
 
-class Athlete(models.Model):
+class Athlete(TrackedFieldsMixin, models.Model):
     first_name = models.CharField("Athlete first name", max_length=200)
     last_name = models.CharField("Athlete last name", max_length=200)
 
@@ -68,16 +122,28 @@ class Athlete(models.Model):
 
     birth_date = models.DateField("Birth date", blank=True, null=True)
     photo = models.ImageField("Photo", upload_to="athletes/", blank=True, null=True)
+    # Уменьшенные копии фото (см. Sport.renditions)
+    renditions = models.JSONField("Image renditions", default=dict, blank=True, editable=False)
 
     position = models.CharField("Position", max_length=200, blank=True)
 
+    tracked_fields = ('photo',)
+
+    class Meta:
+        indexes = [
+            # Поиск в админке по началу фамилии/имени ('^' в search_fields): LIKE 'абв%' без учета
+            # регистра SQLite ведет по индексу, только если индекс с COLLATE NOCASE
+            models.Index(Collate('last_name', 'NOCASE'), name='athlete_last_name_nocase'),
+            models.Index(Collate('first_name', 'NOCASE'), name='athlete_first_name_nocase'),
+        ]
+
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
 
 #события
 
-class Match(models.Model):
+class Match(TrackedFieldsMixin, models.Model):
     #choices в поле модели
     STATUS_CHOICES = (
         ("scheduled", "Запланирован"),
@@ -110,14 +176,23 @@ class Match(models.Model):
         blank=True
     )
 
+    # Поля, от которых зависит турнирная таблица
+    tracked_fields = ('tournament_id', 'home_team_id', 'away_team_id', 'status', 'score_home', 'score_away')
+
     class Meta:
         ordering = ["-date_time"]  #class metadata: order by game start time
+        indexes = [
+            # Сортировка по умолчанию и окно матчей на главной
+            models.Index(fields=['date_time'], name='match_date_time'),
+            # Матчи по статусу (трансляция live, фильтр в админке) в порядке времени
+            models.Index(fields=['status', 'date_time'], name='match_status_date_time'),
+        ]
 
     def __str__(self):
         return f"{self.home_team.name} vs {self.away_team.name}"
 
     # промежуточная модель для through
-class MatchParticipation(models.Model):
+class MatchParticipation(TrackedFieldsMixin, models.Model):
     match = models.ForeignKey(Match, on_delete=models.CASCADE)
     athlete = models.ForeignKey(Athlete, on_delete=models.CASCADE)
 
@@ -126,8 +201,86 @@ class MatchParticipation(models.Model):
     minutes_played = models.PositiveIntegerField("Minutes played", default=90)
     yellow_card = models.BooleanField("Yellow card?", default=False)
 
+    # Поля, от которых зависят рейтинги игроков (AthleteStats)
+    tracked_fields = ('match_id', 'athlete_id', 'goals_scored', 'minutes_played', 'yellow_card')
+
     class Meta:
         verbose_name = "Player statistics"
+        constraints = [
+            # Один игрок - одна строка статистики на матч
+            models.UniqueConstraint(fields=['match', 'athlete'], name='unique_match_athlete'),
+        ]
+
+
+# Материализованная турнирная таблица.
+# Строки обновляются инкрементально сигналами Match (см. signals.py),
+# полный пересчет - командой rebuild_standings
+class TournamentStanding(models.Model):
+    tournament = models.ForeignKey(Tournament, on_delete=models.CASCADE, related_name="standings")
+    team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name="standings")
+
+    played = models.PositiveIntegerField("Played", default=0)
+    won = models.PositiveIntegerField("Won", default=0)
+    drawn = models.PositiveIntegerField("Drawn", default=0)
+    lost = models.PositiveIntegerField("Lost", default=0)
+    goals_for = models.PositiveIntegerField("Goals for", default=0)
+    goals_against = models.PositiveIntegerField("Goals against", default=0)
+    points = models.PositiveIntegerField("Points", default=0)
+
+    class Meta:
+        verbose_name = "Standing"
+        constraints = [
+            models.UniqueConstraint(fields=['tournament', 'team'], name='unique_tournament_team_standing'),
+        ]
+        indexes = [
+            models.Index(fields=['tournament', '-points'], name='standing_tournament_points'),
+        ]
+
+    def __str__(self):
+        return f"{self.team_id} @ {self.tournament_id}: {self.points}"
+
+    @property
+    def goal_difference(self):
+        return self.goals_for - self.goals_against
+
+# Денормализованные счетчики игрока для рейтингов (бомбардиры, минуты, карточки).
+# tournament = NULL - итог по виду спорта за все турниры.
+# Обновляются сигналами MatchParticipation, полный пересчет - командой rebuild_leaderboards
+class AthleteStats(models.Model):
+    athlete = models.ForeignKey(Athlete, on_delete=models.CASCADE, related_name="stats")
+    sport = models.ForeignKey(Sport, on_delete=models.CASCADE, related_name="athlete_stats")
+    tournament = models.ForeignKey(Tournament, on_delete=models.CASCADE, related_name="athlete_stats",
+                                   null=True, blank=True)
+
+    matches = models.PositiveIntegerField("Matches", default=0)
+    goals = models.PositiveIntegerField("Goals", default=0)
+    minutes = models.PositiveIntegerField("Minutes played", default=0)
+    yellow_cards = models.PositiveIntegerField("Yellow cards", default=0)
+
+    class Meta:
+        verbose_name = "Athlete statistics"
+        verbose_name_plural = "Athlete statistics"
+        constraints = [
+            models.UniqueConstraint(fields=['athlete', 'tournament'], condition=models.Q(tournament__isnull=False),
+                                    name='unique_athlete_tournament_stats'),
+            models.UniqueConstraint(fields=['athlete', 'sport'], condition=models.Q(tournament__isnull=True),
+                                    name='unique_athlete_sport_stats'),
+        ]
+        # Лидерборд = чтение первых N строк по индексу
+        indexes = [
+            models.Index(fields=['tournament', '-goals'], name='stats_tournament_goals'),
+            models.Index(fields=['tournament', '-minutes'], name='stats_tournament_minutes'),
+            models.Index(fields=['tournament', '-yellow_cards'], name='stats_tournament_cards'),
+            models.Index(fields=['sport', '-goals'], condition=models.Q(tournament__isnull=True),
+                         name='stats_sport_goals'),
+            models.Index(fields=['sport', '-minutes'], condition=models.Q(tournament__isnull=True),
+                         name='stats_sport_minutes'),
+            models.Index(fields=['sport', '-yellow_cards'], condition=models.Q(tournament__isnull=True),
+                         name='stats_sport_cards'),
+        ]
+
+    def __str__(self):
+        return f"{self.athlete_id}: {self.goals}"
 
 #контент
 
@@ -144,10 +297,14 @@ class Tag(models.Model):
         return self.name
 
 
-class Article(models.Model):
+class Article(TrackedFieldsMixin, models.Model):
     title = models.CharField("Title", max_length=200)
     slug = models.SlugField(unique=True, blank=True, help_text="URL")
     content = models.TextField("Article content", blank=True)
+    # Считаются из content в save() (см. render_content): списки и страница статьи
+    # не гоняют фильтры truncatewords/linebreaks по всему тексту на каждый запрос
+    excerpt = models.TextField("Excerpt", blank=True, editable=False)
+    content_html = models.TextField("Rendered content", blank=True, editable=False)
 
     author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
 
@@ -156,6 +313,8 @@ class Article(models.Model):
     is_published = models.BooleanField("Article published", default=True)
 
     preview_image = models.ImageField("Preview image", upload_to="articles/", blank=True, null=True)
+    # Уменьшенные копии превью (см. Sport.renditions)
+    renditions = models.JSONField("Image renditions", default=dict, blank=True, editable=False)
 
     #Может быть связана с определенной игрой
     match = models.ForeignKey(Match, on_delete=models.SET_NULL, related_name="articles", blank=True, null=True)
@@ -172,6 +331,12 @@ class Article(models.Model):
     objects = models.Manager()  # Стандартный менеджер
     published = PublishedManager()  # Свой менеджер
 
+    # Смена публикации определяет, нужно ли сбрасывать кэш виджета новостей,
+    # смена превью - нужно ли пересобирать его копии, матч и дата - пересчитывать похожие новости
+    tracked_fields = ('is_published', 'preview_image', 'match_id', 'created_at', 'title', 'slug')
+
+    EXCERPT_WORDS = 30
+
     def __str__(self): #метод __str__
         return f"{self.title}"
 
@@ -179,7 +344,20 @@ class Article(models.Model):
         # Генерирует ссылку вида /news/my-article-slug/ (использование get_absolute_url)
         return reverse('article_detail', kwargs={'slug': self.slug})
 
+    def render_content(self):
+        """Заполняет excerpt (первые EXCERPT_WORDS слов) и content_html (абзацы, как фильтр linebreaks)."""
+        self.excerpt = Truncator(self.content).words(self.EXCERPT_WORDS, truncate=' …')
+        # Текст экранируется здесь, в шаблоне content_html выводится через |safe
+        self.content_html = linebreaks(self.content, autoescape=True)
+
     def save(self, *args, **kwargs):
+        # Статья загружена с defer('content') - текст не менялся, пересчитывать нечего
+        update_fields = kwargs.get('update_fields')
+        if 'content' in self.__dict__ and (update_fields is None or 'content' in update_fields):
+            self.render_content()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'excerpt', 'content_html'}
+
         # Если слаг не установлен (пустой)
         if not self.slug:
             self.slug = slugify(self.title)
@@ -194,4 +372,77 @@ class Article(models.Model):
 
     class Meta:
         #class Meta: ordering
-        ordering = ['-created_at']  # Сортировка: сначала новые
\ No newline at end of file
+        ordering = ['-created_at']  # Сортировка: сначала новые
+        indexes = [
+            # Опубликованные статьи от новых к старым (архив, виджет новостей);
+            # id в конце - ключ курсора, чтобы и постраничный вывод шел по индексу.
+            # Частичный индекс, а не (is_published, created_at): Django пишет условие как
+            # WHERE "is_published" без "= 1", и составной индекс SQLite для него не берет
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(is_published=True),
+                         name='article_published_created'),
+            # Список в админке: все статьи, включая черновики, в том же порядке
+            models.Index(fields=['-created_at', '-id'], name='article_created'),
+            # Поиск в админке по началу заголовка (см. Athlete)
+            models.Index(Collate('title', 'NOCASE'), name='article_title_nocase'),
+        ]
+
+# Похожие новости (см. related.py): заранее посчитанный список соседей статьи.
+# Страница статьи читает первые строки по индексу (article, -score, related), без self-join по M2M
+class RelatedArticle(models.Model):
+    article = models.ForeignKey(Article, on_delete=models.CASCADE, related_name="neighbours")
+    related = models.ForeignKey(Article, on_delete=models.CASCADE, related_name="+")
+    weight = models.PositiveIntegerField("Shared relations weight")
+    # log2(weight) + дата соседа в периодах полураспада - порядок не зависит от текущего времени
+    score = models.FloatField("Score")
+
+    class Meta:
+        verbose_name = "Related article"
+        verbose_name_plural = "Related articles"
+        constraints = [
+            models.UniqueConstraint(fields=['article', 'related'], name='unique_related_article'),
+        ]
+        indexes = [
+            models.Index(fields=['article', '-score', 'related'], name='related_article_score'),
+        ]
+
+
+# Очередь фоновых задач (см. jobs.py): строка - один вызов функции task(job, **kwargs).
+# Разбирается воркерами manage.py run_workers, внешний брокер не нужен
+class Job(models.Model):
+    STATUS_CHOICES = (
+        ("queued", "В очереди"),
+        ("running", "Выполняется"),
+        ("done", "Готово"),
+        ("failed", "Ошибка"),
+    )
+
+    task = models.CharField("Task", max_length=200)  # путь к функции: sports.exports.build_match_report
+    kwargs = models.JSONField("Arguments", default=dict, blank=True)
+    status = models.CharField("Status", max_length=20, choices=STATUS_CHOICES, default="queued")
+
+    progress = models.PositiveSmallIntegerField("Progress, %", default=0)
+    message = models.CharField("Progress message", max_length=200, blank=True)
+
+    attempts = models.PositiveIntegerField("Attempts", default=0)
+    max_attempts = models.PositiveIntegerField("Max attempts", default=3)
+    error = models.TextField("Last error", blank=True)
+
+    # Не раньше этого времени (отложенный запуск и пауза перед повтором)
+    run_after = models.DateTimeField("Run after", default=timezone.now)
+    created_at = models.DateTimeField("Created", auto_now_add=True)
+    started_at = models.DateTimeField("Started", blank=True, null=True)
+    finished_at = models.DateTimeField("Finished", blank=True, null=True)
+    worker = models.CharField("Worker", max_length=200, blank=True)
+
+    class Meta:
+        indexes = [
+            # Воркер берет следующую задачу: status='queued' AND run_after <= now ORDER BY run_after
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
+
+    @property
+    def is_last_attempt(self):
+        return self.attempts >= self.max_attempts
@@ -0,0 +1,113 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import Resolver404, resolve
+from django.utils import translation
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from . import cache as versions
+from . import routers
+
+'''
+Кэш целых страниц для анонимных GET-запросов.
+Вьюха помечает ответ тегами зависимостей (tag_response) до того, как читает данные, и рядом
+с ответом в кэш кладутся версии тегов на этот момент. Сохранение Article/Match/Tournament
+меняет версии только своих тегов (purge), и зависящие от них страницы при следующем чтении
+считаются устаревшими. Остальные страницы остаются в кэше.
+'''
+
+PAGE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 10)
+
+# Теги зависимостей
+ARTICLES = 'articles'          # списки опубликованных статей (архив, виджет на главной)
+MATCHES = 'matches'            # блок матчей на главной
+TOURNAMENTS = 'tournaments'    # список турниров, виджет турниров
+
+
+def article_tag(pk):
+    return f'article:{pk}'
+
+
+def tag_response(request, *tags):
+    """
+    Отмечает, от каких тегов зависит ответ; без тегов страница не кэшируется.
+    Вызывать до чтения данных: если purge случится во время рендера, в кэш попадет
+    уже устаревшая версия тега и страница не будет отдана из кэша.
+    """
+    if not hasattr(request, 'page_cache_tags'):
+        request.page_cache_tags = {}
+    for tag, version in _tag_versions(tags).items():
+        request.page_cache_tags.setdefault(tag, version)
+
+
+def purge(*tags):
+    # Смена версий выполняется после коммита транзакции (см. cache.bump_version)
+    if tags:
+        versions.bump_version(*[f'page:{tag}' for tag in tags])
+
+
+def _tag_versions(tags):
+    return {tag: versions.get_version(f'page:{tag}') for tag in tags}
+
+
+def page_key(request):
+    url = request.get_full_path()
+    digest = hashlib.md5(url.encode(), usedforsecurity=False).hexdigest()
+    return f'sports:page:{digest}:{translation.get_language()}'
+
+
+class AnonymousPageCacheMiddleware:
+    """
+    Отдает анонимам закэшированные страницы из PAGE_CACHE_URL_NAMES.
+    Авторизованные пользователи (свой цвет в шапке, ссылки управления статьей) идут мимо кэша.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self._is_cacheable_request(request):
+            return self.get_response(request)
+
+        key = page_key(request)
+        entry = cache.get(key)
+        if entry is not None:
+            response, tag_versions = entry
+            if _tag_versions(tag_versions) == tag_versions:
+                request.page_cache_status = 'hit'
+                response['X-Page-Cache'] = 'hit'
+                return get_conditional_response(
+                    request,
+                    etag=response.get('ETag'),
+                    last_modified=parse_http_date_safe(response.get('Last-Modified', '')),
+                    response=response,
+                )
+
+        request.page_cache_status = 'miss'
+        # Страница ляжет в кэш на PAGE_TIMEOUT - рендерим ее по основной базе, а не по реплике
+        with routers.primary_reads():
+            response = self.get_response(request)
+        tag_versions = getattr(request, 'page_cache_tags', None)
+        if tag_versions and self._is_cacheable_response(request, response):
+            cache.set(key, (response, tag_versions), PAGE_TIMEOUT)
+            response['X-Page-Cache'] = 'miss'
+        return response
+
+    def _is_cacheable_request(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return False
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            return False
+        if url_name not in getattr(settings, 'PAGE_CACHE_URL_NAMES', ()):
+            return False
+        return not request.user.is_authenticated
+
+    def _is_cacheable_response(self, request, response):
+        if response.status_code != 200 or response.streaming or response.cookies:
+            return False
+        # Шаблон мог обратиться к пользователю/сессии и выставить cookie - такие ответы не кэшируем
+        return not request.user.is_authenticated
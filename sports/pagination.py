@@ -0,0 +1,193 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+
+'''
+Keyset (cursor) пагинация.
+Вместо OFFSET + COUNT(*) следующая страница выбирается условием "строки после ключа последней
+записи" по тому же порядку сортировки. Глубина страницы не влияет на стоимость запроса,
+а общее количество записей не считается.
+
+CappedCountPaginator - для списков админки на больших таблицах: COUNT(*) ограничен
+ADMIN_COUNT_CAP строками, дальше количество оценивается.
+'''
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _default(value):
+    # Полная точность (DjangoJSONEncoder обрезает микросекунды, а они нужны для ключа)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__} in cursor")
+
+
+def encode_cursor(direction, key):
+    payload = json.dumps({'d': direction, 'k': key}, default=_default, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        direction, key = payload['d'], payload['k']
+    except (binascii.Error, ValueError, TypeError, KeyError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+    if direction not in ('n', 'p') or not isinstance(key, list):
+        raise InvalidCursor(cursor)
+    return direction, key
+
+
+def _parse_ordering(ordering):
+    return [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+
+def _clean_key(model, ordering, key):
+    # Курсор приходит от клиента: base64 с корректным JSON еще не значит корректные значения.
+    # Приводим каждое значение к типу поля сортировки, как это делают формы
+    if len(key) != len(ordering):
+        raise InvalidCursor(key)
+    cleaned = []
+    for (name, _), value in zip(_parse_ordering(ordering), key):
+        field, opts = None, model._meta
+        for part in name.split('__'):
+            field = opts.get_field(part)
+            if field.related_model is not None:
+                opts = field.related_model._meta
+        if field.is_relation:
+            field = field.target_field
+        try:
+            value = field.to_python(value)
+        except (ValidationError, TypeError, ValueError):
+            raise InvalidCursor(key)
+        if value is None or isinstance(value, (dict, list)):
+            raise InvalidCursor(key)
+        cleaned.append(value)
+    return cleaned
+
+
+def _key_for(obj, ordering):
+    key = []
+    for name, _ in _parse_ordering(ordering):
+        value = obj
+        for part in name.split('__'):
+            value = getattr(value, part)
+        key.append(value)
+    return key
+
+
+def _after(ordering, key, reverse=False):
+    # (a, b, c) > (x, y, z) в терминах ORM: a > x OR (a = x AND b > y) OR ...
+    condition = Q()
+    equal = {}
+    for (name, descending), value in zip(_parse_ordering(ordering), key):
+        lookup = 'lt' if descending != reverse else 'gt'
+        condition |= Q(**equal, **{f'{name}__{lookup}': value})
+        equal[name] = value
+    return condition
+
+
+class CursorPage:
+    """Страница keyset-пагинации: объекты + курсоры соседних страниц (без общего количества)."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def cursor_paginate(queryset, ordering, cursor=None, per_page=10):
+    """
+    ordering - поля сортировки, последним должно идти уникальное поле (обычно id).
+    Некорректный курсор, как и PageNotAnInteger у Paginator, дает первую страницу.
+    """
+    direction, key = 'n', None
+    if cursor:
+        try:
+            direction, key = decode_cursor(cursor)
+            key = _clean_key(queryset.model, ordering, key)
+        except InvalidCursor:
+            direction, key = 'n', None
+
+    backwards = direction == 'p'
+    if backwards:
+        # Назад: идем в обратном порядке от первой записи и разворачиваем результат
+        queryset = queryset.order_by(*[name[1:] if name.startswith('-') else f'-{name}' for name in ordering])
+    else:
+        queryset = queryset.order_by(*ordering)
+    if key is not None:
+        queryset = queryset.filter(_after(ordering, key, reverse=backwards))
+
+    rows = list(queryset[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    if not rows:
+        return CursorPage(rows)
+
+    # Пришли по курсору - значит, с той стороны записи точно есть
+    if backwards:
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, key is not None
+    return CursorPage(
+        rows,
+        next_cursor=encode_cursor('n', _key_for(rows[-1], ordering)) if has_next else None,
+        previous_cursor=encode_cursor('p', _key_for(rows[0], ordering)) if has_previous else None,
+    )
+
+
+class CappedCountPaginator(Paginator):
+    """
+    Точный COUNT(*) по миллионам строк - полный проход таблицы на каждую страницу админки.
+    Считаем не больше ADMIN_COUNT_CAP строк (COUNT по подзапросу с LIMIT). Если строк больше,
+    count - оценка (count_is_estimate, админка пишет "≈ N"), и по страницам можно идти дальше предела:
+    без фильтров - максимальный id, с фильтрами - плотность подходящих строк среди первых id,
+    растянутая на весь диапазон id. Последние страницы по оценке могут оказаться пустыми.
+    """
+
+    count_is_estimate = False
+
+    @cached_property
+    def count(self):
+        cap = getattr(settings, 'ADMIN_COUNT_CAP', 10000)
+        # Порядок для подсчета не нужен, а сортировка в подзапросе может стоить дороже самого счета
+        counted = self.object_list.order_by()[:cap + 1].count()
+        if counted <= cap:
+            return counted
+        self.count_is_estimate = True
+        top = self.object_list.model._base_manager.aggregate(top=Max('pk'))['top'] or 0
+        if not self.object_list.query.where:
+            return max(top, cap + 1)
+        # Первые cap + 1 подходящих id (проход по первичному ключу, как и у COUNT выше)
+        ids = self.object_list.order_by('pk').values_list('pk', flat=True)
+        first, last = ids.first(), ids[cap]
+        density = cap / max(last - first, 1)
+        return max(round(density * (top - first + 1)), cap + 1)
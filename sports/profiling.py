@@ -0,0 +1,127 @@
+import asyncio
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import re
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .metrics import url_name
+
+'''
+Выборочное профилирование запросов cProfile.
+Профилируется доля PROFILING_SAMPLE_RATES[имя URL] запросов к вьюхам sports.views
+(ключ '*' - для остальных URL) и любой запрос с заголовком X-Profile, равным PROFILING_TOKEN.
+На каждый профиль пишутся два файла: .prof (для snakeviz/pstats) и .txt с топом функций.
+В каталоге хранятся только последние PROFILING_KEEP профилей.
+Если PROFILING_ENABLED выключен, middleware исключает себя из цепочки - ноль накладных расходов.
+'''
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+# Имя файла: время-имя_url-длительность_мс-pid.prof
+FILE_RE = re.compile(r'^(?P<stamp>\d+)-(?P<view>[\w:.-]+)-(?P<ms>\d+)ms-(?P<pid>\d+)\.(?:prof|txt)$')
+SUMMARY_LINES = 40
+
+
+def profiles_dir():
+    return str(getattr(settings, 'PROFILING_DIR', settings.BASE_DIR / 'profiles'))
+
+
+def sample_rate(name):
+    rates = getattr(settings, 'PROFILING_SAMPLE_RATES', {})
+    return rates.get(name, rates.get('*', 0))
+
+
+def has_profile_token(request):
+    token = getattr(settings, 'PROFILING_TOKEN', '')
+    header = request.META.get(PROFILE_HEADER, '')
+    return bool(token) and hmac.compare_digest(header.encode(), token.encode())
+
+
+def save_profile(profiler, name, seconds):
+    directory = profiles_dir()
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f'{time.time_ns()}-{name.replace(":", ".")}-{round(seconds * 1000)}ms-{os.getpid()}')
+    profiler.dump_stats(base + '.prof')
+
+    summary = io.StringIO()
+    summary.write(f'{name}: {seconds * 1000:.1f} ms\n\n')
+    pstats.Stats(profiler, stream=summary).strip_dirs().sort_stats('cumulative').print_stats(SUMMARY_LINES)
+    with open(base + '.txt', 'w', encoding='utf-8') as f:
+        f.write(summary.getvalue())
+
+    rotate(directory, getattr(settings, 'PROFILING_KEEP', 200))
+    return base
+
+
+def rotate(directory, keep):
+    # Старые профили удаляем парами .prof + .txt
+    names = sorted(name for name in os.listdir(directory) if name.endswith('.prof'))
+    for name in names[:-keep] if keep else names:
+        for suffix in ('.prof', '.txt'):
+            try:
+                os.remove(os.path.join(directory, name[:-5] + suffix))
+            except FileNotFoundError:
+                pass  # другой воркер успел удалить раньше
+
+
+def recent_profiles(limit=50):
+    """Профили из каталога, самые долгие сверху."""
+    directory = profiles_dir()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in os.listdir(directory):
+        match = FILE_RE.match(name)
+        if match and name.endswith('.prof'):
+            profiles.append({
+                'name': name[:-5],
+                'view': match['view'].replace('.', ':'),
+                'ms': int(match['ms']),
+                'created_at': datetime.fromtimestamp(int(match['stamp']) / 1e9, tz=timezone.utc),
+            })
+    profiles.sort(key=lambda profile: profile['ms'], reverse=True)
+    return profiles[:limit]
+
+
+def profile_path(name):
+    # Только файлы из каталога профилей, никаких ../
+    if not FILE_RE.match(name):
+        return None
+    path = os.path.join(profiles_dir(), name)
+    return path if os.path.isfile(path) else None
+
+
+class SamplingProfilerMiddleware:
+    """
+    Ставится последним в MIDDLEWARE: process_view остальных middleware уже отработали,
+    и профилируется сама вьюха вместе с рендером шаблона.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Только вьюхи сайта; потоковая async-трансляция профилировать смысла нет
+        if getattr(view_func, '__module__', None) != 'sports.views' or asyncio.iscoroutinefunction(view_func):
+            return None
+        name = url_name(request)
+        if not has_profile_token(request) and random.random() >= sample_rate(name):
+            return None
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        response = profiler.runcall(view_func, request, *view_args, **view_kwargs)
+        save_profile(profiler, name, time.perf_counter() - started)
+        return response
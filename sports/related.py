@@ -0,0 +1,234 @@
+import math
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min
+from django.db.models.functions import RowNumber
+from django.db.models.expressions import Window
+from django.utils import timezone
+
+from . import jobs, page_cache
+from .models import Article, RelatedArticle
+
+'''
+Похожие новости.
+Для каждой статьи заранее хранится список соседей (RelatedArticle, не больше RELATED_NEWS_KEEP строк),
+страница статьи читает первые строки по индексу (article, -score, related) - один запрос без self-join по M2M.
+
+Вес пары - сумма общих связей: общий матч, игроки, команды, теги (RELATED_NEWS_WEIGHTS, за каждую
+общую связь). Тег/команда/игрок, которые есть больше чем у RELATED_NEWS_MAX_SHARED статей, не учитываются:
+о сходстве они почти ничего не говорят, а пересчет тянул бы тысячи кандидатов. Свежесть учитывается экспоненциально: вес * 2 ** (-возраст / RELATED_NEWS_HALF_LIFE_DAYS).
+Порядок по такой величине не меняется со временем, поэтому в score хранится ее логарифм:
+log2(вес) + дата_соседа / период_полураспада - его не нужно пересчитывать каждый день.
+
+Список поддерживается инкрементально: изменение связей статьи (ArticleForm.save_m2m(), админка,
+tag.tags.add(...)) после коммита ставит задачу sports.related.refresh_job в очередь (jobs.py, см. signals.py) -
+сохранение статьи не ждет пересчета. Пересчет строит ее список заново и правит ее строку в списках соседей. Из-за обрезки до RELATED_NEWS_KEEP списки
+соседей могут немного отстать (кандидат, вытесненный раньше, не вернется сам) - это исправляет
+manage.py rebuild_related.
+'''
+
+WEIGHTS = getattr(settings, 'RELATED_NEWS_WEIGHTS', {'match': 4, 'related_athletes': 3, 'related_teams': 2, 'tags': 1})
+HALF_LIFE_DAYS = getattr(settings, 'RELATED_NEWS_HALF_LIFE_DAYS', 30)
+KEEP = getattr(settings, 'RELATED_NEWS_KEEP', 20)
+MAX_SHARED = getattr(settings, 'RELATED_NEWS_MAX_SHARED', 500)
+
+# Отложенные пересчеты текущего потока (у каждого потока свое соединение и свои on_commit)
+_pending = threading.local()
+
+
+def score(weight, created_at):
+    return math.log2(weight) + created_at.timestamp() / 86400 / HALF_LIFE_DAYS
+
+
+def chunks(ids, size=500):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def overlap(article_id, match_id):
+    """{id: (вес, created_at)} опубликованных статей, у которых есть общие связи со статьей article_id."""
+    found = defaultdict(lambda: [0, None])
+    for name in ('tags', 'related_teams', 'related_athletes'):
+        field = Article._meta.get_field(name)
+        through = field.remote_field.through
+        target = f'{field.m2m_reverse_field_name()}_id'
+        own = through.objects.filter(article_id=article_id).values(target)
+        # Слишком частые связи пропускаем (MAX_SHARED) - все в одном запросе, подзапросами
+        useful = (
+            through.objects.filter(**{f'{target}__in': own}).values(target)
+            .annotate(articles=Count('*')).filter(articles__lte=MAX_SHARED).values(target)
+        )
+        rows = (
+            through.objects.filter(**{f'{target}__in': useful}, article__is_published=True)
+            .exclude(article_id=article_id)
+            .values_list('article_id', 'article__created_at')
+            .annotate(shared=Count('*'))
+            .order_by()
+        )
+        for pk, created_at, shared in rows:
+            found[pk][0] += shared * WEIGHTS[name]
+            found[pk][1] = created_at
+    if match_id is not None:
+        same_match = Article.published.filter(match_id=match_id).exclude(pk=article_id).values_list('pk', 'created_at')
+        for pk, created_at in same_match:
+            found[pk][0] += WEIGHTS['match']
+            found[pk][1] = created_at
+    return {pk: tuple(value) for pk, value in found.items()}
+
+
+def neighbours(article_id, found):
+    """Собственный список статьи: лучшие KEEP соседей."""
+    rows = [
+        RelatedArticle(article_id=article_id, related_id=pk, weight=weight, score=score(weight, created_at))
+        for pk, (weight, created_at) in found.items()
+    ]
+    rows.sort(key=lambda row: (-row.score, row.related_id))
+    return rows[:KEEP]
+
+
+def trim(article_ids):
+    """Оставляет в списках статей article_ids только KEEP лучших строк."""
+    for chunk in chunks(article_ids):
+        extra = list(
+            RelatedArticle.objects.filter(article_id__in=chunk)
+            .annotate(rank=Window(RowNumber(), partition_by=F('article_id'), order_by=[F('score').desc(), F('related_id')]))
+            .filter(rank__gt=KEEP).values_list('pk', flat=True)
+        )
+        if extra:
+            RelatedArticle.objects.filter(pk__in=extra).delete()
+
+
+def refresh_article(article):
+    """
+    Пересчитывает список статьи и ее строку в списках соседей.
+    Возвращает id статей, чей блок похожих новостей изменился.
+    """
+    article_id = article['pk']
+    found = overlap(article_id, article['match_id'])
+    changed = set()
+
+    own = neighbours(article_id, found)
+    old = set(RelatedArticle.objects.filter(article_id=article_id).values_list('related_id', 'weight'))
+    if old != {(row.related_id, row.weight) for row in own}:
+        RelatedArticle.objects.filter(article_id=article_id).delete()
+        RelatedArticle.objects.bulk_create(own)
+        changed.add(article_id)
+
+    # Строка статьи в чужих списках. Черновик в чужих списках не показываем
+    if not article['is_published']:
+        found = {}
+    holders = dict(RelatedArticle.objects.filter(related_id=article_id).values_list('article_id', 'score'))
+    gone = holders.keys() - found.keys()
+    for chunk in chunks(gone):
+        RelatedArticle.objects.filter(related_id=article_id, article_id__in=chunk).delete()
+    changed |= gone
+
+    by_weight = defaultdict(list)
+    for pk in holders.keys() & found.keys():
+        weight = found[pk][0]
+        if holders[pk] != score(weight, article['created_at']):
+            by_weight[weight].append(pk)
+    for weight, pks in by_weight.items():
+        for chunk in chunks(pks):
+            RelatedArticle.objects.filter(related_id=article_id, article_id__in=chunk).update(
+                weight=weight, score=score(weight, article['created_at']))
+        changed.update(pks)
+
+    # Новые пары: только туда, где статья попадает в KEEP лучших - иначе строку тут же обрежут
+    candidates = found.keys() - holders.keys()
+    added, full = [], []
+    for chunk in chunks(candidates):
+        stats = {
+            pk: (count, lowest) for pk, count, lowest in
+            RelatedArticle.objects.filter(article_id__in=chunk).values_list('article_id')
+            .annotate(rows=Count('*'), lowest=Min('score')).order_by()
+        }
+        for pk in chunk:
+            weight = found[pk][0]
+            value = score(weight, article['created_at'])
+            count, lowest = stats.get(pk, (0, None))
+            if count < KEEP or value > lowest:
+                added.append(RelatedArticle(article_id=pk, related_id=article_id, weight=weight, score=value))
+                if count >= KEEP:
+                    full.append(pk)
+    RelatedArticle.objects.bulk_create(added, batch_size=500)
+    changed.update(row.article_id for row in added)
+    trim(full)
+    return changed
+
+
+def refresh(article_ids):
+    """Пересчитывает статьи article_ids и сбрасывает кэш страниц, где поменялся блок похожих новостей."""
+    changed = set()
+    articles = Article.objects.filter(pk__in=article_ids).values('pk', 'match_id', 'is_published', 'created_at')
+    with transaction.atomic():
+        for article in articles:
+            changed |= refresh_article(article)
+    touch(changed)
+    return changed
+
+
+def touch(article_ids):
+    # updated_at - основа ETag страницы статьи (см. signals.touch_articles)
+    for chunk in chunks(article_ids):
+        Article.objects.filter(pk__in=chunk).update(updated_at=timezone.now())
+        page_cache.purge(*[page_cache.article_tag(pk) for pk in chunk])
+
+
+def refresh_job(job, ids):
+    """Фоновая задача пересчета (jobs.py)."""
+    refresh(ids)
+
+
+def schedule(article_ids):
+    """
+    Ставит пересчет в очередь задач после коммита. save_m2m() меняет три связи подряд - задача все равно
+    одна: первый колбэк забирает все накопленные id, остальные ничего не делают.
+    """
+    pending = getattr(_pending, 'ids', None)
+    if pending is None:
+        pending = _pending.ids = set()
+    pending.update(article_ids)
+
+    def run():
+        ids = sorted(_pending.ids)
+        _pending.ids.clear()
+        for chunk in chunks(ids):
+            jobs.enqueue('sports.related.refresh_job', ids=chunk)
+
+    transaction.on_commit(run)
+
+
+def forget(article):
+    """Вызывается перед удалением статьи: ее строки удалит каскад, а страницы соседей надо сбросить."""
+    holders = list(RelatedArticle.objects.filter(related_id=article.pk).values_list('article_id', flat=True))
+    if holders:
+        transaction.on_commit(lambda: touch(holders))
+
+
+def rebuild_related():
+    """Пересчитывает все списки с нуля. Возвращает количество записанных строк."""
+    total = 0
+    articles = Article.objects.order_by('pk').values_list('pk', 'match_id')
+    with transaction.atomic():
+        RelatedArticle.objects.all().delete()
+        for chunk in chunks(articles):
+            rows = [row for pk, match_id in chunk for row in neighbours(pk, overlap(pk, match_id))]
+            RelatedArticle.objects.bulk_create(rows, batch_size=1000)
+            total += len(rows)
+    return total
+
+
+def related_articles(article, count=None):
+    """Похожие новости для страницы статьи - один запрос по индексу."""
+    count = count or getattr(settings, 'RELATED_NEWS_COUNT', 5)
+    rows = (
+        RelatedArticle.objects.filter(article=article, related__is_published=True)
+        .select_related('related').only('related', 'related__title', 'related__slug', 'related__created_at')
+        .order_by('-score', 'related_id')[:count]
+    )
+    return [row.related for row in rows]
@@ -0,0 +1,190 @@
+import io
+import os
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.utils.html import format_html
+from PIL import Image, ImageOps
+
+from . import cache, page_cache
+from .jobs import enqueue, job_progress
+
+'''
+Уменьшенные копии картинок (renditions).
+После загрузки иконки/логотипа/фото/превью сигнал ставит фоновую задачу (sports.jobs), она режет
+картинку до размеров из IMAGE_RENDITIONS в WebP и JPEG и кладет рядом с оригиналом:
+articles/photo.jpg -> articles/renditions/photo-card.webp, articles/renditions/photo-card.jpeg.
+Пути и размеры записываются в поле renditions той же строки, поэтому для шаблона
+(теги picture/rendition_url в sports_tags) не нужно ни одного лишнего запроса и обращения к диску.
+Пока копий нет, шаблоны показывают оригинал.
+'''
+
+# имя: (ширина, высота, обрезать до точного размера)
+IMAGE_RENDITIONS = getattr(settings, 'IMAGE_RENDITIONS', {
+    'thumb': (80, 80, True),      # админка, иконки в списках
+    'card': (480, 270, False),    # карточки в списках
+    'hero': (1200, 675, False),   # большая картинка статьи, слайдер
+})
+
+# модель: (поле картинки, какие копии нужны)
+IMAGE_FIELDS = {
+    'sports.sport': ('icon', ('thumb',)),
+    'sports.team': ('logo', ('thumb', 'card')),
+    'sports.athlete': ('photo', ('thumb', 'card')),
+    'sports.article': ('preview_image', ('thumb', 'card', 'hero')),
+}
+
+# (расширение, формат Pillow, параметры сохранения); WebP - первым, JPEG - для старых браузеров
+FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+# Какие закэшированные страницы и виджеты показывают картинки модели
+PURGE = {
+    'sports.sport': ((cache.ACTIVE_TOURNAMENTS,), (page_cache.TOURNAMENTS,)),
+    'sports.article': ((cache.LATEST_NEWS,), (page_cache.ARTICLES,)),
+}
+
+
+def rendition_path(original, name, ext):
+    directory, filename = os.path.split(original)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'renditions', f'{stem}-{name}.{ext}')
+
+
+def resize(image, name):
+    width, height, crop = IMAGE_RENDITIONS[name]
+    if crop:
+        return ImageOps.fit(image, (width, height), Image.LANCZOS)
+    picture = image.copy()
+    picture.thumbnail((width, height), Image.LANCZOS)  # только уменьшает, пропорции сохраняются
+    return picture
+
+
+def encode(picture, image_format, options):
+    if image_format == 'JPEG' and picture.mode != 'RGB':
+        # У JPEG нет прозрачности: прозрачное - на белый фон
+        background = Image.new('RGB', picture.size, 'white')
+        rgba = picture.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        picture = background
+    elif picture.mode not in ('RGB', 'RGBA'):
+        picture = picture.convert('RGBA')
+    data = io.BytesIO()
+    picture.save(data, image_format, **options)
+    return data.getvalue()
+
+
+def save_file(path, content):
+    if default_storage.exists(path):
+        default_storage.delete(path)
+    return default_storage.save(path, ContentFile(content))
+
+
+def remove_files(renditions, keep=()):
+    for name, entry in renditions.items():
+        if not isinstance(entry, dict):
+            continue
+        for ext, _, _ in FORMATS:
+            path = entry.get(ext)
+            if path and path not in keep and default_storage.exists(path):
+                default_storage.delete(path)
+
+
+def build_renditions(job, model, pk):
+    """Фоновая задача: копии картинки объекта model (sports.article) с id pk."""
+    Model = apps.get_model(model)
+    field_name, names = IMAGE_FIELDS[model]
+    obj = Model._base_manager.filter(pk=pk).first()
+    if obj is None:
+        return
+    image = getattr(obj, field_name)
+    old = obj.renditions or {}
+
+    result = {}
+    if image:
+        with image.open('rb') as f:
+            source = Image.open(f)
+            source.load()
+        source = ImageOps.exif_transpose(source)
+        result['source'] = image.name
+        for number, name in enumerate(names, start=1):
+            picture = resize(source, name)
+            entry = {'width': picture.width, 'height': picture.height}
+            for ext, image_format, options in FORMATS:
+                entry[ext] = save_file(rendition_path(image.name, name, ext), encode(picture, image_format, options))
+            result[name] = entry
+            job_progress(job, number, len(names), name)
+
+    kept = {entry[ext] for entry in result.values() if isinstance(entry, dict) for ext, _, _ in FORMATS}
+    remove_files(old, keep=kept)
+    # Пока шла задача, картинку могли заменить - тогда копии запишет следующая задача.
+    # update(), а не save(): сохранение модели снова поставило бы задачу
+    current = {field_name: image.name} if image else {}
+    fields = {'renditions': result}
+    if model == 'sports.article':
+        fields['updated_at'] = timezone.now()  # иначе ETag страницы статьи не изменится
+    if Model._base_manager.filter(pk=pk, **current).update(**fields):
+        purge(model, pk)
+
+
+def purge(model, pk):
+    if model == 'sports.article':
+        page_cache.purge(page_cache.article_tag(pk))
+    if model in PURGE:
+        fragments, tags = PURGE[model]
+        cache.bump_version(*fragments)
+        page_cache.purge(*tags)
+
+
+def schedule(instance):
+    """Ставит пересборку копий, если картинка объекта изменилась (вызывается из post_save)."""
+    model = instance._meta.label_lower
+    field_name, _ = IMAGE_FIELDS[model]
+    current = getattr(instance, field_name).name or ''
+    previous = instance.loaded_values.get(field_name) or ''
+    if str(previous) != current and (current or instance.renditions):
+        enqueue('sports.renditions.build_renditions', model=model, pk=instance.pk)
+
+
+def srcset(obj, ext='webp', names=None):
+    """'url 480w, url 1200w' для всех копий объекта (кроме обрезанных до квадрата)."""
+    renditions = obj.renditions or {}
+    names = names or [name for name, size in IMAGE_RENDITIONS.items() if not size[2]]
+    entries = sorted((renditions[name] for name in names if name in renditions), key=lambda entry: entry['width'])
+    return ', '.join(f"{default_storage.url(entry[ext])} {entry['width']}w" for entry in entries)
+
+
+def rendition_url(obj, name, ext='jpeg'):
+    """URL копии или оригинала, если копий еще нет (и None, если картинки нет вовсе)."""
+    entry = (obj.renditions or {}).get(name)
+    if entry:
+        return default_storage.url(entry[ext])
+    field_name, _ = IMAGE_FIELDS[obj._meta.label_lower]
+    image = getattr(obj, field_name)
+    return image.url if image else None
+
+
+def picture(obj, name, alt='', sizes=None, **attrs):
+    """<picture> с WebP и JPEG-запасным вариантом; до готовности копий - просто оригинал."""
+    url = rendition_url(obj, name)
+    if url is None:
+        return ''
+    extra = format_html(''.join(f' {key.replace("_", "-")}="{{}}"' for key in attrs), *attrs.values())
+    entry = (obj.renditions or {}).get(name)
+    if not entry:
+        return format_html('<img src="{}" alt="{}" loading="lazy"{}>', url, alt, extra)
+
+    crop = IMAGE_RENDITIONS[name][2]
+    names = [name] if crop else None
+    sizes = sizes or f"{entry['width']}px"
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" loading="lazy"{}></picture>',
+        srcset(obj, 'webp', names), sizes, url, srcset(obj, 'jpeg', names), sizes,
+        entry['width'], entry['height'], alt, extra,
+    )
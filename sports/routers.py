@@ -0,0 +1,155 @@
+import contextlib
+import contextvars
+import os
+import random
+import sqlite3
+import time
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+'''
+Чтение с реплик.
+Запросы GET к страницам из REPLICA_URL_NAMES (главная, новости, турниры, статистика - вместе
+с виджетами из sports_tags) читают из одной из баз READ_REPLICAS. Все остальное, включая админку,
+формы статей и регистрацию, идет в основную базу. Запись всегда идет в основную базу.
+
+Read-your-writes: после запроса, который писал (или просто POST), браузер получает cookie
+на REPLICA_PIN_SECONDS секунд (не меньше периода sync_replica, иначе закрепление кончится раньше,
+чем запись попадет в реплику), и пока она жива, все его чтения идут в основную базу -
+автор сразу видит свою статью, даже если реплика еще не догнала.
+
+То, что кладется в кэш (фрагменты, счетчик голов, страницы для анонимов), читается из основной базы
+(primary_reads): запись меняет версии кэша сразу после коммита, и рендер с отстающей реплики
+лег бы в кэш под новой версией на весь таймаут.
+
+Реплика для SQLite - копия файла базы (команда sync_replica, sqlite backup API).
+'''
+
+PIN_COOKIE = 'db_primary_pin'
+
+# Сессии и пользователей всегда читаем из основной базы: только что зарегистрированный
+# или вошедший пользователь не должен "выйти" из-за отстающей реплики
+PRIMARY_ONLY_APPS = ('sessions', 'auth')
+
+# Состояние текущего запроса: читать ли с реплики и была ли запись
+_state = contextvars.ContextVar('sports_replica_state', default=None)
+
+
+def pin_seconds():
+    # По умолчанию - два периода синхронизации: запись точно успеет попасть в реплику
+    default = 2 * getattr(settings, 'REPLICA_SYNC_INTERVAL', 60)
+    return getattr(settings, 'REPLICA_PIN_SECONDS', default)
+
+
+class RequestState:
+    def __init__(self, read_only):
+        self.read_only = read_only
+        self.wrote = False
+
+
+def replicas():
+    return list(getattr(settings, 'READ_REPLICAS', []))
+
+
+def is_replica_alias(alias):
+    # Реплика в DATABASES объявлена зеркалом основной базы (в тестах это одна и та же база)
+    return settings.DATABASES.get(alias, {}).get('TEST', {}).get('MIRROR') == 'default'
+
+
+@contextlib.contextmanager
+def primary_reads():
+    """Внутри блока все чтения текущего запроса идут в основную базу."""
+    state = _state.get()
+    if state is None or not state.read_only:
+        yield
+        return
+    state.read_only = False
+    try:
+        yield
+    finally:
+        state.read_only = True
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        available = replicas()
+        if state is None or not state.read_only or not available or model._meta.app_label in PRIMARY_ONLY_APPS:
+            return None  # основная база
+        return random.choice(available)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика - копия основной базы, связи между ними допустимы
+        databases = {'default', *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики не мигрируют - они копируются с основной базы
+        if db in replicas() or is_replica_alias(db):
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Ставится после SessionMiddleware и до кэша страниц."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RequestState(read_only=self.is_read_only(request))
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote or request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            # Какое-то время читаем свои записи из основной базы
+            seconds = pin_seconds()
+            response.set_cookie(PIN_COOKIE, str(int(time.time()) + seconds), max_age=seconds,
+                                httponly=True, samesite='Lax')
+        return response
+
+    def is_read_only(self, request):
+        if request.method not in ('GET', 'HEAD') or not replicas():
+            return False
+        if is_pinned(request):
+            return False
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            return False
+        return url_name in getattr(settings, 'REPLICA_URL_NAMES', ())
+
+
+def is_pinned(request):
+    try:
+        return int(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def copy_database(source, target):
+    """
+    Копия SQLite-базы для реплики: backup API дает согласованный снимок даже во время записи.
+    Копируем во временный файл и подменяем целиком, чтобы читатели не видели полузаписанную базу.
+    """
+    temp = f'{target}.tmp'
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(temp)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+    os.replace(temp, target)
@@ -0,0 +1,142 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Article
+
+'''
+Полнотекстовый поиск по новостям (SQLite FTS5).
+sports_article_fts - external content таблица над sports_article: сам текст хранится
+только в статьях, а индекс синхронизируют триггеры, поэтому он остается актуальным
+и при save()/delete(), и при bulk_create/update().
+'''
+
+FTS_TABLE = 'sports_article_fts'
+
+# Заголовок весит больше текста при ранжировании bm25
+TITLE_WEIGHT = 10.0
+CONTENT_WEIGHT = 1.0
+
+# Служебные маркеры подсветки: сниппет сначала экранируется, потом маркеры меняются на <mark>
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+
+INSTALL_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, content,
+        content='sports_article', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON sports_article BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON sports_article BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, content ON sports_article BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO {FTS_TABLE}(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+]
+
+UNINSTALL_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def fts_available(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def install_fts(using=connection, rebuild=False):
+    """
+    Создает FTS-таблицу и триггеры (идемпотентно).
+    Вызывается миграцией и после каждого migrate: при пересоздании таблицы sports_article
+    (ALTER на SQLite) Django удаляет старую таблицу вместе с ее триггерами.
+    """
+    if not fts_available(using):
+        return
+    with using.cursor() as cursor:
+        for sql in INSTALL_SQL:
+            cursor.execute(sql)
+        if rebuild:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def uninstall_fts(using=connection):
+    if not fts_available(using):
+        return
+    with using.cursor() as cursor:
+        for sql in UNINSTALL_SQL:
+            cursor.execute(sql)
+
+
+def build_match_query(text):
+    # Пользовательский ввод не передаем в синтаксис FTS5 как есть: каждое слово - отдельная
+    # фраза в кавычках с поиском по префиксу ("гол"* найдет и "голы", и "голевой")
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _highlight(text):
+    return mark_safe(escape(text).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>'))
+
+
+def search_articles(text, limit=20):
+    """
+    Опубликованные статьи по запросу, от более релевантных к менее (bm25).
+    У каждой статьи заполнены search_title и search_snippet с подсветкой совпадений.
+    """
+    query = build_match_query(text)
+    if not query:
+        return []
+
+    if not fts_available():
+        # Без FTS5 - медленный запасной вариант через LIKE
+        articles = list(
+            Article.published.filter(Q(title__icontains=text) | Q(content__icontains=text)).select_related('author')[:limit]
+        )
+        for article in articles:
+            article.search_title = article.title
+            article.search_snippet = article.content[:200]
+        return articles
+
+    sql = f"""
+        SELECT a.id,
+               highlight({FTS_TABLE}, 0, %s, %s),
+               snippet({FTS_TABLE}, 1, %s, %s, '…', 24)
+        FROM {FTS_TABLE}
+        JOIN sports_article a ON a.id = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH %s AND a.is_published
+        ORDER BY bm25({FTS_TABLE}, %s, %s)
+        LIMIT %s
+    """
+    params = [_MARK_START, _MARK_END, _MARK_START, _MARK_END, query, TITLE_WEIGHT, CONTENT_WEIGHT, limit]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    articles = Article.published.select_related('author').defer('content').in_bulk([row[0] for row in rows])
+    results = []
+    for article_id, title, snippet in rows:
+        article = articles.get(article_id)
+        if article is None:
+            continue
+        article.search_title = _highlight(title)
+        article.search_snippet = _highlight(snippet)
+        results.append(article)
+    return results
@@ -0,0 +1,202 @@
+from django.db import connections
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import cache, leaderboards, live, page_cache, related, renditions, search, standings
+from .models import Article, Athlete, Match, MatchParticipation, Sport, Tag, Team, Tournament
+
+
+@receiver(post_save, sender=Match)
+def match_saved(sender, instance, created, raw=False, **kwargs):
+    # raw - загрузка фикстур (loaddata), таблицу после нее пересчитывают командой
+    if raw:
+        return
+    old_values = instance.loaded_values
+    standings.update_for_match(old_values, standings.match_values(instance))
+    if old_values:
+        leaderboards.move_match(instance.pk, old_values['tournament_id'], instance.tournament_id)
+    cache.add_total_home_goals((instance.score_home or 0) - (old_values.get('score_home') or 0))
+    page_cache.purge(page_cache.MATCHES)
+
+    # Трансляция: матч идет сейчас (или только что закончился) и изменился счет/статус
+    involves_live = 'live' in (instance.status, old_values.get('status'))
+    changed = any(old_values.get(name) != getattr(instance, name) for name in ('status', 'score_home', 'score_away'))
+    if involves_live and changed:
+        live.publish_match(instance)
+
+
+@receiver(post_delete, sender=Match)
+def match_deleted(sender, instance, **kwargs):
+    # Если объект меняли в памяти, в БД лежали именно загруженные значения
+    old_values = instance.loaded_values or standings.match_values(instance)
+    standings.update_for_match(old_values, {})
+    cache.add_total_home_goals(-(old_values.get('score_home') or 0))
+    page_cache.purge(page_cache.MATCHES)
+
+
+@receiver(post_save, sender=MatchParticipation)
+def participation_saved(sender, instance, created, raw=False, **kwargs):
+    # Сюда же попадают правки через MatchParticipationInline в админке
+    if raw:
+        return
+    leaderboards.update_for_participation(instance.loaded_values, leaderboards.participation_values(instance))
+
+
+@receiver(post_delete, sender=MatchParticipation)
+def participation_deleted(sender, instance, **kwargs):
+    old_values = instance.loaded_values or leaderboards.participation_values(instance)
+    leaderboards.update_for_participation(old_values, {})
+
+
+def restore_search_triggers(sender, using, **kwargs):
+    # ALTER TABLE на SQLite пересоздает sports_article и теряет триггеры FTS - ставим их обратно
+    connection = connections[using]
+    if search.FTS_TABLE in connection.introspection.table_names():
+        search.install_fts(connection)
+
+
+# Инвалидация кэша виджетов (show_latest_news / show_active_tournaments)
+# и кэша страниц для анонимов (page_cache)
+
+@receiver(post_save, sender=Article)
+def article_saved(sender, instance, **kwargs):
+    page_cache.purge(page_cache.article_tag(instance.pk))
+    # Черновики в списки не попадают: сбрасываем, если статья опубликована сейчас или была раньше
+    if instance.is_published or instance.loaded_values.get('is_published'):
+        cache.bump_version(cache.LATEST_NEWS)
+        page_cache.purge(page_cache.ARTICLES)
+
+
+@receiver(post_save, sender=Article)
+def article_related_changed(sender, instance, created, raw=False, **kwargs):
+    # Матч и дата входят в похожие новости, публикация - показывать ли статью у соседей
+    if raw:
+        return
+    if created:
+        related.schedule([instance.pk])
+        return
+    old = instance.loaded_values
+    changed = {name for name in instance.tracked_fields if old.get(name) != getattr(instance, name)}
+    if changed & {'match_id', 'created_at', 'is_published'}:
+        related.schedule([instance.pk])
+    # Заголовок, ссылка и дата статьи выводятся в блоке похожих новостей у соседей - их страницы
+    # сбрасываем сразу, не дожидаясь пересчета в очереди
+    if changed & {'title', 'slug', 'created_at', 'is_published'}:
+        touch_articles(Article.objects.filter(neighbours__related=instance))
+
+
+@receiver(pre_delete, sender=Article)
+def article_related_deleted(sender, instance, **kwargs):
+    related.forget(instance)
+
+
+@receiver(post_save, sender=Sport)
+@receiver(post_save, sender=Team)
+@receiver(post_save, sender=Athlete)
+@receiver(post_save, sender=Article)
+def image_saved(sender, instance, raw=False, **kwargs):
+    # Новая или замененная картинка - уменьшенные копии строит фоновая задача после коммита
+    if not raw:
+        renditions.schedule(instance)
+
+
+@receiver(post_delete, sender=Article)
+def article_deleted(sender, instance, **kwargs):
+    page_cache.purge(page_cache.article_tag(instance.pk))
+    if instance.loaded_values.get('is_published', instance.is_published):
+        cache.bump_version(cache.LATEST_NEWS)
+        page_cache.purge(page_cache.ARTICLES)
+
+
+@receiver(post_save, sender=Tournament)
+def tournament_saved(sender, instance, created, **kwargs):
+    old = instance.loaded_values
+    if created:
+        changed = instance.is_active
+    else:
+        flipped = old.get('is_active') != instance.is_active
+        renamed = old.get('name') != instance.name or old.get('sport_id') != instance.sport_id
+        changed = flipped or (instance.is_active and renamed)
+    if changed:
+        cache.bump_version(cache.ACTIVE_TOURNAMENTS)
+    # Список турниров показывает и неактивные, а главная - названия турниров у матчей
+    page_cache.purge(page_cache.TOURNAMENTS, page_cache.MATCHES)
+
+
+@receiver(post_delete, sender=Tournament)
+def tournament_deleted(sender, instance, **kwargs):
+    if instance.loaded_values.get('is_active', instance.is_active):
+        cache.bump_version(cache.ACTIVE_TOURNAMENTS)
+    page_cache.purge(page_cache.TOURNAMENTS, page_cache.MATCHES)
+
+
+@receiver([post_save, post_delete], sender=Sport)
+def sport_changed(sender, instance, **kwargs):
+    # Название и иконка вида спорта выводятся в виджете и списке турниров
+    cache.bump_version(cache.ACTIVE_TOURNAMENTS)
+    page_cache.purge(page_cache.TOURNAMENTS)
+
+
+# updated_at статьи - основа ETag/Last-Modified страницы статьи (views.article_detail).
+# Изменения связанных объектов, которые видны на странице, тоже должны его сдвигать.
+
+def touch_articles(articles):
+    # update() без сигналов: кэш виджетов от этих полей не зависит,
+    # а закэшированные страницы самих статей сбрасываем явно
+    pks = list(articles.values_list('pk', flat=True))
+    if pks:
+        Article.objects.filter(pk__in=pks).update(updated_at=timezone.now())
+        page_cache.purge(*[page_cache.article_tag(pk) for pk in pks])
+    return pks
+
+
+@receiver(m2m_changed, sender=Article.related_teams.through)
+@receiver(m2m_changed, sender=Article.related_athletes.through)
+@receiver(m2m_changed, sender=Article.tags.through)
+def article_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Общие теги/команды/игроки - основа похожих новостей, их тоже пересчитываем (после коммита)
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            related.schedule(touch_articles(Article.objects.filter(pk=instance.pk)))
+    elif action in ('post_add', 'post_remove'):
+        related.schedule(touch_articles(Article.objects.filter(pk__in=pk_set)))
+    elif action == 'pre_clear':
+        # После clear() связанных статей уже не найти - отмечаем их заранее
+        field = {
+            Article.related_teams.through: 'related_teams',
+            Article.related_athletes.through: 'related_athletes',
+            Article.tags.through: 'tags',
+        }[sender]
+        related.schedule(touch_articles(Article.objects.filter(**{field: instance})))
+
+
+@receiver(post_save, sender=Team)
+def team_saved(sender, instance, created, **kwargs):
+    if not created:
+        # Команды выводятся и в блоке связей, и в названии матча статьи ({{ article.match }})
+        touch_articles(Article.objects.filter(
+            Q(related_teams=instance) | Q(match__home_team=instance) | Q(match__away_team=instance)
+        ).distinct())
+        # Названия команд выводятся в блоке матчей на главной
+        page_cache.purge(page_cache.MATCHES)
+
+
+@receiver(post_save, sender=Athlete)
+def athlete_saved(sender, instance, created, **kwargs):
+    if not created:
+        touch_articles(Article.objects.filter(related_athletes=instance))
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, created, **kwargs):
+    if not created:
+        touch_articles(Article.objects.filter(tags=instance))
+
+
+@receiver(post_save, sender=Match)
+def match_articles_changed(sender, instance, created, **kwargs):
+    # Статус и команды матча выводятся в блоке связей статьи
+    if not created:
+        touch_articles(Article.objects.filter(match=instance))
@@ -0,0 +1,136 @@
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+from django.conf import settings
+
+'''
+Журнал медленных запросов.
+Обертка execute ставится на каждое новое соединение (сигнал connection_created, см. apps.py).
+Запрос дольше SLOW_QUERY_MS миллисекунд пишется в лог 'sports.slow_queries' вместе
+с параметрами, местом в коде (вьюха/строка шаблона) и планом EXPLAIN QUERY PLAN.
+Запросы одной формы (нормализованный SQL) копятся вместе: полный отчет пишется при первом
+появлении формы, дальше - короткая сводка на 10-м, 100-м, 1000-м... повторе.
+'''
+
+logger = logging.getLogger('sports.slow_queries')
+
+_shapes = {}
+_shapes_lock = threading.Lock()
+_local = threading.local()
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SPACES_RE = re.compile(r'\s+')
+
+
+def threshold():
+    # None - журнал выключен, 0 - писать все запросы
+    return getattr(settings, 'SLOW_QUERY_MS', None)
+
+
+def normalize(sql):
+    """Форма запроса: без литералов и с одинаковыми IN-списками любой длины."""
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    sql = LITERAL_RE.sub('?', sql)
+    return SPACES_RE.sub(' ', sql).strip()
+
+
+# Служебные модули (замеры, профайлер) местом запроса не считаются
+INFRASTRUCTURE = ('instrumentation.py', 'metrics.py', 'profiling.py', 'slow_queries.py')
+
+
+def origin(depth=3):
+    """
+    Где запрос выполнен: строка шаблона (узел, который рендерился) и до depth кадров кода
+    проекта, от места запроса к вызывающим: "sports/pagination.py:116 in ... <- sports/views.py:55 in home".
+    """
+    code, template = [], None
+    base_dir = str(settings.BASE_DIR)
+    frame = sys._getframe(2)
+    while frame is not None and len(code) < depth:
+        filename = frame.f_code.co_filename
+        if template is None and frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            token = getattr(node, 'token', None)
+            node_origin = getattr(node, 'origin', None)
+            if token is not None and node_origin is not None:
+                template = f'{node_origin.template_name}:{token.lineno}'
+        elif (filename.startswith(base_dir) and 'site-packages' not in filename
+              and not filename.endswith(INFRASTRUCTURE)):
+            code.append(f'{os.path.relpath(filename, base_dir)}:{frame.f_lineno} in {frame.f_code.co_name}')
+        frame = frame.f_back
+    return ' <- '.join(code) or None, template
+
+
+def explain(connection, sql, params):
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return []
+    # Сам EXPLAIN тоже идет через обертку - не даем ему зациклиться
+    _local.explaining = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+    except Exception as exc:  # план - это подсказка, из-за него запрос падать не должен
+        return [f'EXPLAIN не удался: {exc}']
+    finally:
+        _local.explaining = False
+
+
+def record(connection, sql, params, many, elapsed_ms):
+    shape = normalize(sql)
+    with _shapes_lock:
+        stats = _shapes.setdefault(shape, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        stats['count'] += 1
+        stats['total_ms'] += elapsed_ms
+        stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+        count = stats['count']
+
+    if count == 1:
+        code, template = origin()
+        plan = [] if many else explain(connection, sql, params)
+        stats.update(plan=plan, origin=code, template=template)
+        logger.warning(
+            'Медленный запрос %.1f мс\n  SQL: %s\n  Параметры: %.500r\n  Код: %s\n  Шаблон: %s\n  План:\n    %s',
+            elapsed_ms, sql, params, code, template, '\n    '.join(plan) or '-',
+        )
+    elif count in (10, 100, 1000) or count % 10000 == 0:
+        logger.warning(
+            'Медленный запрос повторился %d раз: среднее %.1f мс, максимум %.1f мс\n  SQL: %s',
+            count, stats['total_ms'] / count, stats['max_ms'], shape,
+        )
+
+
+def slow_query_wrapper(execute, sql, params, many, context):
+    limit = threshold()
+    if limit is None or getattr(_local, 'explaining', False):
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms >= limit:
+            record(context['connection'], sql, params, many, elapsed_ms)
+
+
+def install(sender, connection, **kwargs):
+    # Обработчик connection_created: на каждое новое соединение ставим обертку один раз
+    if slow_query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(slow_query_wrapper)
+
+
+def report():
+    """Формы медленных запросов этого процесса, самые затратные сверху."""
+    with _shapes_lock:
+        rows = [{'sql': shape, **stats} for shape, stats in _shapes.items()]
+    return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+
+def reset():
+    with _shapes_lock:
+        _shapes.clear()
@@ -0,0 +1,97 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Match, TournamentStanding
+
+# Очки за победу / ничью / поражение
+POINTS_WIN = 3
+POINTS_DRAW = 1
+POINTS_LOSS = 0
+
+COUNTER_FIELDS = ('played', 'won', 'drawn', 'lost', 'goals_for', 'goals_against', 'points')
+
+
+def _team_row(scored, conceded):
+    # Вклад одного матча в строку таблицы одной команды
+    if scored > conceded:
+        result = {'won': 1, 'points': POINTS_WIN}
+    elif scored == conceded:
+        result = {'drawn': 1, 'points': POINTS_DRAW}
+    else:
+        result = {'lost': 1, 'points': POINTS_LOSS}
+    result.update(played=1, goals_for=scored, goals_against=conceded)
+    return result
+
+
+def match_contribution(values):
+    """
+    Вклад матча в турнирную таблицу: {(tournament_id, team_id): {поле: приращение}}.
+    values - словарь с tournament_id, home_team_id, away_team_id, status, score_home, score_away.
+    В таблицу попадают только завершенные матчи с известным счетом.
+    """
+    if values.get('status') != 'finished':
+        return {}
+    home, away = values.get('score_home'), values.get('score_away')
+    if home is None or away is None:
+        return {}
+    tournament_id = values['tournament_id']
+    return {
+        (tournament_id, values['home_team_id']): _team_row(home, away),
+        (tournament_id, values['away_team_id']): _team_row(away, home),
+    }
+
+
+def match_values(match):
+    return {name: getattr(match, name) for name in Match.tracked_fields}
+
+
+def apply_contribution(contribution, sign):
+    # sign = 1 - добавить матч в таблицу, -1 - убрать
+    for (tournament_id, team_id), deltas in contribution.items():
+        updates = {name: F(name) + sign * value for name, value in deltas.items() if value}
+        if sign > 0:
+            TournamentStanding.objects.get_or_create(tournament_id=tournament_id, team_id=team_id)
+        # При вычитании строки не создаем: команда может удаляться каскадом вместе с матчем
+        TournamentStanding.objects.filter(tournament_id=tournament_id, team_id=team_id).update(**updates)
+
+
+def update_for_match(old_values, new_values):
+    old = match_contribution(old_values)
+    new = match_contribution(new_values)
+    if old == new:
+        return
+    with transaction.atomic():
+        apply_contribution(old, -1)
+        apply_contribution(new, 1)
+
+
+def rebuild_standings(tournaments=None):
+    """
+    Пересчитывает таблицу с нуля (например, после bulk_create, минующего сигналы).
+    Возвращает количество записанных строк.
+    """
+    matches = Match.objects.filter(status='finished', score_home__isnull=False, score_away__isnull=False)
+    standings = TournamentStanding.objects.all()
+    if tournaments is not None:
+        matches = matches.filter(tournament__in=tournaments)
+        standings = standings.filter(tournament__in=tournaments)
+
+    totals = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+    rows = matches.order_by().values_list(*Match.tracked_fields).iterator(chunk_size=5000)
+    for row in rows:
+        for key, deltas in match_contribution(dict(zip(Match.tracked_fields, row))).items():
+            for name, value in deltas.items():
+                totals[key][name] += value
+
+    with transaction.atomic():
+        standings.delete()
+        TournamentStanding.objects.bulk_create(
+            [
+                TournamentStanding(tournament_id=tournament_id, team_id=team_id, **counters)
+                for (tournament_id, team_id), counters in totals.items()
+            ],
+            batch_size=1000,
+        )
+    return len(totals)
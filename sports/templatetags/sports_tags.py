@@ -1,4 +1,8 @@
 from django import template
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .. import cache, renditions
 from ..models import Article, Tournament
 
 register = template.Library()
@@ -20,18 +24,44 @@ def user_status_color(context):
         return "red" # Админ - красный
     return "blue" # Обычный - синий
 
-# Задание Тег, возвращающий набор запросов (Inclusion tag)
-@register.inclusion_tag('sports/tags/latest_news.html')
+# Задание Тег, возвращающий набор запросов (бывший inclusion tag - шаблоны те же,
+# но виджеты рендерятся из кэша фрагментов: в установившемся режиме 0 запросов к БД).
+# Версия ключа меняется сигналами (см. signals.py), когда меняются статьи или турниры.
+@register.simple_tag
 def show_latest_news(count=3):
-    #Возвращает QuerySet последних новостей для отрисовки в боковой панели
-    latest = Article.published.all().order_by('-created_at')[:count]
-    return {'latest_news': latest}
+    #Возвращает последние новости для отрисовки в боковой панели
+    def render():
+        latest = Article.published.defer('content', 'content_html').order_by('-created_at')[:count]
+        return render_to_string('sports/tags/latest_news.html', {'latest_news': latest})
+
+    return mark_safe(cache.get_or_render(cache.LATEST_NEWS, [count], render))
 
-@register.inclusion_tag('sports/tags/active_tournaments.html')
+@register.simple_tag
 def show_active_tournaments(count=5):
     """
     Возвращает список активных турниров.
     Сортируем по id или name, берем первые 'count' штук.
     """
-    tournaments = Tournament.objects.filter(is_active=True).order_by('name')[:count]
-    return {'tournaments': tournaments}
\ No newline at end of file
+    def render():
+        tournaments = Tournament.objects.filter(is_active=True).select_related('sport').order_by('name')[:count]
+        return render_to_string('sports/tags/active_tournaments.html', {'tournaments': tournaments})
+
+    return mark_safe(cache.get_or_render(cache.ACTIVE_TOURNAMENTS, [count], render))
+
+
+# Уменьшенные копии картинок (sports.renditions): все пути лежат в самом объекте, запросов нет
+@register.simple_tag
+def picture(obj, name, alt='', sizes=None, **attrs):
+    # {% picture article 'card' alt=article.title sizes='(max-width: 600px) 100vw, 480px' class='img-fluid' %}
+    return renditions.picture(obj, name, alt, sizes, **attrs)
+
+
+@register.filter
+def rendition_url(obj, name):
+    # Для CSS-фонов: {{ article|rendition_url:'hero' }} (оригинал, пока копий нет)
+    return renditions.rendition_url(obj, name)
+
+
+@register.filter
+def srcset(obj, ext='webp'):
+    return renditions.srcset(obj, ext)
@@ -1,3 +1,1678 @@
-from django.test import TestCase
+import asyncio
+import json
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.db import OperationalError, connection, connections
+from django.db.models import F
+from django.db.utils import ConnectionHandler
+from django.template import Context, Template
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from lab7.urls import urlpatterns
+
+from . import cache as fragment_cache
+from . import db, exports, jobs, live, metrics, profiling, related, routers, slow_queries
+from .instrumentation import QueryStats, scanned_rows, scanned_tables
+from .management.commands import bench
+from .management.commands.fill_db import DataGenerator
+from .leaderboards import rebuild_leaderboards, sport_leaders, tournament_leaders
+from .pagination import CappedCountPaginator, cursor_paginate, encode_cursor
+from .search import search_articles
+from .forms import ArticleForm
+from .models import (Article, Athlete, AthleteStats, Job, Match, MatchParticipation, RelatedArticle, Sport, Tag, Team,
+                     Tournament, TournamentStanding)
+from .standings import rebuild_standings
+
+
+class SportsDataMixin:
+    # Минимальный набор справочников для тестов
+    @classmethod
+    def setUpTestData(cls):
+        cls.sport = Sport.objects.create(name='Футбол', slug='soccer')
+        cls.tournament = Tournament.objects.create(name='Кубок', sport=cls.sport, slug='cup')
+        cls.home = Team.objects.create(name='Спартак', sport=cls.sport, slug='spartak')
+        cls.away = Team.objects.create(name='Динамо', sport=cls.sport, slug='dynamo')
+
+    def create_match(self, **kwargs):
+        values = {
+            'tournament': self.tournament,
+            'home_team': self.home,
+            'away_team': self.away,
+            'date_time': timezone.now() + timedelta(days=1),
+        }
+        values.update(kwargs)
+        return Match.objects.create(**values)
+
+
+class StandingsTests(SportsDataMixin, TestCase):
+    def table(self):
+        return {
+            row.team_id: (row.played, row.won, row.drawn, row.lost, row.goals_for, row.goals_against, row.points)
+            for row in TournamentStanding.objects.all()
+        }
+
+    def test_finished_match_updates_table(self):
+        match = self.create_match(status='live', score_home=1, score_away=0)
+        self.assertEqual(self.table(), {})
+
+        match.status = 'finished'
+        match.save()
+        self.assertEqual(self.table(), {
+            self.home.pk: (1, 1, 0, 0, 1, 0, 3),
+            self.away.pk: (1, 0, 0, 1, 0, 1, 0),
+        })
+
+        # Исправление счета пересчитывает только разницу
+        match.score_away = 1
+        match.save()
+        self.assertEqual(self.table(), {
+            self.home.pk: (1, 0, 1, 0, 1, 1, 1),
+            self.away.pk: (1, 0, 1, 0, 1, 1, 1),
+        })
+
+        Match.objects.get(pk=match.pk).delete()
+        self.assertEqual(self.table(), {
+            self.home.pk: (0, 0, 0, 0, 0, 0, 0),
+            self.away.pk: (0, 0, 0, 0, 0, 0, 0),
+        })
+
+    def test_incremental_table_matches_rebuild(self):
+        self.create_match(status='finished', score_home=2, score_away=0)
+        self.create_match(status='finished', score_home=1, score_away=3)
+        self.create_match(status='scheduled')
+        incremental = self.table()
+
+        TournamentStanding.objects.all().delete()
+        rebuild_standings()
+        self.assertEqual(self.table(), incremental)
+
+    def test_standings_page(self):
+        self.create_match(status='finished', score_home=2, score_away=0)
+        response = self.client.get(reverse('tournament_standings', args=[self.tournament.slug]))
+        self.assertContains(response, self.home.name)
+        self.assertEqual(response.context['standings'][0].team, self.home)
+
+
+class LeaderboardTests(SportsDataMixin, TestCase):
+    def setUp(self):
+        self.striker = Athlete.objects.create(first_name='Иван', last_name='Петров', sport=self.sport,
+                                              current_team=self.home)
+        self.keeper = Athlete.objects.create(first_name='Петр', last_name='Иванов', sport=self.sport,
+                                             current_team=self.away)
+
+    def stats(self):
+        return {
+            (row.athlete_id, row.tournament_id): (row.matches, row.goals, row.minutes, row.yellow_cards)
+            for row in AthleteStats.objects.all()
+        }
+
+    def test_counters_follow_participation_changes(self):
+        match = self.create_match(status='finished', score_home=2, score_away=0)
+        row = MatchParticipation.objects.create(match=match, athlete=self.striker, goals_scored=2, minutes_played=90)
+        MatchParticipation.objects.create(match=match, athlete=self.keeper, minutes_played=90, yellow_card=True)
+
+        self.assertEqual(self.stats()[(self.striker.pk, self.tournament.pk)], (1, 2, 90, 0))
+        self.assertEqual(self.stats()[(self.striker.pk, None)], (1, 2, 90, 0))
+        self.assertEqual(
+            [leader.athlete for leader in tournament_leaders(self.tournament, 'cards')], [self.keeper]
+        )
+
+        row.goals_scored = 1
+        row.save()
+        self.assertEqual(self.stats()[(self.striker.pk, self.tournament.pk)], (1, 1, 90, 0))
+
+        row.delete()
+        self.assertEqual(self.stats()[(self.striker.pk, None)], (0, 0, 0, 0))
+        self.assertEqual(list(sport_leaders(self.sport, 'goals')), [])
+
+    def test_incremental_counters_match_rebuild(self):
+        first = self.create_match(status='finished', score_home=1, score_away=1)
+        second = self.create_match(status='finished', score_home=3, score_away=0)
+        for match, goals in ((first, 1), (second, 3)):
+            MatchParticipation.objects.create(match=match, athlete=self.striker, goals_scored=goals, minutes_played=80)
+        incremental = self.stats()
+
+        AthleteStats.objects.all().delete()
+        rebuild_leaderboards()
+        self.assertEqual(self.stats(), incremental)
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        # Одинаковое время у пар статей - ключ должен различать их по id
+        for i in range(12):
+            Article.objects.create(title=f'Новость {i}', created_at=now - timedelta(hours=i // 2))
+        cls.ordering = ('-created_at', '-id')
+        cls.expected = list(Article.published.order_by(*cls.ordering))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_walk_forward_and_back(self):
+        pages, cursor = [], None
+        while True:
+            page = cursor_paginate(Article.published.all(), self.ordering, cursor, per_page=5)
+            pages.append(page)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual([article for page in pages for article in page], self.expected)
+        self.assertFalse(pages[0].has_previous())
+
+        back = cursor_paginate(Article.published.all(), self.ordering, pages[-1].previous_cursor, per_page=5)
+        self.assertEqual(list(back), list(pages[-2]))
+
+    def test_invalid_cursor_returns_first_page(self):
+        page = cursor_paginate(Article.published.all(), self.ordering, 'garbage!', per_page=5)
+        self.assertEqual(list(page), self.expected[:5])
+
+    def test_tampered_cursor_values_return_first_page(self):
+        # Курсор декодируется, но значения ключа подделаны - первая страница вместо 500
+        keys = [['garbage', 1], [None, None], [{'a': 1}, 1], [1, 2, 3, 4, 5], ['2026-01-01T00:00:00+00:00', 'x']]
+        for url in (reverse('article_list'), reverse('tournament_list'), reverse('home')):
+            for key in keys:
+                with self.subTest(url=url, key=key):
+                    response = self.client.get(url, {'cursor': encode_cursor('n', key)})
+                    self.assertEqual(response.status_code, 200)
+        cache.clear()
+        response = self.client.get(reverse('article_list'), {'cursor': encode_cursor('n', ['garbage', 1])})
+        self.assertEqual(list(response.context['posts']), self.expected[:5])
+
+    def test_list_views_use_cursor_without_count(self):
+        response = self.client.get(reverse('article_list'))
+        next_cursor = response.context['posts'].next_cursor
+        response = self.client.get(reverse('article_list'), {'cursor': next_cursor})
+        self.assertEqual(list(response.context['posts']), self.expected[5:10])
+        # Номерная пагинация осталась как запасной вариант
+        response = self.client.get(reverse('article_list'), {'page': 2})
+        self.assertEqual(list(response.context['posts']), self.expected[5:10])
+        self.assertEqual(self.client.get(reverse('tournament_list')).status_code, 200)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.final = Article.objects.create(title='Финал кубка', content='Спартак забил <b>три</b> гола в финале.')
+        cls.draft = Article.objects.create(title='Черновик о финале', content='Финал', is_published=False)
+        cls.other = Article.objects.create(title='Трансферы', content='Новости трансферного окна, упоминается финал.')
+
+    def test_ranked_and_only_published(self):
+        results = search_articles('финал')
+        self.assertEqual(results[0], self.final)
+        self.assertNotIn(self.draft, results)
+        self.assertIn(self.other, results)
+
+    def test_index_follows_edits_and_deletes(self):
+        self.other.content = 'Новости трансферного окна.'
+        self.other.title = 'Окно закрыто'
+        self.other.save()
+        self.assertNotIn(self.other, search_articles('финал'))
+        self.assertEqual(search_articles('закрыто'), [self.other])
+
+        self.final.delete()
+        self.assertEqual(search_articles('спартак'), [])
+
+    def test_snippet_is_escaped_and_highlighted(self):
+        response = self.client.get(reverse('article_search'), {'q': 'три "'})
+        self.assertContains(response, '<mark>три</mark>')
+        self.assertNotContains(response, '<b>')
+
+
+class WidgetCacheTests(SportsDataMixin, TestCase):
+    template = Template('{% load sports_tags %}{% show_latest_news 3 %}|{% show_active_tournaments 5 %}')
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self):
+        return self.template.render(Context())
+
+    def test_cached_widgets_cost_no_queries(self):
+        Article.objects.create(title='Первая новость')
+        self.render()
+        with self.assertNumQueries(0):
+            html = self.render()
+        self.assertIn('Первая новость', html)
+        self.assertIn(self.tournament.name, html)
+
+    def test_article_changes_invalidate_news(self):
+        article = Article.objects.create(title='Старый заголовок')
+        self.render()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            article.title = 'Новый заголовок'
+            article.save()
+        self.assertIn('Новый заголовок', self.render())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            article.is_published = False
+            article.save()
+        self.assertNotIn('Новый заголовок', self.render())
+
+        # Правка черновика кэш не трогает
+        version = fragment_cache.get_version(fragment_cache.LATEST_NEWS)
+        with self.captureOnCommitCallbacks(execute=True):
+            article.content = 'Текст черновика'
+            article.save()
+        self.assertEqual(fragment_cache.get_version(fragment_cache.LATEST_NEWS), version)
+
+    def test_tournament_flip_invalidates_tournaments(self):
+        self.render()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tournament.is_active = False
+            self.tournament.save()
+        self.assertNotIn(self.tournament.name, self.render())
+
+
+# Здесь проверяется сама вьюха, кэш страниц для анонимов отключен
+@override_settings(PAGE_CACHE_URL_NAMES=[])
+class HomePageTests(SportsDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_query_count_does_not_grow_with_matches(self):
+        for hours in range(1, 6):
+            self.create_match(date_time=timezone.now() + timedelta(hours=hours))
+        # За пределами окна и отмененные - не показываются
+        self.create_match(date_time=timezone.now() + timedelta(days=30))
+        self.create_match(status='canceled')
+
+        self.client.get(reverse('home'))  # прогрев кэша виджетов и счетчика голов
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(len(response.context['matches']), 5)
+
+    def test_load_more_cursor(self):
+        for hours in range(1, 26):
+            self.create_match(date_time=timezone.now() + timedelta(hours=hours))
+        first = self.client.get(reverse('home')).context['matches']
+        self.assertTrue(first.has_next())
+        second = self.client.get(reverse('home'), {'cursor': first.next_cursor}).context['matches']
+        self.assertEqual(len(first) + len(second), 25)
+
+    def test_total_goals_counter_follows_saves(self):
+        self.create_match(score_home=2)
+        self.assertEqual(self.client.get(reverse('home')).context['total_goals']['score_home__sum'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            match = self.create_match(score_home=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            match.delete()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['total_goals']['score_home__sum'], 2)
+
+
+@override_settings(PAGE_CACHE_URL_NAMES=[])
+class ArticleDetailTests(SportsDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.article = Article.objects.create(title='Матч недели', content='Текст', match=self.create_match())
+        self.article.related_teams.set([self.home, self.away])
+        self.url = self.article.get_absolute_url()
+
+    def test_query_count_does_not_depend_on_relations(self):
+        # Статья + 3 предзагрузки M2M + похожие новости (+1 легкий запрос updated_at для ETag)
+        with self.assertNumQueries(6):
+            response = self.client.get(self.url)
+        self.assertContains(response, self.home.name)
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Переименование связанной команды меняет ETag
+        self.home.name = 'Спартак-2'
+        self.home.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Спартак-2')
+
+    def test_team_rename_through_match_changes_etag(self):
+        # Статья без related_teams: команда видна только в названии матча
+        self.article.related_teams.clear()
+        etag = self.client.get(self.url)['ETag']
+        self.away.name = 'Динамо-2'
+        self.away.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Динамо-2')
+
+
+@override_settings(PAGE_CACHE_URL_NAMES=[])
+class ArticleRenderedContentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_save_renders_excerpt_and_html(self):
+        text = ' '.join(f'слово{i}' for i in range(40)) + '\n\n<b>жирный</b>'
+        article = Article.objects.create(title='Длинная', content=text)
+        self.assertEqual(article.excerpt, ' '.join(f'слово{i}' for i in range(30)) + ' …')
+        self.assertIn('<p>слово0', article.content_html)
+        self.assertIn('&lt;b&gt;жирный&lt;/b&gt;</p>', article.content_html)
+
+        article.content = 'Новый текст'
+        article.save(update_fields=['content'])
+        article.refresh_from_db()
+        self.assertEqual((article.excerpt, article.content_html), ('Новый текст', '<p>Новый текст</p>'))
+
+    def test_deferred_content_is_kept(self):
+        article = Article.objects.create(title='Статья', content='Текст')
+        article = Article.objects.defer('content').get(pk=article.pk)
+        article.title = 'Другой заголовок'
+        article.save()
+        self.assertEqual(Article.objects.get(pk=article.pk).content_html, '<p>Текст</p>')
+
+    def test_list_does_not_load_content(self):
+        Article.objects.create(title='Статья', content='Очень длинный текст статьи')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('article_list'))
+        self.assertContains(response, 'Очень длинный текст статьи')
+        article_queries = [query['sql'] for query in queries.captured_queries if 'FROM "sports_article"' in query['sql']]
+        self.assertTrue(article_queries)
+        for sql in article_queries:
+            self.assertNotIn('"sports_article"."content"', sql)
+
+    def test_render_articles_command(self):
+        article = Article.objects.create(title='Статья', content='Текст')
+        Article.objects.filter(pk=article.pk).update(excerpt='', content_html='')
+        out = StringIO()
+        call_command('render_articles', batch_size=1, stdout=out)
+        self.assertIn('Статей обработано: 1', out.getvalue())
+        article.refresh_from_db()
+        self.assertEqual((article.excerpt, article.content_html), ('Текст', '<p>Текст</p>'))
+
+    def test_migration_backfills_existing_articles(self):
+        backfill = import_module('sports.migrations.0011_backfill_article_content')
+        article = Article.objects.create(title='Статья', content='Старый <текст>')
+        Article.objects.filter(pk=article.pk).update(excerpt='', content_html='')
+        backfill.render_existing_articles(django_apps, None)
+        article.refresh_from_db()
+        self.assertEqual((article.excerpt, article.content_html), ('Старый <текст>', '<p>Старый &lt;текст&gt;</p>'))
+
+
+class PageCacheTests(SportsDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.article = Article.objects.create(title='Кэшируемая статья')
+        self.other = Article.objects.create(title='Другая статья')
+
+    def test_anonymous_hit_skips_view(self):
+        url = self.article.get_absolute_url()
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+
+        # Разные query string - разные записи
+        self.assertEqual(self.client.get(url, {'x': 1})['X-Page-Cache'], 'miss')
+
+    def test_save_purges_only_dependent_pages(self):
+        url, other_url = self.article.get_absolute_url(), self.other.get_absolute_url()
+        for page in (url, other_url, reverse('tournament_list')):
+            self.client.get(page)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.article.title = 'Новый заголовок'
+            self.article.save()
+
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Новый заголовок')
+        self.assertEqual(self.client.get(other_url)['X-Page-Cache'], 'hit')
+        self.assertEqual(self.client.get(reverse('tournament_list'))['X-Page-Cache'], 'hit')
+
+    def test_logged_in_users_bypass_cache(self):
+        url = self.article.get_absolute_url()
+        self.client.get(url)
+        user = User.objects.create_user('reader', password='pass')
+        self.client.force_login(user)
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('X-Page-Cache'))
+        self.assertContains(response, 'reader')
+
+
+class LiveScoreTests(SportsDataMixin, TestCase):
+    def test_broker_fans_out_to_every_subscriber(self):
+        broker = live.LocalBroker()
+
+        async def scenario():
+            queues = [broker.subscribe() for _ in range(3)]
+            broker.publish({'id': 1, 'score_home': 1})
+            events = [await asyncio.wait_for(queue.get(), 1) for queue in queues]
+            broker.unsubscribe(queues[0])
+            return events
+
+        self.assertEqual(asyncio.run(scenario()), [{'id': 1, 'score_home': 1}] * 3)
+        self.assertEqual(broker.subscriber_count, 2)
+
+    def test_live_match_changes_are_published(self):
+        broker = mock.Mock()
+        with mock.patch.object(live, 'get_broker', return_value=broker):
+            with self.captureOnCommitCallbacks(execute=True):
+                match = self.create_match()  # запланированный матч - не трансляция
+            self.assertFalse(broker.publish.called)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                match.status, match.score_home, match.score_away = 'live', 1, 0
+                match.save()
+            event = broker.publish.call_args.args[0]
+            self.assertEqual((event['id'], event['score_home'], event['status']), (match.pk, 1, 'live'))
+
+    def test_stream_requires_asgi(self):
+        self.assertEqual(self.client.get(reverse('live_scores')).status_code, 501)
+
+    async def test_stream_sends_snapshot_of_live_matches(self):
+        match = await Match.objects.acreate(
+            tournament=self.tournament, home_team=self.home, away_team=self.away,
+            date_time=timezone.now(), status='live', score_home=2, score_away=1,
+        )
+        response = await self.async_client.get(reverse('live_scores'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        await anext(chunks)  # retry
+        message = (await anext(chunks)).decode()
+        await chunks.aclose()
+        data = json.loads(message.split('data: ', 1)[1])
+        self.assertEqual((data['id'], data['score_home'], data['score_away']), (match.pk, 2, 1))
+
+
+class FillDbTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def fill(self, seed=1):
+        call_command(
+            'fill_db', '--seed', str(seed), '--batch-size', '7', '--teams-per-sport', '3',
+            '--athletes-per-team', '4', '--matches', '12', '--articles', '5', stdout=StringIO(),
+        )
+
+    def test_counts_and_aggregates(self):
+        self.fill()
+        self.assertEqual(Team.objects.count(), 12)
+        self.assertEqual(Athlete.objects.count(), 48)
+        self.assertEqual(Match.objects.count(), 12)
+        # по 3 игрока с каждой стороны
+        self.assertEqual(MatchParticipation.objects.count(), 12 * 6)
+        self.assertEqual(Article.objects.count(), 5)
+        # bulk_create без сигналов - агрегаты пересчитаны в конце
+        played = sum(TournamentStanding.objects.values_list('played', flat=True))
+        self.assertEqual(played, 2 * Match.objects.filter(status='finished').count())
+        self.assertEqual(
+            sum(AthleteStats.objects.filter(tournament=None).values_list('goals', flat=True)),
+            sum(MatchParticipation.objects.values_list('goals_scored', flat=True)),
+        )
+        self.assertEqual([a.pk for a in search_articles(Article.objects.first().title)][:1], [Article.objects.first().pk])
+
+    def test_reference_date_anchors_generated_dates(self):
+        call_command('fill_db', '--seed', '1', '--reference-date', '2001-06-01', '--teams-per-sport', '2',
+                     '--athletes-per-team', '2', '--matches', '10', '--articles', '5', stdout=StringIO())
+        anchor = timezone.make_aware(datetime(2001, 6, 1))
+        for value in Match.objects.values_list('date_time', flat=True):
+            self.assertLessEqual(abs(value - anchor), timedelta(days=365))
+        for value in Article.objects.values_list('created_at', flat=True):
+            self.assertTrue(anchor - timedelta(days=365) <= value <= anchor)
+        for value in Athlete.objects.values_list('birth_date', flat=True):
+            self.assertLessEqual(value, anchor.date() - timedelta(days=18 * 365))
+
+    def test_rerun_with_same_seed_does_not_collide(self):
+        self.fill()
+        self.fill()
+        self.assertEqual(Team.objects.count(), 24)
+        self.assertEqual(Sport.objects.count(), 4)
+
+
+class BenchTests(SportsDataMixin, TestCase):
+    def test_query_stats_counts_fetched_rows(self):
+        for _ in range(3):
+            self.create_match()
+        with QueryStats() as stats:
+            list(Match.objects.all())
+            Match.objects.filter(pk=-1).first()
+        self.assertEqual((stats.queries, stats.rows), (2, 3))
+
+    def test_compare_reports_regressions(self):
+        baseline = {'scales': {'1': {'home': {'p95_ms': 10, 'rows': 20, 'queries': 4}}}}
+        same = {'scales': {'1': {'home': {'p95_ms': 11, 'rows': 20, 'queries': 4}}}}
+        worse = {'scales': {'1': {'home': {'p95_ms': 30, 'rows': 20, 'queries': 5}}}}
+        self.assertEqual(bench.compare(same, baseline, 0.25), [])
+        self.assertEqual(len(bench.compare(worse, baseline, 0.25)), 2)
+
+
+# Бюджеты для каждого именованного URL из lab7/urls.py:
+# (максимум запросов, максимум просмотренных строк по EXPLAIN QUERY PLAN на большом наборе).
+# Число запросов не должно зависеть от объема данных - это проверяется отдельно.
+# Строки растут из-за полных проходок (сумма голов, формы со всеми командами) - бюджет с запасом.
+QUERY_BUDGETS = {
+    'home': (4, 60),
+    'article_list': (6, 5),
+    'article_search': (1, 30),
+    'article_detail': (6, 10),
+    'article_create': (4, 90),
+    'article_update': (8, 90),
+    'article_delete': (4, 10),
+    'tournament_list': (1, 15),
+    'tournament_standings': (2, 10),
+    'tournament_leaders': (2, 10),
+    'sport_leaders': (2, 10),
+    'stats': (2, 120),
+    'live_scores': (0, 0),
+    'register': (0, 0),
+    'login': (0, 0),
+    'logout': (0, 0),
+    'metrics': (0, 0),
+    'profile_list': (2, 0),
+    'profile_file': (2, 0),
+    'export_file': (2, 0),
+    'export_data': (3, 50),
+}
+
+# Страницы, которые смотрит автор (формы статей)
+LOGIN_REQUIRED = {'article_create', 'article_update', 'article_delete', 'profile_list', 'profile_file', 'export_file',
+                  'export_data'}
+
+# Небольшой набор и добавка к нему (итого в 4 раза больше)
+SMALL_DATA = {'tournaments_per_sport': 1, 'teams_per_sport': 3, 'athletes_per_team': 4, 'matches': 10,
+              'players_per_side': 2, 'tags': 5, 'articles': 5}
+EXTRA_DATA = {**SMALL_DATA, 'teams_per_sport': 9, 'matches': 30, 'tags': 15, 'articles': 15}
+
+
+@override_settings(PAGE_CACHE_URL_NAMES=[])
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def url_names(self):
+        return {pattern.name for pattern in urlpatterns if getattr(pattern, 'name', None)}
+
+    def url_for(self, name):
+        article = Article.published.order_by('-created_at').first()
+        tournament = Tournament.objects.filter(matches__status='finished').first()
+        args = {
+            'article_detail': [article.slug],
+            'article_update': [article.pk],
+            'article_delete': [article.pk],
+            'tournament_standings': [tournament.slug],
+            'tournament_leaders': [tournament.slug],
+            'sport_leaders': [tournament.sport.slug],
+            'profile_file': ['1-home-1ms-1.txt'],
+            'export_file': ['match-report-1-000000000000.pdf'],
+            'export_data': ['matches', 'csv'],
+        }.get(name, [])
+        url = reverse(name, args=args)
+        return url + '?q=чемпионат' if name == 'article_search' else url
+
+    def measure(self):
+        results = {}
+        admin = User.objects.get(username='admin')
+        for name in sorted(QUERY_BUDGETS):
+            url = self.url_for(name)
+            if name in LOGIN_REQUIRED:
+                self.client.force_login(admin)
+            else:
+                self.client.logout()
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)  # выгрузки читают базу во время отдачи
+            # live_scores под WSGI-клиентом честно отвечает 501
+            if name != 'live_scores':
+                self.assertLess(response.status_code, 500, url)
+            rows = sum(scanned_rows(query['sql']) for query in queries.captured_queries)
+            results[name] = (len(queries), rows)
+        return results
+
+    def test_every_url_has_a_budget(self):
+        self.assertEqual(self.url_names() - set(QUERY_BUDGETS), set(), 'У новых URL должен быть бюджет запросов')
+
+    def test_budgets_at_two_data_sizes(self):
+        DataGenerator(seed=3, batch_size=500).generate(SMALL_DATA)
+        small = self.measure()
+        DataGenerator(seed=4, batch_size=500).generate(EXTRA_DATA)
+        large = self.measure()
+        for name, (max_queries, max_rows) in QUERY_BUDGETS.items():
+            with self.subTest(url=name):
+                queries, rows = large[name]
+                self.assertEqual(queries, small[name][0], 'Число запросов растет вместе с данными (N+1)')
+                self.assertLessEqual(queries, max_queries)
+                self.assertLessEqual(rows, max_rows)
+
+
+class MetricsTests(SportsDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store = override_settings(
+            METRICS_STORE=f'{directory.name}/metrics.sqlite3', METRICS_FLUSH_INTERVAL=0,
+            PAGE_CACHE_URL_NAMES=['home'], METRICS_TOKEN='secret',
+        )
+        store.enable()
+        self.addCleanup(store.disable)
+        metrics.reset()
+
+    def test_requests_are_labelled_by_url_name(self):
+        first = self.client.get(reverse('home'))
+        self.client.get(reverse('home'))
+        self.assertRegex(first['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=[\d.]+$')
+
+        body = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret').content.decode()
+        self.assertIn('# TYPE sports_http_request_duration_seconds histogram', body)
+        self.assertIn('sports_http_requests_total{status="200",view="home"} 2', body)
+        self.assertIn('sports_http_request_duration_seconds_bucket{le="+Inf",view="home"} 2', body)
+        self.assertIn('sports_cache_requests_total{cache="page",result="miss",view="home"} 1', body)
+        self.assertIn('sports_cache_requests_total{cache="page",result="hit",view="home"} 1', body)
+        # второй запрос отдан из кэша страниц, виджеты рендерились только в первом
+        self.assertIn('sports_cache_requests_total{cache="fragment",result="miss",view="home"} 2', body)
+
+    def test_flushes_add_up_in_shared_store(self):
+        # Так сбрасывают свои приращения разные процессы: значения в файле складываются
+        for _ in range(2):
+            metrics.inc('sports_db_queries_total', {'view': 'home'}, 3)
+            metrics.flush()
+        self.assertIn('sports_db_queries_total{view="home"} 6', metrics.exposition())
+
+    def test_metrics_are_not_public(self):
+        # Адрес прокси (127.0.0.1) ничего не дает - нужен токен или вход сотрудника
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+        staff = User.objects.create_user('monitor', password='x', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+
+class ProfilingTests(SportsDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        profiling_settings = override_settings(
+            PROFILING_ENABLED=True, PROFILING_TOKEN='secret', PROFILING_SAMPLE_RATES={'*': 0},
+            PROFILING_DIR=directory.name, PROFILING_KEEP=2, PAGE_CACHE_URL_NAMES=[],
+        )
+        profiling_settings.enable()
+        self.addCleanup(profiling_settings.disable)
+        # Цепочка middleware собирается при первом запросе клиента - уже с включенным профайлером
+        self.client = Client()
+
+    def test_disabled_profiler_leaves_the_chain(self):
+        with override_settings(PROFILING_ENABLED=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                profiling.SamplingProfilerMiddleware(lambda request: None)
+
+    def test_token_header_forces_profile_and_rotation_keeps_latest(self):
+        self.client.get(reverse('home'))
+        self.assertEqual(profiling.recent_profiles(), [])
+
+        for _ in range(3):
+            self.client.get(reverse('home'), HTTP_X_PROFILE='secret')
+        self.client.get(reverse('home'), HTTP_X_PROFILE='wrong')
+        profiles = profiling.recent_profiles()
+        self.assertEqual([profile['view'] for profile in profiles], ['home', 'home'])
+
+        staff = User.objects.create_user('staff', password='x', is_staff=True)
+        self.client.force_login(staff)
+        self.assertContains(self.client.get(reverse('profile_list')), profiles[0]['name'])
+        summary = self.client.get(reverse('profile_file', args=[profiles[0]['name'] + '.txt']))
+        self.assertIn(b'function calls', b''.join(summary.streaming_content))
+        self.assertEqual(self.client.get(reverse('profile_file', args=['..secret.txt'])).status_code, 404)
+
+    def test_profiles_page_is_staff_only(self):
+        self.client.force_login(User.objects.create_user('reader', password='x'))
+        self.assertEqual(self.client.get(reverse('profile_list')).status_code, 302)
+
+
+@override_settings(PAGE_CACHE_URL_NAMES=[])
+class SlowQueryLogTests(SportsDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        slow_queries.reset()
+        self.addCleanup(slow_queries.reset)
+
+    def test_normalize_collapses_literals_and_in_lists(self):
+        self.assertEqual(
+            slow_queries.normalize('SELECT * FROM t WHERE id IN (%s, %s, %s) AND  x = 5'),
+            slow_queries.normalize("SELECT * FROM t WHERE id IN (%s) AND x = 7"),
+        )
+
+    def test_slow_queries_are_logged_with_plan_and_origin(self):
+        self.create_match()
+        with override_settings(SLOW_QUERY_MS=0), self.assertLogs('sports.slow_queries') as logs:
+            self.client.get(reverse('home'))
+            self.client.get(reverse('home'))
+
+        shapes = {row['sql']: row for row in slow_queries.report()}
+        window = next(row for sql, row in shapes.items() if 'FROM "sports_match" INNER JOIN' in sql)
+        self.assertEqual(window['count'], 2)
+        self.assertTrue(window['plan'])
+        self.assertIn('sports/views.py', window['origin'])
+        # Новости виджета читаются лениво, при рендере шаблона
+        news = next(row for sql, row in shapes.items() if sql.startswith('SELECT "sports_article"."id"'))
+        self.assertTrue(news['template'].startswith('sports/tags/latest_news.html:'))
+        self.assertIn('sports/templatetags/sports_tags.py', news['origin'])
+        # Полный отчет - один раз на форму запроса
+        self.assertEqual(sum('SELECT "sports_match"."id"' in line and 'План' in line for line in logs.output), 1)
+
+    def test_disabled_by_default_threshold_none(self):
+        with override_settings(SLOW_QUERY_MS=None):
+            self.client.get(reverse('home'))
+        self.assertEqual(slow_queries.report(), [])
+
+
+class IndexAdvisorTests(TestCase):
+    def test_reports_scans_and_hot_paths_use_indexes(self):
+        DataGenerator(seed=5, batch_size=500).generate(SMALL_DATA)
+        out = StringIO()
+        call_command('explain_queries', stdout=out)
+        report = out.getvalue()
+        self.assertIn('Запросов с проблемами:', report)
+        # Сводная таблица матчей и справочники админки проходятся целиком - это и показываем
+        self.assertIn('SCAN sports_match', report)
+        # Лента новостей идет по частичному индексу, без сортировки во временном B-дереве
+        sql = str(Article.published.order_by('-created_at', '-id')[:10].query)
+        self.assertEqual(scanned_tables(sql), [])
+        # Служебный суперпользователь откатывается вместе с транзакцией
+        self.assertFalse(User.objects.filter(username='explain-queries').exists())
+
+    def test_max_scan_rows_fails_ci(self):
+        DataGenerator(seed=5, batch_size=500).generate(SMALL_DATA)
+        with self.assertRaises(CommandError):
+            call_command('explain_queries', '--max-scan-rows', '1', stdout=StringIO())
+
+    def test_synthetic_traffic_stays_out_of_metrics_and_slow_log(self):
+        DataGenerator(seed=5, batch_size=500).generate(SMALL_DATA)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store = f'{directory.name}/metrics.sqlite3'
+        with override_settings(METRICS_STORE=store, METRICS_FLUSH_INTERVAL=0, SLOW_QUERY_MS=0), \
+                mock.patch.object(slow_queries.logger, 'warning') as slow_log:
+            call_command('explain_queries', stdout=StringIO())
+            metrics.flush()
+            self.assertNotIn('sports_http_requests_total', metrics.exposition())
+        slow_log.assert_not_called()
+
+
+@override_settings(SLOW_QUERY_MS=None)
+class SqliteProductionModeTests(SimpleTestCase):
+    """Отдельный файл базы с прагмами из settings.SQLITE_PRAGMAS, как в SQLITE_PRODUCTION."""
+
+    def connections(self, **pragmas):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # default обязателен для ConnectionHandler, но не используется (пустой - dummy-бэкенд)
+        handler = ConnectionHandler({'default': {}, 'production': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': f'{directory.name}/db.sqlite3',
+            'OPTIONS': {
+                'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in pragmas.items()),
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }})
+        self.addCleanup(handler.close_all)
+        with handler['production'].cursor() as cursor:
+            cursor.execute('CREATE TABLE score (value INTEGER)')
+            cursor.execute('INSERT INTO score VALUES (1)')
+        return handler
+
+    def read_while_writing(self, handler, write_lock):
+        # Писатель держит открытую транзакцию, читатель в другом потоке считает строки
+        writer = handler['production']
+        writer.cursor().execute(f'BEGIN {write_lock}')
+        writer.cursor().execute('INSERT INTO score VALUES (2)')
+        result = {}
+
+        def read():
+            try:
+                started = time.monotonic()
+                with handler['production'].cursor() as cursor:
+                    cursor.execute('SELECT COUNT(*) FROM score')
+                    result['count'] = cursor.fetchone()[0]
+                result['seconds'] = time.monotonic() - started
+            except OperationalError as exc:
+                result['error'] = str(exc)
+            finally:
+                handler['production'].close()
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join()
+        writer.cursor().execute('COMMIT')
+        return result
+
+    def test_pragmas_are_applied_on_connect(self):
+        handler = self.connections(**settings.SQLITE_PRAGMAS)
+        with handler['production'].cursor() as cursor:
+            values = {}
+            for name in ('journal_mode', 'synchronous', 'busy_timeout', 'temp_store', 'cache_size'):
+                cursor.execute(f'PRAGMA {name}')
+                values[name] = cursor.fetchone()[0]
+        self.assertEqual(values, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000,
+                                  'temp_store': 2, 'cache_size': -65536})
+
+    def test_readers_do_not_block_on_writer_in_wal(self):
+        handler = self.connections(**{**settings.SQLITE_PRAGMAS, 'busy_timeout': 300})
+        result = self.read_while_writing(handler, 'EXCLUSIVE')
+        # Читатель сразу видит последнее зафиксированное состояние
+        self.assertEqual(result.get('count'), 1)
+        self.assertLess(result['seconds'], 0.25)
+
+    def test_rollback_journal_blocks_readers(self):
+        # Для сравнения - старый режим: тот же сценарий заканчивается "database is locked"
+        handler = self.connections(journal_mode='DELETE', busy_timeout=300)
+        result = self.read_while_writing(handler, 'EXCLUSIVE')
+        self.assertIn('locked', result.get('error', ''))
+
+    def test_second_writer_waits_for_busy_timeout(self):
+        handler = self.connections(**settings.SQLITE_PRAGMAS)
+        writer = handler['production']
+        writer.cursor().execute('BEGIN IMMEDIATE')
+        errors = []
+
+        def write():
+            try:
+                with handler['production'].cursor() as cursor:
+                    cursor.execute('BEGIN IMMEDIATE')
+                    cursor.execute('INSERT INTO score VALUES (3)')
+                    cursor.execute('COMMIT')
+            except OperationalError as exc:
+                errors.append(exc)
+            finally:
+                handler['production'].close()
+
+        second = threading.Thread(target=write)
+        second.start()
+        time.sleep(0.2)
+        writer.cursor().execute('COMMIT')
+        second.join()
+        self.assertEqual(errors, [])
+
+
+@override_settings(DB_LOCK_RETRY_DELAY=0)
+class RetryOnLockTests(TransactionTestCase):
+    def test_transaction_is_retried_on_lock(self):
+        calls = []
+
+        def save():
+            calls.append(1)
+            Sport.objects.create(name=f'Спорт {len(calls)}', slug=f'sport-{len(calls)}')
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return 'ok'
+
+        with self.assertLogs('sports.db', 'WARNING'):
+            self.assertEqual(db.run_with_retry(save), 'ok')
+        # Первая попытка откатилась целиком
+        self.assertEqual(list(Sport.objects.values_list('slug', flat=True)), ['sport-2'])
+
+    def test_other_errors_are_not_retried(self):
+        def broken():
+            raise OperationalError('no such table: nothing')
+
+        with self.assertRaises(OperationalError):
+            db.run_with_retry(broken)
+
+
+@override_settings(READ_REPLICAS=['replica'], PAGE_CACHE_URL_NAMES=[])
+class ReplicaRouterTests(SportsDataMixin, TransactionTestCase):
+    # В тестах реплика - зеркало основной базы (второе соединение к той же базе в памяти),
+    # поэтому проверяем, через какое соединение идут запросы. TransactionTestCase - потому что
+    # открытая транзакция TestCase блокирует таблицы для второго соединения
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.setUpTestData()
+        self.user = User.objects.create_user('author', password='pass')
+
+    def queries_by_alias(self, client, url, method='get', **data):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = getattr(client, method)(url, data) if data else getattr(client, method)(url)
+        return response, len(primary), len(replica)
+
+    def lagging_replica(self, last_pk):
+        # Реплика отстает: статей новее last_pk в ней еще нет
+        def execute(execute, sql, params, many, context):
+            sql = sql.replace('FROM "sports_article"',
+                              f'FROM (SELECT * FROM "sports_article" WHERE "id" <= {last_pk}) AS "sports_article"')
+            return execute(sql, params, many, context)
+        return connections['replica'].execute_wrapper(execute)
+
+    def test_read_only_pages_read_from_replica(self):
+        self.create_match()
+        for name in ('home', 'article_list', 'tournament_list', 'stats'):
+            with self.subTest(name):
+                self.client.get(reverse(name))  # фрагменты и счетчики кэша заполняются из основной базы
+                response, primary, replica = self.queries_by_alias(self.client, reverse(name))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(primary, 0)
+                self.assertGreater(replica, 0)
+
+    def test_users_and_sessions_are_read_from_primary(self):
+        # Пользователя еще нет в реплике (ее обновляет cron) - он все равно должен остаться в системе
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(reverse('article_list'))
+        self.assertContains(response, self.user.username)
+        self.assertGreater(len(replica), 0)
+        for query in replica.captured_queries:
+            self.assertNotIn('auth_user', query['sql'])
+            self.assertNotIn('django_session', query['sql'])
+
+    def test_admin_and_forms_use_primary(self):
+        self.client.force_login(self.user)
+        _, _, replica = self.queries_by_alias(self.client, reverse('article_create'))
+        self.assertEqual(replica, 0)
+
+    def test_write_pins_session_to_primary(self):
+        self.client.force_login(self.user)
+        response, primary, replica = self.queries_by_alias(
+            self.client, reverse('article_create'), 'post',
+            title='Свежая новость', slug='fresh', content='Текст', is_published='on',
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+
+        # Сразу после записи автор читает из основной базы и видит свою статью
+        response, primary, replica = self.queries_by_alias(self.client, reverse('article_list'))
+        self.assertEqual(replica, 0)
+        self.assertContains(response, 'Свежая новость')
+
+        # Когда закрепление истекло - снова реплика
+        self.client.cookies[routers.PIN_COOKIE] = str(int(time.time()) - 1)
+        _, primary, replica = self.queries_by_alias(self.client, reverse('article_list'))
+        self.assertGreater(replica, 0)
+
+    def test_cache_is_not_filled_from_lagging_replica(self):
+        old = Article.objects.create(title='Старая новость', content='Текст')
+        with self.settings(PAGE_CACHE_URL_NAMES=['article_list']):
+            self.client.get(reverse('article_list'))
+            self.client.get(reverse('home'))
+            Article.objects.create(title='Свежая новость', content='Текст')
+            with self.lagging_replica(old.pk):
+                # Версии кэша уже сменились после коммита - новый рендер должен быть по основной базе
+                self.assertContains(self.client.get(reverse('article_list')), 'Свежая новость')
+                self.assertContains(self.client.get(reverse('home')), 'Свежая новость')
+        # Без кэша реплика по-прежнему отстает - проверка, что подмена работает
+        with self.lagging_replica(old.pk):
+            self.assertNotContains(self.client.get(reverse('article_list')), 'Свежая новость')
+
+    def test_without_replicas_everything_goes_to_primary(self):
+        with self.settings(READ_REPLICAS=[]):
+            _, primary, replica = self.queries_by_alias(self.client, reverse('home'))
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_replica_is_not_migrated(self):
+        router = routers.ReplicaRouter()
+        self.assertFalse(router.allow_migrate('replica', 'sports'))
+        self.assertIsNone(router.allow_migrate('default', 'sports'))
+
+
+class CopyDatabaseTests(SimpleTestCase):
+    def test_copy_is_consistent_snapshot(self):
+        import sqlite3
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        primary, replica = f'{directory.name}/db.sqlite3', f'{directory.name}/replica.sqlite3'
+        source = sqlite3.connect(primary)
+        source.execute('CREATE TABLE score (value INTEGER)')
+        source.execute('INSERT INTO score VALUES (1)')
+        source.commit()
+
+        routers.copy_database(primary, replica)
+        # Незакоммиченная запись в копию не попадает
+        source.execute('INSERT INTO score VALUES (2)')
+        routers.copy_database(primary, replica)
+        source.rollback()
+        source.close()
+
+        copy = sqlite3.connect(replica)
+        self.assertEqual(copy.execute('SELECT value FROM score').fetchall(), [(1,)])
+        copy.close()
+
+
+@override_settings(EXPORT_CHUNK_SIZE=10)
+class MatchPdfExportTests(SportsDataMixin, TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings_override = self.settings(EXPORT_DIR=directory.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.client.force_login(User.objects.create_superuser('admin-export', 'admin@example.com', 'pass'))
+
+    def export(self):
+        ids = list(Match.objects.values_list('pk', flat=True))
+        return self.client.post(reverse('admin:sports_match_changelist'),
+                                {'action': 'export_match_pdf', '_selected_action': ids})
+
+    def test_queries_do_not_grow_with_matches(self):
+        for _ in range(5):
+            self.create_match()
+        with CaptureQueriesContext(connection) as small:
+            response = self.export()
+        self.assertEqual(b''.join(response.streaming_content)[:4], b'%PDF')
+
+        for _ in range(40):
+            self.create_match()
+        with CaptureQueriesContext(connection) as large:
+            response = self.export()
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="report.pdf"')
+        self.assertEqual(len(large), len(small))
+
+    @override_settings(EXPORT_BACKGROUND_THRESHOLD=3)
+    def test_large_selection_is_built_in_background(self):
+        for _ in range(5):
+            self.create_match()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.export()
+        self.assertEqual(response.status_code, 302)
+        job = Job.objects.get(task='sports.exports.build_match_report')
+        name = job.kwargs['name']
+        # Пока воркер не взял задачу - 202 и автообновление
+        pending = self.client.get(reverse('export_file', args=[name]))
+        self.assertEqual(pending.status_code, 202)
+
+        self.assertEqual(jobs.work(burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress), ('done', 100))
+
+        message = str(next(iter(get_messages(response.wsgi_request))))
+        self.assertIn(reverse('export_file', args=[name]), message)
+        ready = self.client.get(reverse('export_file', args=[name]))
+        self.assertEqual(ready.status_code, 200)
+        self.assertEqual(b''.join(ready.streaming_content)[:4], b'%PDF')
+        self.assertEqual(self.client.get(reverse('export_file', args=['..db.sqlite3'])).status_code, 404)
+
+    def test_background_report_keeps_filter_not_ids(self):
+        for number in range(25):
+            self.create_match(status='finished' if number % 2 else 'scheduled',
+                              date_time=timezone.now() + timedelta(hours=number % 7))
+        finished = Match.objects.filter(status='finished')
+        where = exports.saved_filter(finished)
+        json.dumps(where)  # уходит в JSON задачи
+        self.assertEqual(where[1], ['finished'])  # условие, а не список id
+
+        job = Job.objects.create(task='sports.exports.build_match_report')
+        rows = list(exports.match_report_rows_keyset(job, exports.restore_filter(where)))
+        self.assertEqual([match.pk for match in rows],
+                         list(finished.order_by('date_time', 'pk').values_list('pk', flat=True)))
+        job.refresh_from_db()
+        self.assertEqual(job.progress, 100)
+
+    @override_settings(EXPORT_BACKGROUND_THRESHOLD=3)
+    def test_marker_appears_only_after_commit(self):
+        for _ in range(5):
+            self.create_match()
+        with self.captureOnCommitCallbacks() as callbacks:
+            name = exports.schedule_match_report(Match.objects.all())
+        # Транзакция еще не закоммичена (или откатится) - ни отметки, ни задачи
+        self.assertEqual(exports.export_status(name), (None, None))
+        self.assertFalse(Job.objects.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(exports.export_status(name)[0], 'pending')
+        self.assertTrue(Job.objects.exists())
+
+    @override_settings(EXPORT_BACKGROUND_THRESHOLD=3, JOB_MAX_ATTEMPTS=1)
+    def test_failed_report_shows_error(self):
+        for _ in range(5):
+            self.create_match()
+        with self.captureOnCommitCallbacks(execute=True):
+            name = exports.schedule_match_report(Match.objects.all())
+        with mock.patch('sports.exports.write_match_report', side_effect=OSError('disk full')), \
+                self.assertLogs('sports.jobs', 'ERROR'):
+            jobs.work(burst=True)
+        response = self.client.get(reverse('export_file', args=[name]))
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('disk full', response.content.decode())
+
+    def test_abandoned_report_is_marked_failed(self):
+        self.create_match()
+        with self.captureOnCommitCallbacks(execute=True):
+            name = exports.schedule_match_report(Match.objects.all())
+        # Воркер взял последнюю попытку и умер - от задачи больше нет пульса
+        Job.objects.update(status='running', attempts=F('max_attempts'), started_at=timezone.now() - timedelta(days=1))
+        with self.assertLogs('sports.jobs', 'ERROR'):
+            jobs.requeue_stale()
+        self.assertEqual(Job.objects.get().status, 'failed')
+        self.assertEqual(exports.export_status(name)[0], 'failed')
+        response = self.client.get(reverse('export_file', args=[name]))
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('JOB_TIMEOUT', response.content.decode())
+
+
+class PdfPageWriterTests(SimpleTestCase):
+    def test_pages_are_written_before_save(self):
+        class Row:
+            def __init__(self, number):
+                self.date_time = timezone.now()
+                self.home_team = self.away_team = mock.Mock()
+                self.home_team.name = f'Team (#{number})'
+                self.score_home = self.score_away = number
+
+        report = BytesIO()
+        writer = exports.PdfPageWriter(report)
+        writer.draw_string(50, 800, 'first page')
+        writer.show_page()
+        first = report.tell()
+        self.assertGreater(first, 0)
+        writer.draw_string(50, 800, 'second page')
+        writer.show_page()
+        self.assertGreater(report.tell(), first)
+
+        report = BytesIO()
+        exports.write_match_report((Row(number) for number in range(100)), report)
+        data = report.getvalue()
+        # 100 строк: 36 на первой странице (под заголовком), по 38 на следующих - 3 страницы
+        self.assertIn(b'/Type /Pages /Kids', data)
+        self.assertIn(b'/Count 3 >>', data)
+        # Таблица xref указывает точно на начала объектов
+        xref = int(data.rsplit(b'startxref\n', 1)[1].split(b'\n')[0])
+        entries = data[xref:].split(b'\n')[3:]
+        for number, entry in enumerate(entries[:10], start=1):
+            if not entry.endswith(b' n '):
+                break
+            offset = int(entry[:10])
+            self.assertTrue(data[offset:].startswith(b'%d 0 obj' % number))
+
+
+@override_settings(EXPORT_CHUNK_SIZE=3)
+class StreamingExportTests(SportsDataMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('analyst', password='pass')
+        self.athlete = Athlete.objects.create(first_name='Иван', last_name='Петров', sport=self.sport,
+                                              current_team=self.home)
+        for day in range(1, 8):
+            match = self.create_match(date_time=timezone.now() - timedelta(days=day), status='finished',
+                                      score_home=day, score_away=0)
+            MatchParticipation.objects.create(match=match, athlete=self.athlete, goals_scored=day)
+
+    def download(self, *args, **params):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('export_data', args=args), params)
+            chunks = list(response.streaming_content)
+        return response, chunks, queries
+
+    def test_csv_streams_joined_names_in_chunks(self):
+        response, chunks, queries = self.download('matches', 'csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="matches.csv"')
+        lines = b''.join(chunks).decode().splitlines()
+        self.assertEqual(lines[0], 'id,date_time,sport,tournament,home_team,away_team,score_home,score_away,status')
+        self.assertEqual(len(lines), 8)
+        self.assertIn(',Футбол,Кубок,Спартак,Динамо,', lines[1])
+        # 7 строк пачками по 3 - три куска, но один запрос к матчам (плюс сессия и пользователь)
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(len(queries), 3)
+
+    def test_ndjson_participations_with_filters(self):
+        date_from = (timezone.now() - timedelta(days=3)).date().isoformat()
+        _, chunks, _ = self.download('participations', 'ndjson', tournament='cup', date_from=date_from)
+        rows = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        self.assertEqual({row['goals_scored'] for row in rows}, {1, 2, 3})
+        self.assertEqual(rows[0]['last_name'], 'Петров')
+        self.assertEqual(rows[0]['team'], 'Спартак')
+
+    def test_bad_requests(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('export_data', args=['matches', 'xml'])).status_code, 404)
+        response = self.client.get(reverse('export_data', args=['matches', 'csv']), {'date_to': '2024-02-30'})
+        self.assertEqual(response.status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('export_data', args=['matches', 'csv'])).status_code, 302)
+
+    def test_admin_action_streams_selected_rows(self):
+        self.client.force_login(User.objects.create_superuser('admin-csv', 'admin@example.com', 'pass'))
+        ids = list(MatchParticipation.objects.values_list('pk', flat=True)[:2])
+        response = self.client.post(reverse('admin:sports_matchparticipation_changelist'),
+                                    {'action': 'export_participations_csv', '_selected_action': ids})
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(b''.join(response.streaming_content).decode().splitlines()), 3)
+
+
+class AdminChangelistTests(TestCase):
+    CHANGELISTS = ('match', 'matchparticipation', 'athlete', 'article', 'tournament')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('admin-list', 'admin@example.com', 'pass'))
+
+    def changelist_queries(self, **params):
+        counts = {}
+        for name in self.CHANGELISTS:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(f'admin:sports_{name}_changelist'), params)
+            self.assertEqual(response.status_code, 200)
+            counts[name] = len(queries)
+        return counts
+
+    def test_queries_do_not_grow_with_rows(self):
+        DataGenerator(seed=5, batch_size=500).generate(SMALL_DATA)
+        small = self.changelist_queries()
+        DataGenerator(seed=6, batch_size=500).generate(EXTRA_DATA)
+        self.assertEqual(self.changelist_queries(), small)
+        for name, count in small.items():
+            self.assertLessEqual(count, 8, name)
+
+    def test_prefix_search_uses_index(self):
+        DataGenerator(seed=5, batch_size=500).generate(SMALL_DATA)
+        athlete = Athlete.objects.first()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:sports_athlete_changelist'), {'q': athlete.last_name[:3]})
+        self.assertContains(response, athlete.last_name)
+        search = [query['sql'] for query in queries.captured_queries if 'LIKE' in query['sql']]
+        self.assertTrue(search)
+        for sql in search:
+            self.assertEqual(scanned_tables(sql), [], sql)
+
+    def test_rowid_walk_is_bounded_only_without_where(self):
+        # Полный список админки: ORDER BY id DESC LIMIT - проход по rowid останавливается через LIMIT строк
+        sql = 'SELECT "sports_athlete"."id" FROM "sports_athlete" ORDER BY "sports_athlete"."id" DESC LIMIT 10'
+        self.assertEqual(scanned_tables(sql), [])
+        # Фильтр по неиндексированной колонке: подходящих строк может быть меньше LIMIT - читается вся таблица
+        filtered = ('SELECT "sports_athlete"."id" FROM "sports_athlete" WHERE "sports_athlete"."position" = \'x\' '
+                    'ORDER BY "sports_athlete"."id" DESC LIMIT 10')
+        self.assertEqual(scanned_tables(filtered), ['sports_athlete'])
+        self.assertEqual(scanned_tables('SELECT id FROM sports_athlete WHERE position = \'x\' LIMIT 10'),
+                         ['sports_athlete'])
+
+    @override_settings(ADMIN_COUNT_CAP=5)
+    def test_count_is_capped(self):
+        DataGenerator(seed=5, batch_size=500).generate(SMALL_DATA)
+        matches = Match.objects.order_by('-pk')
+        total = matches.count()
+        # С фильтром - оценка по плотности id; страницы за пределом доступны
+        paginator = CappedCountPaginator(matches.filter(pk__gt=0), 2)
+        self.assertEqual(paginator.count, total)  # id идут подряд - оценка точная
+        self.assertTrue(paginator.count_is_estimate)
+        self.assertEqual(len(paginator.page(paginator.num_pages).object_list), 2 - total % 2)
+        # Без фильтров - оценка по максимальному id
+        self.assertEqual(CappedCountPaginator(matches, 2).count, Match.objects.latest('pk').pk)
+        finished = matches.filter(status='finished')
+        self.assertLessEqual(finished.count(), 5)
+        paginator = CappedCountPaginator(finished, 2)
+        self.assertEqual(paginator.count, finished.count())
+        self.assertFalse(paginator.count_is_estimate)
+
+        response = self.client.get(reverse('admin:sports_match_changelist'))
+        self.assertContains(response, f'≈ {Match.objects.latest("pk").pk}')
+
+
+def flaky_task(job, fail_times=0, total=4):
+    # Задача для тестов очереди: падает первые fail_times попыток, отмечает прогресс
+    for done in range(1, total + 1):
+        jobs.job_progress(job, done, total)
+    if job.attempts <= fail_times:
+        raise RuntimeError(f'сбой на попытке {job.attempts}')
+    Sport.objects.create(name=f'Из задачи {job.pk}', slug=f'job-{job.pk}')
+
+
+@override_settings(JOB_RETRY_DELAY=0)
+class JobTests(TestCase):
+    def enqueue(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.enqueue('sports.tests.flaky_task', **kwargs)
+        return Job.objects.latest('pk')
+
+    def test_enqueue_waits_for_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            jobs.enqueue('sports.tests.flaky_task')
+        self.assertFalse(Job.objects.exists())
+        callbacks[0]()
+        self.assertEqual(Job.objects.get().status, 'queued')
+
+    def test_job_runs_with_progress(self):
+        job = self.enqueue(total=4)
+        self.assertEqual(jobs.work(burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress, job.attempts), ('done', 100, 1))
+        self.assertTrue(Sport.objects.filter(slug=f'job-{job.pk}').exists())
+
+    def test_failed_job_is_retried_then_marked_failed(self):
+        job = self.enqueue(fail_times=1)
+        with self.assertLogs('sports.jobs', 'WARNING'):
+            jobs.work(burst=True)  # вторая попытка уже успешна
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('done', 2))
+
+        job = self.enqueue(fail_times=5, max_attempts=2)
+        with self.assertLogs('sports.jobs', 'WARNING'):
+            jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertIn('сбой на попытке 2', job.error)
+
+    def test_retry_waits_for_run_after(self):
+        job = self.enqueue(fail_times=1)
+        with override_settings(JOB_RETRY_DELAY=60), self.assertLogs('sports.jobs', 'WARNING'):
+            self.assertEqual(jobs.work(burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertGreater(job.run_after, timezone.now())
+
+    def test_stale_running_job_is_requeued(self):
+        job = self.enqueue()
+        Job.objects.filter(pk=job.pk).update(status='running', attempts=1,
+                                             started_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, 'queued')
+
+    def test_worker_requeues_stale_jobs_while_running(self):
+        job = self.enqueue()
+        Job.objects.filter(pk=job.pk).update(status='running', attempts=1,
+                                             started_at=timezone.now() - timedelta(days=1))
+        # Пул не перезапускали - воркер сам подбирает брошенную задачу
+        self.assertEqual(jobs.work(burst=True), 1)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, 'done')
+
+    def test_progress_is_a_heartbeat(self):
+        job = self.enqueue()
+        Job.objects.filter(pk=job.pk).update(status='running', attempts=1,
+                                             started_at=timezone.now() - timedelta(days=1))
+        jobs.job_progress(Job.objects.get(pk=job.pk), 1, 10)
+        # Живая долгая задача не уходит второй раз в очередь
+        self.assertEqual(jobs.requeue_stale(), 0)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, 'running')
+
+
+class RunWorkersCommandTests(TransactionTestCase):
+    # Воркер - отдельный поток со своим соединением, поэтому данные должны быть закоммичены
+    def test_burst_runs_queue_until_empty(self):
+        for _ in range(3):
+            jobs.enqueue('sports.tests.flaky_task')
+        out = StringIO()
+        call_command('run_workers', threads=1, burst=True, stdout=out)
+        self.assertIn('Выполнено задач: 3', out.getvalue())
+        self.assertEqual(set(Job.objects.values_list('status', flat=True)), {'done'})
+
+
+def image_file(name='photo.png', size=(1600, 900), mode='RGBA'):
+    data = BytesIO()
+    Image.new(mode, size, (200, 30, 30, 128) if mode == 'RGBA' else 'red').save(data, 'PNG')
+    return SimpleUploadedFile(name, data.getvalue(), content_type='image/png')
+
+
+@override_settings(PAGE_CACHE_URL_NAMES=[])
+class ImageRenditionsTests(SportsDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def create_article(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            article = Article.objects.create(title='С картинкой', content='Текст', is_published=True,
+                                             preview_image=image_file(), **kwargs)
+        jobs.work(burst=True)
+        article.refresh_from_db()
+        return article
+
+    def test_upload_builds_renditions_in_background(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            article = Article.objects.create(title='С картинкой', content='Текст', preview_image=image_file())
+        # В самом запросе ничего не режется - только задача в очереди
+        self.assertEqual(Article.objects.get(pk=article.pk).renditions, {})
+        job = Job.objects.get(task='sports.renditions.build_renditions')
+        self.assertEqual(job.kwargs, {'model': 'sports.article', 'pk': article.pk})
+
+        jobs.work(burst=True)
+        article.refresh_from_db()
+        self.assertEqual(article.renditions['source'], article.preview_image.name)
+        sizes = {name: (article.renditions[name]['width'], article.renditions[name]['height'])
+                 for name in ('thumb', 'card', 'hero')}
+        self.assertEqual(sizes, {'thumb': (80, 80), 'card': (480, 270), 'hero': (1200, 675)})
+        for ext, image_format in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+            path = article.renditions['card'][ext]
+            self.assertTrue(path.startswith('articles/renditions/'))
+            with default_storage.open(path) as f, Image.open(f) as picture:
+                self.assertEqual((picture.format, picture.size), (image_format, (480, 270)))
+
+    def test_unchanged_image_is_not_rebuilt(self):
+        article = self.create_article()
+        with self.captureOnCommitCallbacks(execute=True):
+            article.title = 'Новый заголовок'
+            article.save()
+        self.assertEqual(Job.objects.filter(status='queued').count(), 0)
+
+    def test_replaced_image_removes_old_renditions(self):
+        article = self.create_article()
+        old_path = article.renditions['hero']['webp']
+        with self.captureOnCommitCallbacks(execute=True):
+            article.preview_image = image_file('other.png', size=(600, 600), mode='RGB')
+            article.save()
+        jobs.work(burst=True)
+        article.refresh_from_db()
+        self.assertFalse(default_storage.exists(old_path))
+        # Картинка меньше hero - не увеличиваем
+        self.assertEqual(article.renditions['hero']['width'], 600)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            article.preview_image = None
+            article.save()
+        jobs.work(burst=True)
+        article.refresh_from_db()
+        self.assertEqual(article.renditions, {})
+
+    def test_picture_tag(self):
+        article = self.create_article()
+        html = Template("{% load sports_tags %}{% picture article 'hero' alt='Фото' %}").render(
+            Context({'article': article}))
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn(f"{default_storage.url(article.renditions['card']['webp'])} 480w", html)
+        self.assertIn('width="1200" height="675"', html)
+        self.assertIn(default_storage.url(article.renditions['hero']['jpeg']), html)
+
+        # Пока копий нет - обычный img с оригиналом
+        Article.objects.filter(pk=article.pk).update(renditions={})
+        article.refresh_from_db()
+        html = Template("{% load sports_tags %}{% picture article 'hero' %}").render(Context({'article': article}))
+        self.assertNotIn('<picture>', html)
+        self.assertIn(article.preview_image.url, html)
+
+    def test_article_page_shows_hero_rendition(self):
+        article = self.create_article()
+        response = self.client.get(article.get_absolute_url())
+        self.assertContains(response, article.renditions['hero']['webp'])
+
+    def test_sport_icon_rendition_resets_tournament_widget(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sport.icon = image_file('ball.png', size=(300, 200))
+            self.sport.save()
+        version = fragment_cache.get_version(fragment_cache.ACTIVE_TOURNAMENTS)
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.work(burst=True)
+        self.sport.refresh_from_db()
+        self.assertEqual(sorted(self.sport.renditions), ['source', 'thumb'])
+        self.assertNotEqual(fragment_cache.get_version(fragment_cache.ACTIVE_TOURNAMENTS), version)
+
+    def test_build_renditions_command(self):
+        article = self.create_article()
+        Article.objects.filter(pk=article.pk).update(renditions={})
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('build_renditions', stdout=out)
+        self.assertIn('Задач поставлено: 1', out.getvalue())
+        jobs.work(burst=True)
+        article.refresh_from_db()
+        self.assertIn('hero', article.renditions)
+
+
+@override_settings(PAGE_CACHE_URL_NAMES=[])
+class RelatedNewsTests(SportsDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.match = self.create_match()
+        self.tag, self.other_tag = Tag.objects.create(name='Кубок', slug='cup'), Tag.objects.create(name='Трансфер', slug='transfer')
+
+    @contextmanager
+    def committed(self):
+        # Пересчет идет задачей в очереди: коммит, потом воркер
+        with self.captureOnCommitCallbacks(execute=True):
+            yield
+        jobs.work(burst=True)
+
+    def article(self, title, days_ago=0, tags=(), teams=(), **kwargs):
+        with self.committed():
+            article = Article.objects.create(title=title, content='Текст',
+                                             created_at=timezone.now() - timedelta(days=days_ago), **kwargs)
+            article.tags.set(tags)
+            article.related_teams.set(teams)
+        return article
+
+    def test_ranked_by_shared_relations(self):
+        main = self.article('Главная', tags=[self.tag, self.other_tag], teams=[self.home], match=self.match)
+        by_tag = self.article('Тег', tags=[self.tag])
+        by_team = self.article('Команда', teams=[self.home])
+        by_match = self.article('Матч', match=self.match)
+        self.article('Черновик', tags=[self.tag, self.other_tag], is_published=False)
+        self.article('Чужая', tags=[Tag.objects.create(name='Другое', slug='other')])
+
+        self.assertEqual(related.related_articles(main), [by_match, by_team, by_tag])
+        # Список поддерживается с обеих сторон: новая статья попала и к старой
+        self.assertEqual(related.related_articles(by_tag), [main])
+
+    def test_recency_outweighs_old_overlap(self):
+        main = self.article('Главная', tags=[self.tag, self.other_tag])
+        # 2 общих тега, но три периода полураспада назад: 2 * 1/8 < 1
+        old = self.article('Старая', days_ago=90, tags=[self.tag, self.other_tag])
+        fresh = self.article('Свежая', tags=[self.tag])
+        self.assertEqual(related.related_articles(main), [fresh, old])
+
+    def test_relations_change_updates_both_sides(self):
+        main = self.article('Главная', tags=[self.tag])
+        other = self.article('Другая', tags=[self.tag])
+        stamp = Article.objects.get(pk=other.pk).updated_at
+
+        with self.committed():
+            self.tag.tags.remove(main)  # обратная сторона M2M, как из админки тега
+        self.assertEqual(related.related_articles(main), [])
+        self.assertEqual(related.related_articles(other), [])
+        self.assertGreater(Article.objects.get(pk=other.pk).updated_at, stamp)
+
+        with self.committed():
+            main.related_teams.add(self.home)
+            other.related_teams.add(self.home)
+        self.assertEqual(related.related_articles(other), [main])
+
+    def test_unpublished_article_leaves_neighbours(self):
+        main = self.article('Главная', tags=[self.tag])
+        other = self.article('Другая', tags=[self.tag])
+        with self.committed():
+            other.is_published = False
+            other.save()
+        self.assertFalse(RelatedArticle.objects.filter(related=other).exists())
+        # Свой список у черновика остается (предпросмотр)
+        self.assertEqual(related.related_articles(other), [main])
+
+    def test_form_save_refreshes_once(self):
+        self.article('Другая', tags=[self.tag], teams=[self.home])
+        form = ArticleForm(data={'title': 'Новая', 'content': 'Текст', 'tags': [self.tag.pk],
+                                 'related_teams': [self.home.pk]})
+        self.assertTrue(form.is_valid(), form.errors)
+        with mock.patch('sports.related.refresh', wraps=related.refresh) as refresh, self.committed():
+            article = form.save()
+        refresh.assert_called_once()
+        self.assertEqual(Job.objects.filter(task='sports.related.refresh_job').latest('pk').kwargs, {'ids': [article.pk]})
+        self.assertEqual(RelatedArticle.objects.get(article=article).weight, 3)  # тег + команда
+
+    def test_save_does_not_wait_for_refresh(self):
+        other = self.article('Другая', tags=[self.tag])
+        with self.captureOnCommitCallbacks(execute=True):
+            main = Article.objects.create(title='Главная', content='Текст')
+            main.tags.add(self.tag)
+        self.assertEqual(related.related_articles(main), [])
+        self.assertTrue(Job.objects.filter(task='sports.related.refresh_job', status='queued').exists())
+        jobs.work(burst=True)
+        self.assertEqual(related.related_articles(other), [main])
+
+    def test_neighbour_rename_touches_holders(self):
+        main = self.article('Главная', tags=[self.tag])
+        other = self.article('Похожая новость', tags=[self.tag])
+        etag = self.client.get(main.get_absolute_url())['ETag']
+        with self.committed():
+            other.title = 'Новый заголовок'
+            other.save()
+        response = self.client.get(main.get_absolute_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Новый заголовок')
+
+    def test_popular_relation_is_ignored(self):
+        with mock.patch.object(related, 'MAX_SHARED', 2):
+            self.article('Тег', tags=[self.tag])
+            self.article('Еще тег', tags=[self.tag])
+            other = self.article('Второй тег', tags=[self.other_tag])
+            # С главной у тега self.tag три статьи - связь через него не считается
+            main = self.article('Главная', tags=[self.tag, self.other_tag])
+            self.assertEqual(set(RelatedArticle.objects.filter(article=main).values_list('related_id', flat=True)),
+                             {other.pk})
+
+    def test_lists_are_trimmed(self):
+        with mock.patch.object(related, 'KEEP', 2):
+            neighbours = [self.article(f'Сосед {number}', days_ago=10 - number, tags=[self.tag]) for number in range(3)]
+            main = self.article('Главная', tags=[self.tag])
+            self.assertEqual(RelatedArticle.objects.filter(article=main).count(), 2)
+            for neighbour in neighbours:
+                self.assertLessEqual(RelatedArticle.objects.filter(article=neighbour).count(), 2)
+                self.assertEqual(related.related_articles(neighbour)[0], main)
+
+    def test_rebuild_matches_incremental(self):
+        self.article('Главная', tags=[self.tag, self.other_tag], teams=[self.home], match=self.match)
+        self.article('Тег', days_ago=5, tags=[self.tag])
+        self.article('Команда', teams=[self.home, self.away])
+        self.article('Матч', days_ago=40, match=self.match, tags=[self.other_tag])
+
+        def snapshot():
+            return set(RelatedArticle.objects.values_list('article_id', 'related_id', 'weight'))
+
+        incremental = snapshot()
+        out = StringIO()
+        call_command('rebuild_related', stdout=out)
+        self.assertEqual(snapshot(), incremental)
+        self.assertIn(f'строк: {len(incremental)}', out.getvalue())
+
+    def test_article_page_shows_related(self):
+        main = self.article('Главная', tags=[self.tag])
+        other = self.article('Похожая новость', tags=[self.tag])
+        response = self.client.get(main.get_absolute_url())
+        self.assertContains(response, 'Похожие новости')
+        self.assertContains(response, other.get_absolute_url())
@@ -1,16 +1,33 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseForbidden
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (FileResponse, Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden,
+                         StreamingHttpResponse)
 from django.shortcuts import render
 
 # Create your views here.
 
+from datetime import datetime, timedelta
+
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.db.models import Sum, Q
+from django.db.models import F
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import condition
 
+from . import exports, leaderboards, live, metrics, page_cache, profiling, related
+from .cache import get_total_home_goals
+from .db import retry_on_lock
 from .forms import ArticleForm
-from .models import Article, Match, Team, Tournament
+from .models import Article, Match, MatchParticipation, Sport, Team, Tournament
+from .page_cache import tag_response
+from .pagination import cursor_paginate
+from .search import search_articles
 from django.contrib.auth import logout
 from django.contrib.auth import login
 from django.contrib.auth.forms import UserCreationForm
@@ -18,34 +35,59 @@ from django.contrib.auth.forms import UserCreationForm
 
 
 def home(request):
+    tag_response(request, page_cache.MATCHES, page_cache.ARTICLES, page_cache.TOURNAMENTS)
+
     # Задание filter() и __
-    # Ищем матчи, дата которых больше или равна (gte) текущему времени
-    upcoming_matches = Match.objects.filter(date_time__date__gte=timezone.now().date())
+    # Ищем матчи с начала сегодняшнего дня. Сравниваем само поле date_time, а не date_time__date:
+    # преобразование __date не дает использовать индекс.
+    # Окно ограничено HOME_MATCH_WINDOW_DAYS днями, остальное - по ссылке "Показать еще"
+    today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    window_end = today + timedelta(days=settings.HOME_MATCH_WINDOW_DAYS)
+    upcoming_matches = Match.objects.filter(date_time__gte=today, date_time__lt=window_end)
 
     # Задание exclude()
     # Исключаем отмененные матчи (предположим, такой статус есть)
     upcoming_matches = upcoming_matches.exclude(status='canceled')
 
+    # Турнир и команды нужны в шаблоне для каждого матча - берем их тем же запросом
+    upcoming_matches = upcoming_matches.select_related('tournament', 'home_team', 'away_team')
+
     # Задание order_by()
-    # Принудительная сортировка от старых к новым
-    upcoming_matches = upcoming_matches.order_by('date_time')
+    # Принудительная сортировка от старых к новым (ключ курсора "Показать еще")
+    matches = cursor_paginate(upcoming_matches, ('date_time', 'id'), request.GET.get('cursor'),
+                              per_page=settings.HOME_MATCHES_PER_PAGE)
 
     # Задание функция агрегирования
-    # Посчитаем общее количество голов, забитых хозяевами во всех матчах
-    total_goals = Match.objects.aggregate(Sum('score_home'))
+    # Общее количество голов, забитых хозяевами во всех матчах.
+    # Считается не агрегатом по всей таблице, а счетчиком в кэше, который обновляется при сохранении Match
+    total_goals = {'score_home__sum': get_total_home_goals()}
 
     return render(request, 'sports/home.html', {
-        'matches': upcoming_matches,
+        'matches': matches,
+        'window_end': window_end,
         'total_goals': total_goals,
     })
 
 
+# Порядок keyset-пагинации, последним - уникальный id
+ARTICLE_ORDERING = ('-created_at', '-id')
+TOURNAMENT_ORDERING = ('-is_active', 'sport__name', 'name', 'id')
+
+
 def article_list(request):
+    tag_response(request, page_cache.ARTICLES)
+
     # Используем наш кастомный менеджер (.published)
-    object_list = Article.published.all()
+    # Полный текст в списке не нужен - карточке хватает готового excerpt
+    object_list = Article.published.defer('content', 'content_html')
+
+    # Без ?page= работает keyset-пагинация по курсору: без COUNT(*) и OFFSET
+    if 'page' not in request.GET:
+        posts = cursor_paginate(object_list, ARTICLE_ORDERING, request.GET.get('cursor'), per_page=5)
+        return render(request, 'sports/article_list.html', {'posts': posts})
 
     # Задание Пагинация (+ try, except)
-    paginator = Paginator(object_list, 5)  # 5 статей на странице
+    paginator = Paginator(object_list.order_by(*ARTICLE_ORDERING), 5)  # 5 статей на странице
     page = request.GET.get('page')
 
     try:
@@ -60,13 +102,137 @@ def article_list(request):
     return render(request, 'sports/article_list.html', {'posts': posts})
 
 
+async def live_scores(request):
+    """
+    Server-Sent Events со счетом live-матчей. Работает только под ASGI (lab7.asgi):
+    соединение держится открытым, события приходят из брокера sports.live.
+    """
+    if not isinstance(request, ASGIRequest):
+        # Под WSGI бесконечный поток занял бы поток сервера навсегда
+        return HttpResponse('Live scores require an ASGI server', status=501, content_type='text/plain')
+
+    broker = live.get_broker()
+
+    async def stream():
+        # Подписываемся до снимка, чтобы не потерять события между ними
+        queue = broker.subscribe()
+        try:
+            yield f'retry: {live.KEEPALIVE_SECONDS * 1000}\n\n'
+            for event in await sync_to_async(live.live_match_events)():
+                yield live.format_sse(event)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=live.KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield live.format_sse(event)
+        finally:
+            broker.unsubscribe(queue)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx не должен буферизовать поток
+    return response
+
+
+def metrics_view(request):
+    # Метрики для Prometheus. Только для мониторинга: сервер Prometheus с токеном или сотрудники
+    if not metrics.has_token(request) and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@staff_member_required
+def profile_list(request):
+    # Самые дорогие из последних профилей (sports.profiling)
+    return render(request, 'admin/profiles.html', {
+        'title': 'Профили запросов',
+        'profiles': profiling.recent_profiles(),
+        'directory': profiling.profiles_dir(),
+    })
+
+
+@staff_member_required
+def profile_file(request, name):
+    path = profiling.profile_path(name)
+    if path is None:
+        raise Http404
+    if name.endswith('.txt'):
+        return FileResponse(open(path, 'rb'), content_type='text/plain; charset=utf-8')
+    return FileResponse(open(path, 'rb'), as_attachment=True)
+
+
+@staff_member_required
+def export_file(request, name):
+    # Отчет из фоновой выгрузки (sports.exports)
+    status, path = exports.export_status(name)
+    if status == 'pending':
+        return HttpResponse('Отчет еще готовится, страница обновится сама.', status=202,
+                            content_type='text/plain; charset=utf-8', headers={'Refresh': '5'})
+    if status == 'failed':
+        with open(path, encoding='utf-8') as f:
+            error = f.read()
+        return HttpResponse(f'Не удалось построить отчет: {error}', status=500,
+                            content_type='text/plain; charset=utf-8')
+    if status is None:
+        raise Http404
+    return FileResponse(open(path, 'rb'), as_attachment=True)
+
+
+EXPORT_DATASETS = {
+    # набор: (менеджер, колонки, путь от строки к матчу для фильтров)
+    'matches': (Match.objects, exports.MATCH_COLUMNS, ''),
+    'participations': (MatchParticipation.objects, exports.PARTICIPATION_COLUMNS, 'match__'),
+}
+
+
+@login_required
+def export_data(request, dataset, fmt):
+    # Потоковая выгрузка для аналитиков: /export/matches.csv?tournament=<slug>&date_from=2024-01-01
+    if dataset not in EXPORT_DATASETS or fmt not in exports.CONTENT_TYPES:
+        raise Http404
+    manager, columns, prefix = EXPORT_DATASETS[dataset]
+    filters = {}
+    for param, lookup in (('tournament', 'tournament__slug'), ('sport', 'tournament__sport__slug'),
+                          ('status', 'status')):
+        if request.GET.get(param):
+            filters[prefix + lookup] = request.GET[param]
+    # Границы дат переводим в моменты времени: сравнение с date_time__date не дает использовать индекс
+    for param, lookup, days in (('date_from', 'date_time__gte', 0), ('date_to', 'date_time__lt', 1)):
+        if request.GET.get(param):
+            try:
+                value = parse_date(request.GET[param])
+            except ValueError:  # формат верный, но даты не существует (2024-02-30)
+                value = None
+            if value is None:
+                return HttpResponseBadRequest(f'{param}: ожидается дата ГГГГ-ММ-ДД')
+            moment = datetime.combine(value + timedelta(days=days), datetime.min.time())
+            filters[prefix + lookup] = timezone.make_aware(moment)
+    return exports.streaming_export(manager.filter(**filters), columns, fmt, dataset)
+
+
+def article_search(request):
+    query = request.GET.get('q', '').strip()
+    # Поиск по FTS5-индексу, только опубликованные статьи
+    results = search_articles(query) if query else []
+
+    return render(request, 'sports/search.html', {'query': query, 'results': results})
+
+
 def tournament_list(request):
+    tag_response(request, page_cache.TOURNAMENTS)
+
     # Берем все турниры, сортируем сначала по виду спорта, потом по названию
     # select_related('sport') загружает данные о спорте сразу (для иконок)
     object_list = Tournament.objects.select_related('sport').all().order_by('-is_active', 'sport__name', 'name')
 
+    if 'page' not in request.GET:
+        tournaments = cursor_paginate(object_list, TOURNAMENT_ORDERING, request.GET.get('cursor'), per_page=9)
+        return render(request, 'sports/tournament_list.html', {'tournaments': tournaments})
+
     # Пагинация (например, по 9 штук на страницу, чтобы была сетка 3x3)
-    paginator = Paginator(object_list, 9)
+    paginator = Paginator(object_list.order_by(*TOURNAMENT_ORDERING), 9)
     page = request.GET.get('page')
 
     try:
@@ -78,10 +244,92 @@ def tournament_list(request):
 
     return render(request, 'sports/tournament_list.html', {'tournaments': tournaments})
 
+def tournament_standings(request, slug):
+    tournament = get_object_or_404(Tournament.objects.select_related('sport'), slug=slug)
+
+    # Таблица материализована (TournamentStanding), здесь только чтение готовых строк
+    standings = tournament.standings.select_related('team').order_by(
+        '-points', F('goals_against') - F('goals_for'), '-goals_for', 'team__name'
+    )
+
+    return render(request, 'sports/standings.html', {
+        'tournament': tournament,
+        'standings': standings,
+    })
+
+def _leaderboard_by(request):
+    by = request.GET.get('by', 'goals')
+    return by if by in leaderboards.LEADERBOARDS else 'goals'
+
+
+def tournament_leaders(request, slug):
+    tournament = get_object_or_404(Tournament.objects.select_related('sport'), slug=slug)
+    by = _leaderboard_by(request)
+
+    return render(request, 'sports/leaderboard.html', {
+        'title': tournament.name,
+        'subtitle': tournament.sport.name,
+        'by': by,
+        'leaders': leaderboards.tournament_leaders(tournament, by),
+    })
+
+
+def sport_leaders(request, slug):
+    sport = get_object_or_404(Sport, slug=slug)
+    by = _leaderboard_by(request)
+
+    return render(request, 'sports/leaderboard.html', {
+        'title': sport.name,
+        'subtitle': 'Все турниры',
+        'by': by,
+        'leaders': leaderboards.sport_leaders(sport, by),
+    })
+
+def _article_stamp(request, slug):
+    # (pk, updated_at) статьи - один легкий запрос на оба условия condition()
+    if not hasattr(request, '_article_stamp'):
+        request._article_stamp = Article.objects.filter(slug=slug).values_list('pk', 'updated_at').first()
+    return request._article_stamp
+
+
+def _article_etag(request, slug):
+    stamp = _article_stamp(request, slug)
+    if stamp is None:
+        return None
+    pk, updated_at = stamp
+    # Авторизованным показываем блок управления, поэтому ETag зависит и от пользователя
+    user_id = request.user.pk if request.user.is_authenticated else 0
+    return f'article-{pk}-{updated_at.timestamp():.6f}-{user_id}'
+
+
+def _article_last_modified(request, slug):
+    # Last-Modified не различает пользователей - отдаем его только анонимам
+    stamp = _article_stamp(request, slug)
+    if stamp is None or request.user.is_authenticated:
+        return None
+    return stamp[1]
+
+
+# updated_at меняется и при изменении связанных объектов (см. signals.py),
+# поэтому повторный запрос с If-None-Match / If-Modified-Since получает 304 без рендера шаблона
+@condition(etag_func=_article_etag, last_modified_func=_article_last_modified)
 def article_detail(request, slug):
+    stamp = _article_stamp(request, slug)
+    if stamp is not None:
+        tag_response(request, page_cache.article_tag(stamp[0]))
+
     # Задание get_object_or_404
-    article = get_object_or_404(Article, slug=slug)
-    return render(request, 'sports/article_detail.html', {'article': article})
+    # Автор, матч с командами и все M2M-связи загружаются заранее, шаблон больше не ходит в БД
+    # Текст статьи выводится готовым content_html, исходный content не читаем
+    articles = Article.objects.select_related('author', 'match__home_team', 'match__away_team').prefetch_related(
+        'related_teams', 'related_athletes', 'tags'
+    ).defer('content')
+    article = get_object_or_404(articles, slug=slug)
+    # Похожие новости - заранее посчитанный список, один запрос
+    return render(request, 'sports/article_detail.html', {
+        'article': article,
+        'related_news': related.related_articles(article),
+    })
 
 
 def team_detail(request, pk):
@@ -96,6 +344,7 @@ def team_detail(request, pk):
 # Задание Регистрация пользователя
 
 
+@retry_on_lock
 def register(request):
     if request.method == 'POST':
         form = UserCreationForm(request.POST)
@@ -119,7 +368,9 @@ def stats_view(request):
 
     # values_list() возвращает плоский список
     # ['Live', 'Finished']
-    statuses = Match.objects.values_list('status', flat=True).distinct()
+    # order_by обязателен: иначе сортировка модели (-date_time) попадает в DISTINCT и статусы
+    # повторяются; по status запрос идет по индексу (status, date_time) без сортировки
+    statuses = Match.objects.values_list('status', flat=True).order_by('status').distinct()
 
     return render(request, 'sports/stats.html', {
         'teams_data': teams_data,
@@ -128,6 +379,7 @@ def stats_view(request):
 
 # создание/изменение/удаление (CRUD)
 @login_required
+@retry_on_lock
 def article_create(request):
     if request.method == 'POST':
         form = ArticleForm(request.POST, request.FILES)
@@ -144,6 +396,7 @@ def article_create(request):
 
 
 @login_required
+@retry_on_lock
 def article_update(request, pk):
     article = get_object_or_404(Article, pk=pk)
 
@@ -163,6 +416,7 @@ def article_update(request, pk):
 
 
 @login_required
+@retry_on_lock
 def article_delete(request, pk):
     article = get_object_or_404(Article, pk=pk)
 